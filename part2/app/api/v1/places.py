@@ -5,7 +5,7 @@ Places' API.
 """
 
 
-from flask_restx import fields, Namespace, Resource
+from flask_restx import fields, inputs, Namespace, Resource, reqparse
 from app.services.facade import HBnBFacade
 
 
@@ -22,6 +22,12 @@ place_model = api.model('Place', {
     'amenities': fields.List(fields.String, required=False, description="List of amenities ID's")
 })
 
+search_parser = reqparse.RequestParser()
+search_parser.add_argument('q', type=str, location='args', required=True, help='Words to look for')
+search_parser.add_argument('reviews', type=inputs.boolean, location='args', default=False,
+                           help='Also match the text of the reviews')
+search_parser.add_argument('limit', type=int, location='args', default=50, help='Maximum number of places')
+
 
 @api.route("/")
 class PlaceList(Resource):
@@ -73,6 +79,33 @@ class PlaceList(Resource):
             "longitude": i.longitude,
         } for i in facade.get_all_places()], 200
 
+@api.route("/search")
+class PlaceSearch(Resource):
+
+    """
+    Full-text search over places
+    """
+
+    @api.expect(search_parser)
+    @api.response(200, "Places found, best match first")
+    @api.response(400, "Invalid search parameters")
+    def get(self):
+        """
+        GET places whose title or description match q
+        """
+        args = search_parser.parse_args()
+        if args["limit"] < 1:
+            return {"error": "Invalid limit"}, 400
+
+        return [{
+            "id": place.id,
+            "title": place.title,
+            "latitude": place.latitude,
+            "longitude": place.longitude,
+            "score": round(score, 4),
+            "snippet": snippet,
+        } for place, score, snippet in facade.search_places(args["q"], args["limit"], args["reviews"])], 200
+
 @api.route("/<place_id>")
 class PlaceResource(Resource):
 
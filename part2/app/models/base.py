@@ -7,6 +7,29 @@ class BaseModel:
         self.created_at = datetime.now()
         self.updated_at = datetime.now()
 
+    def __setattr__(self, name, value):
+        """Notify watching repositories when an attribute actually changes"""
+        watchers = self.__dict__.get("_watchers")
+        if not watchers:
+            super().__setattr__(name, value)
+            return
+
+        old = getattr(self, name, None)
+        super().__setattr__(name, value)
+        new = getattr(self, name, None)
+        if old != new:
+            for watcher in watchers:
+                watcher.attribute_changed(self, name, old, new)
+
+    def watch(self, watcher):
+        """Register an object whose attribute_changed() is called on every change"""
+        self.__dict__.setdefault("_watchers", []).append(watcher)
+
+    def unwatch(self, watcher):
+        watchers = self.__dict__.get("_watchers", [])
+        if watcher in watchers:
+            watchers.remove(watcher)
+
     def save(self):
         """Update the updated_at timestamp whenever the object is modified"""
         self.updated_at = datetime.now()
@@ -1,14 +1,23 @@
 from abc import ABC, abstractmethod
+from .text_index import InvertedIndex
 
 class Repository(ABC):
     @abstractmethod
     def add(self, obj):
         pass
 
+    @abstractmethod
+    def add_many(self, objs):
+        pass
+
     @abstractmethod
     def get(self, obj_id):
         pass
 
+    @abstractmethod
+    def get_many(self, ids):
+        pass
+
     @abstractmethod
     def get_all(self):
         pass
@@ -25,17 +34,37 @@ class Repository(ABC):
     def get_by_attribute(self, attr_name, attr_value):
         pass
 
+    @abstractmethod
+    def get_all_by_attribute(self, attr_name, attr_value):
+        pass
+
 
 class InMemoryRepository(Repository):
-    def __init__(self):
+    def __init__(self, indexes=(), text_fields=()):
         self._storage = {}
+        # attribute name -> value -> {id: obj}, kept in insertion order
+        self._indexes = {attr_name: {} for attr_name in indexes}
+        self._text_index = InvertedIndex(text_fields) if text_fields else None
 
     def add(self, obj):
         self._storage[obj.id] = obj
+        for attr_name, index in self._indexes.items():
+            index.setdefault(getattr(obj, attr_name, None), {})[obj.id] = obj
+        if self._text_index:
+            self._text_index.add(obj)
+        obj.watch(self)
+
+    def add_many(self, objs):
+        for obj in objs:
+            self.add(obj)
 
     def get(self, obj_id):
         return self._storage.get(obj_id)
 
+    def get_many(self, ids):
+        """The objects with the given ids in the order asked, once each, unknown ids are skipped"""
+        return [self._storage[obj_id] for obj_id in dict.fromkeys(ids) if obj_id in self._storage]
+
     def get_all(self):
         return list(self._storage.values())
 
@@ -46,7 +75,53 @@ class InMemoryRepository(Repository):
 
     def delete(self, obj_id):
         if obj_id in self._storage:
-            del self._storage[obj_id]
+            obj = self._storage.pop(obj_id)
+            for attr_name, index in self._indexes.items():
+                self._unindex(index, getattr(obj, attr_name, None), obj_id)
+            if self._text_index:
+                self._text_index.remove(obj_id)
+            obj.unwatch(self)
 
     def get_by_attribute(self, attr_name, attr_value):
+        if attr_name == "id":
+            return self.get(attr_value)
+        if attr_name in self._indexes:
+            matches = self._indexes[attr_name].get(attr_value)
+            return next(iter(matches.values())) if matches else None
         return next((obj for obj in self._storage.values() if getattr(obj, attr_name) == attr_value), None)
+
+    def get_all_by_attribute(self, attr_name, attr_value):
+        if attr_name in self._indexes:
+            return list(self._indexes[attr_name].get(attr_value, {}).values())
+        return [obj for obj in self._storage.values() if getattr(obj, attr_name) == attr_value]
+
+    def search(self, text, limit):
+        """Full-text search over text_fields, returns (obj, score, snippet) triples, best first"""
+        if not self._text_index:
+            raise ValueError("Repository has no text fields")
+        return [
+            (self._storage[obj_id], score, self._text_index.snippet(self._storage[obj_id], text))
+            for obj_id, score in self._text_index.search(text, limit)
+        ]
+
+    def attribute_changed(self, obj, attr_name, old_value, new_value):
+        """Move obj between index buckets when one of its indexed attributes is set"""
+        if self._storage.get(obj.id) is not obj:
+            return
+
+        if self._text_index and attr_name in self._text_index.fields:
+            self._text_index.add(obj)
+
+        index = self._indexes.get(attr_name)
+        if index is None:
+            return
+        self._unindex(index, old_value, obj.id)
+        index.setdefault(new_value, {})[obj.id] = obj
+
+    @staticmethod
+    def _unindex(index, value, obj_id):
+        matches = index.get(value)
+        if matches is not None:
+            matches.pop(obj_id, None)
+            if not matches:
+                del index[value]
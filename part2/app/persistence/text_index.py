@@ -0,0 +1,96 @@
+import math
+import re
+
+WORD = re.compile(r"\w+")
+
+def tokenize(text):
+    return [word.lower() for word in WORD.findall(text or "")]
+
+class InvertedIndex:
+    """
+    In-memory full-text index over some string attributes of the stored
+    objects. Every query word must match, the last one as a prefix, and
+    results are ranked with BM25.
+    """
+
+    def __init__(self, fields, k1=1.2, b=0.75):
+        self.fields = fields
+        self.k1 = k1
+        self.b = b
+        self._postings = {}  # word -> {obj_id: term frequency}
+        self._documents = {}  # obj_id -> (number of words, words)
+        self._total_length = 0
+
+    def add(self, obj):
+        words = [word for field in self.fields for word in tokenize(getattr(obj, field, None))]
+        self.remove(obj.id)
+        self._documents[obj.id] = (len(words), set(words))
+        self._total_length += len(words)
+        for word in words:
+            postings = self._postings.setdefault(word, {})
+            postings[obj.id] = postings.get(obj.id, 0) + 1
+
+    def remove(self, obj_id):
+        if obj_id not in self._documents:
+            return
+        length, words = self._documents.pop(obj_id)
+        self._total_length -= length
+        for word in words:
+            postings = self._postings[word]
+            del postings[obj_id]
+            if not postings:
+                del self._postings[word]
+
+    def search(self, text, limit):
+        """Return up to limit (obj_id, score) pairs, best first"""
+        words = tokenize(text)
+        if not words or not self._documents:
+            return []
+
+        terms = [[word] for word in words[:-1]]
+        terms.append([word for word in self._postings if word.startswith(words[-1])])
+
+        scores = None
+        for alternatives in terms:
+            term_scores = {}
+            for word in alternatives:
+                for obj_id, score in self._score(word).items():
+                    term_scores[obj_id] = max(term_scores.get(obj_id, 0.0), score)
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {obj_id: scores[obj_id] + score for obj_id, score in term_scores.items() if obj_id in scores}
+            if not scores:
+                return []
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+    def snippet(self, obj, text, size=12):
+        """A window of size words of the first field matching text, matching words wrapped in []"""
+        words = tokenize(text)
+
+        def matches(token):
+            return any(word.startswith(query) for word in tokenize(token) for query in words)
+
+        for field in self.fields:
+            tokens = (getattr(obj, field, None) or "").split()
+            first = next((i for i, token in enumerate(tokens) if matches(token)), None)
+            if first is not None:
+                break
+        else:
+            tokens, first = (getattr(obj, self.fields[0], None) or "").split(), 0
+
+        start = max(0, first - size // 2)
+        window = [f"[{token}]" if matches(token) else token for token in tokens[start:start + size]]
+        return ("..." if start > 0 else "") + " ".join(window) + ("..." if start + size < len(tokens) else "")
+
+    def _score(self, word):
+        postings = self._postings.get(word, {})
+        documents = len(self._documents)
+        idf = math.log(1 + (documents - len(postings) + 0.5) / (len(postings) + 0.5))
+        average_length = self._total_length / documents or 1
+        return {
+            obj_id: idf * frequency * (self.k1 + 1) /
+            (frequency + self.k1 * (1 - self.b + self.b * self._documents[obj_id][0] / average_length))
+            for obj_id, frequency in postings.items()
+        }
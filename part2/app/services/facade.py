@@ -12,20 +12,47 @@ class HBnBFacade:
         return cls.INSTANCE
 
     def __init__(self):
-        self.user_repo = InMemoryRepository()
-        self.place_repo = InMemoryRepository()
-        self.review_repo = InMemoryRepository()
+        self.user_repo = InMemoryRepository(indexes=("email",))
+        self.place_repo = InMemoryRepository(indexes=("owner",), text_fields=("title", "description"))
+        self.review_repo = InMemoryRepository(indexes=("place_id", "user_id"), text_fields=("text",))
         self.amenity_repo = InMemoryRepository()
 
+    def _create_many(self, repo, factory, items):
+        """
+        Build every object first so that validation errors are reported per
+        item, then store the valid ones. Returns one (obj, error) pair per
+        item, in order.
+        """
+        results, objs = [], []
+        for item in items:
+            try:
+                obj = factory(**item)
+            except ValueError as e:
+                results.append((None, str(e)))
+            except TypeError:
+                results.append((None, "Invalid input data"))
+            else:
+                results.append((obj, None))
+                objs.append(obj)
+
+        repo.add_many(objs)
+        return results
+
     # User facade
     def create_user(self, user_data):
         user = User(**user_data)
         self.user_repo.add(user)
         return user
 
+    def create_many_users(self, users_data):
+        return self._create_many(self.user_repo, User, users_data)
+
     def get_user(self, user_id):
         return self.user_repo.get(user_id)
 
+    def get_users(self, user_ids):
+        return self.user_repo.get_many(user_ids)
+
     def get_user_by_email(self, email):
         return self.user_repo.get_by_attribute('email', email)
 
@@ -40,9 +67,15 @@ class HBnBFacade:
         self.amenity_repo.add(amenity)
         return amenity
 
+    def create_many_amenities(self, amenities_data):
+        return self._create_many(self.amenity_repo, Amenity, amenities_data)
+
     def get_amenity(self, amenity_id):
         return self.amenity_repo.get_by_attribute('id', amenity_id)
 
+    def get_amenities(self, amenity_ids):
+        return self.amenity_repo.get_many(amenity_ids)
+
     def get_all_amenities(self):
         return self.amenity_repo.get_all()
 
@@ -54,9 +87,25 @@ class HBnBFacade:
         self.place_repo.add(place)
         return place
 
+    def create_many_places(self, places_data):
+        return self._create_many(self.place_repo, Place, places_data)
+
     def get_place(self, place_id):
         return self.place_repo.get(place_id)
 
+    def get_places(self, place_ids):
+        return self.place_repo.get_many(place_ids)
+
+    def search_places(self, text, limit, include_reviews=False):
+        """Returns (place, score, snippet) triples, best first"""
+        results = {place.id: (place, score, snip) for place, score, snip in self.place_repo.search(text, limit)}
+        if include_reviews:
+            for review, score, snip in self.review_repo.search(text, limit * 10):
+                place = self.place_repo.get(review.place_id)
+                if place and place.id not in results:
+                    results[place.id] = (place, score, snip)
+        return sorted(results.values(), key=lambda result: result[1], reverse=True)[:limit]
+
     def get_all_places(self):
         return self.place_repo.get_all()
 
@@ -74,6 +123,9 @@ class HBnBFacade:
         self.review_repo.add(review)
         return review
 
+    def create_many_reviews(self, reviews_data):
+        return self._create_many(self.review_repo, Review, reviews_data)
+
     def get_review(self, review_id):
         return self.review_repo.get(review_id)
 
@@ -81,7 +133,7 @@ class HBnBFacade:
         return self.review_repo.get_all()
 
     def get_reviews_by_place(self, place_id):
-        return self.review_repo.get_by_attribute('place_id', place_id)
+        return self.review_repo.get_all_by_attribute('place_id', place_id)
 
     def update_review(self, review_id, review_data):
         return self.review_repo.update(review_id, review_data)
@@ -0,0 +1,114 @@
+import sys
+sys.path.append("..")
+
+from app.models.user import User
+from app.models.review import Review
+from app.models.place import Place
+from app.persistence.repository import InMemoryRepository
+from app.services.facade import HBnBFacade
+import unittest
+
+class TestAttributeIndexes(unittest.TestCase):
+    def setUp(self):
+        self.users = InMemoryRepository(indexes=("email",))
+        self.reviews = InMemoryRepository(indexes=("place_id",))
+
+    def test_lookup_by_indexed_attribute(self):
+        user = User(first_name="John", last_name="Doe", email="john@example.com")
+        self.users.add(user)
+        self.assertIs(self.users.get_by_attribute("email", "john@example.com"), user)
+        self.assertIsNone(self.users.get_by_attribute("email", "jane@example.com"))
+
+    def test_setter_moves_index_entry(self):
+        user = User(first_name="John", last_name="Doe", email="john@example.com")
+        self.users.add(user)
+        user.email = "johnny@example.com"
+        self.assertIsNone(self.users.get_by_attribute("email", "john@example.com"))
+        self.assertIs(self.users.get_by_attribute("email", "johnny@example.com"), user)
+
+        self.users.update(user.id, {"email": "jd@example.com"})
+        self.assertIs(self.users.get_by_attribute("email", "jd@example.com"), user)
+
+    def test_invalid_setter_keeps_index(self):
+        user = User(first_name="John", last_name="Doe", email="john@example.com")
+        self.users.add(user)
+        with self.assertRaises(ValueError):
+            user.email = "invalidemail"
+        self.assertIs(self.users.get_by_attribute("email", "john@example.com"), user)
+
+    def test_delete_removes_index_entry(self):
+        user = User(first_name="John", last_name="Doe", email="john@example.com")
+        self.users.add(user)
+        self.users.delete(user.id)
+        self.assertIsNone(self.users.get_by_attribute("email", "john@example.com"))
+
+        # A deleted object no longer updates the index of its old repository
+        user.email = "john@example.com"
+        self.assertIsNone(self.users.get_by_attribute("email", "john@example.com"))
+
+    def test_get_all_by_attribute(self):
+        first = Review(text="Great", rating=5, place_id="p1", user_id="u1")
+        second = Review(text="Fine", rating=3, place_id="p1", user_id="u2")
+        other = Review(text="Bad", rating=1, place_id="p2", user_id="u1")
+        for review in (first, second, other):
+            self.reviews.add(review)
+
+        self.assertEqual(self.reviews.get_all_by_attribute("place_id", "p1"), [first, second])
+        self.assertEqual(self.reviews.get_all_by_attribute("user_id", "u1"), [first, other])
+        self.assertEqual(self.reviews.get_all_by_attribute("place_id", "p3"), [])
+
+class TestGetMany(unittest.TestCase):
+    def test_keeps_order_and_skips_unknown_ids(self):
+        facade = HBnBFacade()
+        (john, _), (jane, _) = facade.create_many_users([
+            {"first_name": "John", "last_name": "Doe", "email": "john@example.com"},
+            {"first_name": "Jane", "last_name": "Doe", "email": "jane@example.com"},
+        ])
+        self.assertEqual(facade.get_users([jane.id, "unknown", john.id, jane.id]), [jane, john])
+        self.assertEqual(facade.get_users([]), [])
+
+class TestBulkCreate(unittest.TestCase):
+    def test_create_many_reports_each_item(self):
+        facade = HBnBFacade()
+        results = facade.create_many_users([
+            {"first_name": "John", "last_name": "Doe", "email": "john@example.com"},
+            {"first_name": "Jane", "last_name": "Doe", "email": "invalidemail"},
+            {"first_name": "Jim"},
+        ])
+        self.assertIsNotNone(results[0][0])
+        self.assertEqual(results[1], (None, "Invalid email format"))
+        self.assertEqual(results[2], (None, "Invalid input data"))
+        self.assertEqual(facade.get_all_users(), [results[0][0]])
+        self.assertIs(facade.get_user_by_email("john@example.com"), results[0][0])
+
+class TestTextSearch(unittest.TestCase):
+    def setUp(self):
+        self.places = InMemoryRepository(text_fields=("title", "description"))
+        self.flat = Place(title="Sea view flat", description="Close to the old port",
+                          price=80.0, latitude=43.3, longitude=5.4, owner="u1")
+        self.house = Place(title="Country house", description="Quiet, far from the sea and the sea breeze",
+                           price=120.0, latitude=43.5, longitude=5.4, owner="u1")
+        self.places.add(self.flat)
+        self.places.add(self.house)
+
+    def ids(self, text):
+        return [place.id for place, score, snippet in self.places.search(text, 10)]
+
+    def test_ranked_and_prefix_search(self):
+        self.assertEqual(self.ids("sea"), [self.house.id, self.flat.id])
+        self.assertEqual(self.ids("quiet sea"), [self.house.id])
+        self.assertEqual(self.ids("coun"), [self.house.id])
+        self.assertEqual(self.ids("castle"), [])
+        self.assertEqual(self.places.search("old", 10)[0][2], "Close to the [old] port")
+
+    def test_index_follows_writes(self):
+        self.flat.title = "Castle"
+        self.assertEqual(self.ids("castle"), [self.flat.id])
+        self.assertEqual(self.ids("view"), [])
+        self.places.update(self.house.id, {"description": "Next to the castle"})
+        self.assertCountEqual(self.ids("castle"), [self.flat.id, self.house.id])
+        self.places.delete(self.flat.id)
+        self.assertEqual(self.ids("castle"), [self.house.id])
+
+if __name__ == '__main__':
+    unittest.main()
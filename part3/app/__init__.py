@@ -4,10 +4,17 @@ from flask_bcrypt import Bcrypt
 from flask_jwt_extended import JWTManager
 from flask_sqlalchemy import SQLAlchemy
 import config
+from .compression import ResponseCompression
+from .database import RoutingSession, apply_sqlite_pragmas, configure_read_binds
+from .hashing import PasswordHasher, HashingOverloadedError
+from .instrumentation import QueryInstrumentation
 
 bcrypt = Bcrypt()
+hasher = PasswordHasher(bcrypt)
 jwt = JWTManager()
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+instrumentation = QueryInstrumentation(db)
+compression = ResponseCompression()
 facade = None
 
 def create_app(config_class=config.DevelopmentConfig):
@@ -15,19 +22,41 @@ def create_app(config_class=config.DevelopmentConfig):
     app.config.from_object(config_class)
 
     bcrypt.init_app(app)
+    hasher.init_app(app)
     jwt.init_app(app)
+    configure_read_binds(app)
     db.init_app(app)
+    from .persistence.places import SQLITE_FUNCTIONS
+    apply_sqlite_pragmas(app, db, SQLITE_FUNCTIONS)
+    instrumentation.init_app(app)
+    compression.init_app(app)
 
     from .services import HBnBFacade
-    globals()["facade"] = HBnBFacade()
+    from .services.cache import LRUCache, ResponseCache
+    cache = response_cache = None
+    if app.config['ENTITY_CACHE_SIZE']:
+        cache = LRUCache(app.config['ENTITY_CACHE_SIZE'], app.config['ENTITY_CACHE_TTL'])
+    if app.config['RESPONSE_CACHE_MAX_BYTES']:
+        response_cache = ResponseCache(app.config['RESPONSE_CACHE_MAX_BYTES'], app.config['RESPONSE_CACHE_TTL'])
+    globals()["facade"] = HBnBFacade(cache=cache, response_cache=response_cache)
 
     api = Api(app, version='1.0', title='HBnB API', description='HBnB Application API')
 
+    @api.errorhandler(HashingOverloadedError)
+    def handle_hashing_overloaded(error):
+        return {'error': 'Too many password operations, retry later'}, 503, {'Retry-After': '1'}
+
     import app.api.v1 as modules
+    from .api.v1.serializers import output_json
+    api.representation('application/json')(output_json)
+
     api.add_namespace(modules.admin_api, "/api/v1/admin")
     api.add_namespace(modules.users_api, path='/api/v1/users')
     api.add_namespace(modules.amenities_api, path="/api/v1/amenities")
     api.add_namespace(modules.reviews_api, path="/api/v1/reviews")
     api.add_namespace(modules.places_api, "/api/v1/places")
     api.add_namespace(modules.auth_api, "/api/v1/auth")
+
+    from .commands import register_commands
+    register_commands(app)
     return app
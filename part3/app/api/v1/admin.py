@@ -1,7 +1,10 @@
 from flask_restx import Namespace, Resource, fields
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from flask import request
-from app import facade
+from app import facade, hasher
+from app.hashing import HashingOverloadedError
+from .places import place_detail_flight
+from .serializers import amenity_serializer, user_serializer
 
 api = Namespace('admin', description='Admin operations')
 
@@ -26,7 +29,7 @@ class AdminUserCreate(Resource):
         except ValueError as e:
             return {"error": "Invalid input data"}, 400
 
-        return { "id": new_admin_user.id, "first_name": new_admin_user.first_name, "last_name": new_admin_user.last_name, "email": new_admin_user.email }, 201
+        return user_serializer(new_admin_user), 201
 
 @api.route('/users/<user_id>')
 class AdminUserResource(Resource):
@@ -51,10 +54,13 @@ class AdminUserResource(Resource):
 
         try:
             facade.update_user(user_id, api.payload)
+        except HashingOverloadedError:
+            # A 503 with Retry-After, see create_app
+            raise
         except Exception as e:
             return {"error": "Invalid input data"}, 400
 
-        return { "id": user.id, "first_name": user.first_name, "last_name": user.last_name, "email": user.email }
+        return user_serializer(user)
 
 @api.route('/amenities/')
 class AdminAmenityCreate(Resource):
@@ -71,7 +77,7 @@ class AdminAmenityCreate(Resource):
         except Exception as e:
             return {"error": "Invalid input data"}, 400
 
-        return { "id": new_amenity.id, "name": new_amenity.name }, 201
+        return amenity_serializer(new_amenity), 201
 
 @api.route('/amenities/<amenity_id>')
 class AdminAmenityModify(Resource):
@@ -91,3 +97,19 @@ class AdminAmenityModify(Resource):
             return {"error": "Invalid input data"}, 400
 
         return {"message": "Amenity updated successfully"}, 200
+
+@api.route('/stats')
+class AdminStats(Resource):
+    @jwt_required()
+    def get(self):
+        """Runtime statistics of the API workers"""
+        current_user = get_jwt_identity()
+        if not current_user.get('is_admin'):
+            return {'error': 'Admin privileges required'}, 403
+
+        return {
+            "password_hashing": hasher.stats(),
+            "entity_cache": facade.cache.stats() if facade.cache else None,
+            "response_cache": facade.response_cache.stats() if facade.response_cache else None,
+            "place_detail_coalescing": place_detail_flight.stats()
+        }, 200
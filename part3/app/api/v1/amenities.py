@@ -1,5 +1,10 @@
 from flask_restx import Namespace, Resource, fields
 from app import facade
+from .batch import batch_get
+from .caching import cached
+from .conditional import conditional
+from .pagination import paginate, pagination_parser
+from .serializers import amenity_serializer, fields_parser, requested_fields
 
 api = Namespace('amenities', description='Amenity operations')
 
@@ -22,23 +27,50 @@ class AmenityList(Resource):
         except Exception as e:
             return {"error": "Invalid input data"}, 400
 
-        return { "id": new_amenity.id, "name": new_amenity.name }, 201
+        return amenity_serializer(new_amenity), 201
 
+    @api.expect(pagination_parser)
     @api.response(200, 'List of amenities retrieved successfully')
+    @api.response(400, 'Invalid limit, cursor or fields')
     def get(self):
-        """Retrieve a list of all amenities"""
-        return [{ "id": i.id, "name": i.name } for i in facade.get_all_amenities()], 200
+        """Retrieve a page of amenities"""
+        return cached(("amenities",), lambda: conditional(facade.get_amenities_version(), lambda: paginate(
+            facade.get_amenities_page, amenity_serializer, facade.iter_amenities
+        )))
+
+@api.route('/batch')
+class AmenityBatch(Resource):
+    @api.expect(fields_parser, [fields.String])
+    @api.response(200, 'Amenities found, in the order asked, and the missing IDs')
+    @api.response(400, 'Invalid list of IDs or fields')
+    def post(self):
+        """Get many amenities by ID in one request"""
+        return batch_get(api.payload, facade.get_amenities, amenity_serializer)
 
 @api.route('/<amenity_id>')
 class AmenityResource(Resource):
+    @api.expect(fields_parser)
     @api.response(200, 'Amenity details retrieved successfully')
+    @api.response(304, 'Amenity not modified')
+    @api.response(400, 'Invalid fields')
     @api.response(404, 'Amenity not found')
     def get(self, amenity_id):
-        obj = facade.get_amenity(amenity_id)
+        try:
+            fields = requested_fields(amenity_serializer)
+        except ValueError as e:
+            return {"error": str(e)}, 400
 
-        if not obj:
+        version = facade.get_amenity_version(amenity_id)
+        if not version:
             return {"error": "Amenity not found"}, 404
-        return { "id": obj.id, "name": obj.name }
+
+        def representation():
+            obj = facade.get_amenity(amenity_id)
+            if not obj:
+                return {"error": "Amenity not found"}, 404
+            return amenity_serializer(obj, fields), 200
+
+        return conditional(version, representation)
 
     @api.expect(amenity_model)
     @api.response(200, 'Amenity updated successfully')
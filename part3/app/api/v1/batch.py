@@ -0,0 +1,22 @@
+from flask import current_app
+from .serializers import requested_fields
+
+def batch_get(ids, get_many, serializer):
+    """
+    Answer a batch read: ids is the request body, a list of IDs, and
+    get_many(ids, columns) returns the entities found in the order asked.
+    Fields are chosen with ?fields= as for single reads.
+    """
+    if not isinstance(ids, list) or not ids or not all(isinstance(i, str) for i in ids):
+        return {"error": "Expected a non-empty list of IDs"}, 400
+    if len(ids) > current_app.config['BATCH_MAX_IDS']:
+        return {"error": f"At most {current_app.config['BATCH_MAX_IDS']} IDs per request"}, 400
+    try:
+        fields = requested_fields(serializer)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    found = get_many(ids, serializer.columns(fields))
+    found_ids = {obj.id for obj in found}
+    missing = [i for i in dict.fromkeys(ids) if i not in found_ids]
+    return {"items": serializer.many(found, fields), "missing": missing}, 200
@@ -0,0 +1,31 @@
+from flask import current_app
+
+def bulk_create(items, check, create_many):
+    """
+    Create every item of a bulk request and report success or error per item.
+
+    check(item) returns an error message for items that must be rejected
+    before reaching the facade, create_many(items, batch_size) returns one
+    (obj, error) pair per item it is given.
+    """
+    if not isinstance(items, list) or not items:
+        return {"error": "Expected a non-empty list"}, 400
+    if len(items) > current_app.config['BULK_MAX_ITEMS']:
+        return {"error": f"At most {current_app.config['BULK_MAX_ITEMS']} items per request"}, 400
+
+    results = [None] * len(items)
+    pending = []
+    for index, item in enumerate(items):
+        error = check(item) if isinstance(item, dict) else "Invalid input data"
+        if error:
+            results[index] = {"index": index, "error": error}
+        else:
+            pending.append(index)
+
+    created = create_many([items[i] for i in pending], current_app.config['BULK_BATCH_SIZE'])
+    for index, (obj, error) in zip(pending, created):
+        results[index] = {"index": index, "id": obj.id} if obj else {"index": index, "error": error}
+
+    failed = sum(1 for result in results if "error" in result)
+    payload = {"created": len(results) - failed, "failed": failed, "results": results}
+    return payload, 201 if not failed else 207
@@ -0,0 +1,60 @@
+from flask import current_app, request
+from app import compression, facade
+from .serializers import output_json
+
+# Headers of a stored response replayed on a hit, the others are per request
+STORED_HEADERS = ("Content-Type", "ETag", "Last-Modified", "Cache-Control", "Vary")
+
+def cached(tags, build):
+    """
+    Answer an anonymous GET from the response cache of the facade, keyed
+    on the path, query string and Accept header. A hit replays the stored
+    JSON bytes, answering 304 when the client copy matches its validators,
+    without touching the database. On a miss, return build() (as for
+    conditional) and store it if it is a complete 200 response, under tags
+    so that the facade drops it when it writes (see
+    HBnBFacade._invalidate_responses), unless a write happened while it
+    was built. Requests with credentials are not cached.
+
+    The compressed bodies sent are stored next to the response, so that
+    each is compressed once.
+    """
+    cache = facade.response_cache
+    if cache is None or "Authorization" in request.headers:
+        return build()
+
+    key = (request.path, request.query_string, request.headers.get("Accept"))
+    epoch = cache.epoch
+    entry = cache.get(key)
+    if entry is not None:
+        body, headers = entry
+        response = current_app.response_class(body, status=200, headers=headers)
+        response = response.make_conditional(request.environ)
+        if response.status_code == 200:
+            _compressed(cache, key, response, tags, epoch)
+        return response
+
+    result = build()
+    response = result if isinstance(result, current_app.response_class) else output_json(*result)
+    if response.status_code == 200 and not response.is_streamed:
+        body = response.get_data()
+        headers = [(name, value) for name, value in response.headers.items() if name in STORED_HEADERS]
+        cache.set(key, (body, headers), len(body), tags, epoch)
+        _compressed(cache, key, response, tags, epoch)
+    return response
+
+def _compressed(cache, key, response, tags, epoch):
+    """Encode response for the client from the cached compressed body, compressing it on the first request"""
+    if not compression.compressible(response):
+        return
+    response.vary.add("Accept-Encoding")
+    encoding = compression.negotiate()
+    if encoding is None:
+        return
+    # The ETag ties the compressed body to the identity one it was made from
+    encoded_key = (*key, encoding, response.headers.get("ETag"))
+    body = cache.get(encoded_key)
+    if body is None:
+        body = compression.encode(response.get_data(), encoding)
+        cache.set(encoded_key, body, len(body), tags, epoch)
+    compression.apply(response, body, encoding)
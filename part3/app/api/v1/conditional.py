@@ -0,0 +1,44 @@
+import hashlib
+from datetime import datetime, timezone
+from flask import current_app, request
+from werkzeug.http import http_date, quote_etag
+
+def conditional(version, build):
+    """
+    Answer a GET whose representation depends only on version, a tuple of
+    timestamps and counts read from the database (see the get_*_version
+    methods of the facade).
+
+    The strong ETag hashes version with the query string and the Accept
+    header, Last-Modified is its latest timestamp. When If-None-Match (or,
+    without it, If-Modified-Since) shows that the client copy is current,
+    answer 304 without calling build; otherwise return build(), a
+    (body, status) pair or a response, with both validators.
+    """
+    etag = hashlib.sha1(repr((version, request.query_string, request.headers.get("Accept"))).encode("utf-8")).hexdigest()
+    timestamps = [value for value in version if isinstance(value, datetime)]
+    # Timestamps are stored as naive local times
+    last_modified = max(timestamps).replace(microsecond=0).astimezone(timezone.utc) if timestamps else None
+
+    headers = {"ETag": quote_etag(etag), "Cache-Control": "no-cache", "Vary": "Accept"}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+
+    if request.if_none_match:
+        # Weak comparison, a compressed copy has the weak form of the ETag
+        not_modified = request.if_none_match.contains_weak(etag)
+    else:
+        not_modified = (last_modified is not None and request.if_modified_since is not None
+                        and last_modified <= request.if_modified_since)
+    if not_modified:
+        return current_app.response_class(status=304, headers=headers)
+
+    result = build()
+    if isinstance(result, current_app.response_class):
+        if result.status_code == 200:
+            result.headers.update(headers)
+        return result
+    body, status = result
+    if status != 200:
+        return body, status
+    return body, status, headers
@@ -0,0 +1,44 @@
+from flask import current_app
+from .serializers import fields_parser, requested_fields
+from .streaming import stream_ndjson, wants_ndjson
+
+pagination_parser = fields_parser.copy()
+pagination_parser.add_argument('limit', type=int, location='args', help='Maximum number of items to return')
+pagination_parser.add_argument('cursor', type=str, location='args', help='next_cursor of the previous page')
+
+def paginate(get_page, serializer, iterate=None, fields=None):
+    """
+    Run get_page(limit, cursor, columns) from the query string and wrap its
+    result, items serialized with fields or those asked in ?fields=;
+    columns are the model columns those need.
+    Clients accepting application/x-ndjson instead get every item after
+    cursor from iterate(cursor, columns), streamed one per line.
+    """
+    args = pagination_parser.parse_args()
+
+    try:
+        fields = requested_fields(serializer, fields)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    serialize, columns = serializer.compile(fields), serializer.columns(fields)
+
+    if iterate is not None and wants_ndjson():
+        try:
+            rows = iterate(args['cursor'], columns)
+        except ValueError:
+            return {"error": "Invalid cursor"}, 400
+        return stream_ndjson(rows, serialize)
+
+    limit = args['limit']
+    if limit is None:
+        limit = current_app.config['API_PAGE_SIZE']
+    elif limit < 1:
+        return {"error": "Invalid limit"}, 400
+    limit = min(limit, current_app.config['API_MAX_PAGE_SIZE'])
+
+    try:
+        items, next_cursor = get_page(limit, args['cursor'], columns)
+    except ValueError:
+        return {"error": "Invalid cursor"}, 400
+
+    return {"items": [serialize(i) for i in items], "next_cursor": next_cursor}, 200
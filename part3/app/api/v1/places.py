@@ -3,12 +3,24 @@
 Places' API.
 """
 
-from flask_restx import fields, Namespace, Resource
+from flask import current_app
+from flask_restx import fields, inputs, Namespace, Resource, reqparse
 from flask_jwt_extended import get_jwt_identity, jwt_required
 from app import facade
+from app.services.singleflight import SingleFlight
+from .batch import batch_get
+from .bulk import bulk_create
+from .caching import cached
+from .conditional import conditional
+from .pagination import paginate, pagination_parser
+from .serializers import (amenity_serializer, dumps, fields_parser, place_serializer, requested_fields,
+                          review_serializer, user_serializer)
 
 api = Namespace("places", description="Place operations")
 
+# Concurrent requests for the same place detail share one computation
+place_detail_flight = SingleFlight()
+
 place_model = api.model('Place', {
     'title': fields.String(required=True, description='Title of the place'),
     'description': fields.String(description='Description of the place'),
@@ -18,6 +30,36 @@ place_model = api.model('Place', {
     'owner': fields.String(required=True, description='ID of the owner')
 })
 
+PLACE_CREATED_FIELDS = ("id", "title", "description", "price", "latitude", "longitude", "owner")
+PLACE_LIST_FIELDS = ("id", "title", "latitude", "longitude", "review_count", "average_rating")
+PLACE_SEARCH_FIELDS = ("id", "title", "latitude", "longitude")
+# The owner field of a detail is the nested user, reviews and amenities are the related rows
+PLACE_RELATIONS = ("reviews", "amenities")
+PLACE_DETAIL_FIELDS = (*place_serializer.fields, *PLACE_RELATIONS)
+
+place_list_parser = pagination_parser.copy()
+place_list_parser.add_argument(
+    'sort', type=str, location='args', default='created_at',
+    choices=('created_at', '-created_at', 'price', '-price', 'rating', '-rating', 'review_count', '-review_count'),
+    help='Sort key, prefix with - for descending order'
+)
+place_list_parser.add_argument('min_price', type=float, location='args', help='Lowest price per night')
+place_list_parser.add_argument('max_price', type=float, location='args', help='Highest price per night')
+place_list_parser.add_argument('amenity', type=str, location='args', action='append',
+                               help='Amenity ID the place must have, repeat or comma-separate for several')
+place_list_parser.add_argument('owner_id', type=str, location='args', help='ID of the owner')
+place_list_parser.add_argument('min_rating', type=float, location='args', help='Lowest average rating')
+
+search_parser = reqparse.RequestParser()
+search_parser.add_argument('q', type=str, location='args', help='Words to look for in titles and descriptions')
+search_parser.add_argument('reviews', type=inputs.boolean, location='args', default=False,
+                           help='Also match the text of the reviews')
+search_parser.add_argument('lat', type=float, location='args', help='Latitude of the search center')
+search_parser.add_argument('lng', type=float, location='args', help='Longitude of the search center')
+search_parser.add_argument('radius_km', type=float, location='args', help='Search radius in kilometers')
+search_parser.add_argument('bbox', type=str, location='args', help='Viewport as west,south,east,north')
+search_parser.add_argument('limit', type=int, location='args', help='Maximum number of places to return')
+
 
 @api.route("/")
 class PlaceList(Resource):
@@ -52,25 +94,125 @@ class PlaceList(Resource):
         except ValueError as e:
             return {"error": "Invalid input data"}, 400
 
-        return {
-            "id": new_place.id,
-            "title": new_place.title,
-            "description": new_place.description,
-            "price": new_place.price,
-            "latitude": new_place.latitude,
-            "longitude": new_place.longitude,
-            "owner": current_user["id"]
-        }, 201
+        return place_serializer(new_place, PLACE_CREATED_FIELDS), 201
 
+    @api.expect(place_list_parser)
     @api.response(200, 'List of places retrieved successfully')
+    @api.response(400, 'Invalid limit, cursor, sort, filter or fields')
     def get(self):
-        """Retrieve a list of all places"""
-        return [{
-            "id": i.id,
-            "title": i.title,
-            "latitude": i.latitude,
-            "longitude": i.longitude,
-        } for i in facade.get_all_places()], 200
+        """Retrieve a page of places, optionally filtered"""
+        args = place_list_parser.parse_args()
+        sort = args['sort']
+        filters = {name: args[name] for name in ('min_price', 'max_price', 'owner_id', 'min_rating')
+                   if args[name] is not None}
+        amenities = [i for value in args['amenity'] or [] for i in value.split(',') if i]
+        if amenities:
+            filters['amenities'] = amenities
+        if any(value < 0 for name, value in filters.items() if name in ('min_price', 'max_price', 'min_rating')):
+            return {"error": "Invalid filter"}, 400
+
+        return cached(("places",), lambda: conditional(facade.get_places_version(), lambda: paginate(
+            lambda limit, cursor, columns: facade.get_places_page(limit, cursor, sort, columns, filters),
+            place_serializer,
+            lambda cursor, columns: facade.iter_places(cursor, sort, columns, filters),
+            PLACE_LIST_FIELDS
+        )))
+
+@api.route("/bulk")
+class PlaceBulk(Resource):
+
+    """
+    Create many places in one request
+    """
+
+    @jwt_required()
+    @api.expect([place_model])
+    @api.response(201, "All places created")
+    @api.response(207, "Some places could not be created")
+    @api.response(400, "Invalid input data")
+    def post(self):
+        """
+        POST a list of places, the result of each one is reported by index
+        """
+        current_user = get_jwt_identity()
+        items = api.payload
+        owners = set()
+        if isinstance(items, list):
+            owners = facade.get_existing_user_ids(i.get("owner") for i in items if isinstance(i, dict))
+
+        def check(item):
+            if not current_user["is_admin"] and item.get("owner") != current_user["id"]:
+                return "Unauthorized action."
+            if item.get("owner") not in owners:
+                return "Owner not found"
+
+        return bulk_create(items, check, facade.create_many_places)
+
+@api.route("/batch")
+class PlaceBatch(Resource):
+    @api.expect(fields_parser, [fields.String])
+    @api.response(200, 'Places found, in the order asked, and the missing IDs')
+    @api.response(400, 'Invalid list of IDs or fields')
+    def post(self):
+        """Get many places by ID in one request"""
+        return batch_get(api.payload, facade.get_places, place_serializer)
+
+@api.route("/search")
+class PlaceSearch(Resource):
+
+    """
+    Find places by text, around a point or inside a map viewport
+    """
+
+    @api.expect(search_parser)
+    @api.response(200, "Places found, best match or nearest first")
+    @api.response(400, "Invalid search parameters")
+    def get(self):
+        """
+        GET places matching the text q, within radius_km of lat/lng, or inside bbox
+        """
+        args = search_parser.parse_args()
+
+        try:
+            fields = requested_fields(place_serializer, PLACE_SEARCH_FIELDS)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        serialize, columns = place_serializer.compile(fields), place_serializer.columns(fields)
+
+        limit = args["limit"]
+        if limit is None:
+            limit = current_app.config["API_PAGE_SIZE"]
+        if limit < 1:
+            return {"error": "Invalid limit"}, 400
+        limit = min(limit, current_app.config["API_MAX_PAGE_SIZE"])
+
+        if args["q"] is not None:
+            results = facade.search_places_text(args["q"], limit, args["reviews"], columns)
+            return {"items": [
+                {**serialize(place), "rank": rank, "snippet": snippet} for place, rank, snippet in results
+            ]}, 200
+
+        if args["bbox"] is not None:
+            try:
+                west, south, east, north = (float(i) for i in args["bbox"].split(","))
+            except ValueError:
+                return {"error": "Invalid bbox"}, 400
+            if not (-90.0 <= south <= north <= 90.0 and -180.0 <= west <= 180.0 and -180.0 <= east <= 180.0):
+                return {"error": "Invalid bbox"}, 400
+            results = facade.search_places_in_viewport(south, west, north, east, limit, columns)
+        elif None not in (args["lat"], args["lng"], args["radius_km"]):
+            lat, lng, radius_km = args["lat"], args["lng"], args["radius_km"]
+            if not (-90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0):
+                return {"error": "Invalid coordinates"}, 400
+            if not (0 < radius_km <= current_app.config["PLACE_SEARCH_MAX_RADIUS_KM"]):
+                return {"error": "Invalid radius"}, 400
+            results = facade.search_places_nearby(lat, lng, radius_km, limit, columns)
+        else:
+            return {"error": "q, lat, lng and radius_km or bbox are required"}, 400
+
+        return {"items": [
+            {**serialize(place), "distance_km": round(distance, 3)} for place, distance in results
+        ]}, 200
 
 @api.route("/<place_id>")
 class PlaceResource(Resource):
@@ -79,36 +221,66 @@ class PlaceResource(Resource):
     Display data of place
     """
 
+    @api.expect(fields_parser)
     @api.response(200, "Place details retrieved successfully")
+    @api.response(304, "Place not modified")
+    @api.response(400, "Invalid fields")
     @api.response(404, "Place not found")
     def get(self, place_id):
         """
         GET place details from their ID
         """
-        place = facade.get_place(place_id)
-        if not place:
+        return cached((f"places:{place_id}",), lambda: self.conditional_detail(place_id))
+
+    @staticmethod
+    def conditional_detail(place_id):
+        try:
+            fields = requested_fields(place_serializer, PLACE_DETAIL_FIELDS, extra=PLACE_RELATIONS)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        version = facade.get_place_version(place_id)
+        if not version:
             return {"error": "Place not found"}, 404
+        return conditional(version, lambda: PlaceResource.shared_detail(place_id, fields, version))
 
-        owner = facade.get_user(place.owner_id)
-        if not owner:
-            return {'error': "Owner not found"}, 404
+    @staticmethod
+    def shared_detail(place_id, fields, version):
+        """
+        detail, built once for the identical requests in flight in this
+        worker and shared as serialized JSON. version is part of the key so
+        that a request never gets a body built before a write it has seen.
+        """
+        if not current_app.config['PLACE_DETAIL_COALESCING']:
+            return PlaceResource.detail(place_id, fields)
+
+        def build():
+            data, status = PlaceResource.detail(place_id, fields)
+            return dumps(data) + b"\n", status
+
+        (body, status), _ = place_detail_flight.do((place_id, version, tuple(fields)), build)
+        return current_app.response_class(body, status=status, mimetype="application/json")
+
+    @staticmethod
+    def detail(place_id, fields):
+        """Load only the columns and relations that fields show"""
+        include = [name for name in ("owner", *PLACE_RELATIONS) if name in fields]
+        detail = facade.get_place_detail(place_id, place_serializer.columns(fields), include)
+        if not detail:
+            return {"error": "Place not found"}, 404
 
-        return {
-            "id": place.id,
-            "title": place.title,
-            "description": place.description,
-            "price": place.price,
-            "latitude": place.latitude,
-            "longitude": place.longitude,
-            "owner": {
-                "id": owner.id,
-                "first_name": owner.first_name,
-                "last_name": owner.last_name,
-                "email": owner.email
-            },
-            "reviews": [{"id": review.id, "text": review.text, "rating": review.rating, "user_id": review.user_id} for review in place.reviews],
-            "amenities": [{ "id": i.id, "name": i.name } for i in place.amenities]
-        }, 200
+        place, reviews, amenities = detail
+        data = place_serializer(place, [name for name in fields if name not in PLACE_RELATIONS])
+        if "owner" in fields:
+            owner = place.owner
+            if not owner:
+                return {'error': "Owner not found"}, 404
+            data["owner"] = user_serializer(owner)
+        if reviews is not None:
+            data["reviews"] = review_serializer.many(reviews, ("id", "text", "rating", "user_id"))
+        if amenities is not None:
+            data["amenities"] = amenity_serializer.many(amenities)
+        return data, 200
 
     @jwt_required()
     @api.expect(place_model)
@@ -140,7 +312,7 @@ class PlaceResource(Resource):
     @api.response(200, 'Place deleted successfully')
     @api.response(404, 'Place not found')
     def delete(self, place_id):
-        """Delete a review"""
+        """Delete a place with its reviews, its amenities are kept"""
         current_user = get_jwt_identity()
 
         obj = facade.get_place(place_id)
@@ -148,17 +320,13 @@ class PlaceResource(Resource):
             return {"error": "Place not found"}, 404
 
         if not current_user["is_admin"]:
-            if current_user["id"] != obj.owner:
+            if current_user["id"] != obj.owner_id:
                 return {"error": "Unauthorized action"}, 403
 
-        for review in obj.reviews:
-            facade.delete_review(review.id)
-
-        for amenity in obj.amenities:
-            facade.delete_amenity(amenity.id)
-
-        facade.delete_place(place_id)
-        return {"message": "Place deleted successfully"}, 200
+        removed = facade.delete_place_cascade(place_id)
+        if removed is None:
+            return {"error": "Place not found"}, 404
+        return {"message": "Place deleted successfully", "deleted": removed}, 200
 
 @api.route("/<place_id>/add_amenity/<amenity_id>")
 class PlaceAmenity(Resource):
@@ -181,5 +349,5 @@ class PlaceAmenity(Resource):
         if not amenity:
             return {"error": "Invalid amenity id"}
 
-        place.amenities.append(amenity)
+        facade.add_place_amenity(place, amenity)
         return {"message": "Add amenity to place"}, 200
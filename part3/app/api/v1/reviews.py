@@ -1,6 +1,10 @@
 from flask_restx import Namespace, Resource, fields
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import facade
+from .bulk import bulk_create
+from .conditional import conditional
+from .pagination import paginate, pagination_parser
+from .serializers import fields_parser, requested_fields, review_serializer
 
 api = Namespace('reviews', description='Review operations')
 
@@ -12,6 +16,9 @@ review_model = api.model('Review', {
     'place_id': fields.String(required=True, description='ID of the place')
 })
 
+REVIEW_SUMMARY_FIELDS = ("id", "text", "rating")
+PLACE_REVIEW_FIELDS = ("id", "text", "rating", "user_id")
+
 @api.route('/')
 class ReviewList(Resource):
     @jwt_required()
@@ -38,23 +45,68 @@ class ReviewList(Resource):
             return {"error": "Invalid input data"}, 400
 
         place.reviews.append(new_review)
-        return {"id": new_review.id, "text": new_review.text, "rating": new_review.rating, "place_id": new_review.place_id, "user_id": new_review.user_id}, 201
+        return review_serializer(new_review), 201
 
+    @api.expect(pagination_parser)
     @api.response(200, 'List of reviews retrieved successfully')
+    @api.response(400, 'Invalid limit, cursor or fields')
     def get(self):
-        """Retrieve a list of all reviews"""
-        return [{"id": i.id, "text": i.text, "rating": i.rating } for i in facade.get_all_reviews()], 200
+        """Retrieve a page of reviews"""
+        return conditional(facade.get_reviews_version(), lambda: paginate(
+            facade.get_reviews_page, review_serializer, facade.iter_reviews, REVIEW_SUMMARY_FIELDS
+        ))
+
+@api.route('/bulk')
+class ReviewBulk(Resource):
+    @jwt_required()
+    @api.expect([review_model])
+    @api.response(201, 'All reviews created')
+    @api.response(207, 'Some reviews could not be created')
+    @api.response(400, 'Invalid input data')
+    def post(self):
+        """Register a list of reviews, the result of each one is reported by index"""
+        current_user = get_jwt_identity()
+        items = api.payload
+        places, users = set(), set()
+        if isinstance(items, list):
+            places = facade.get_existing_place_ids(i.get("place_id") for i in items if isinstance(i, dict))
+            users = facade.get_existing_user_ids(i.get("user_id") for i in items if isinstance(i, dict))
+
+        def check(item):
+            if not current_user["is_admin"] and item.get("user_id") != current_user["id"]:
+                return "Unauthorized action"
+            if item.get("place_id") not in places:
+                return "Invalid place id"
+            if item.get("user_id") not in users:
+                return "Invalid user id"
+
+        return bulk_create(items, check, facade.create_many_reviews)
 
 @api.route('/<review_id>')
 class ReviewResource(Resource):
+    @api.expect(fields_parser)
     @api.response(200, 'Review details retrieved successfully')
+    @api.response(304, 'Review not modified')
+    @api.response(400, 'Invalid fields')
     @api.response(404, 'Review not found')
     def get(self, review_id):
         """Get review details by ID"""
-        obj = facade.get_review(review_id)
-        if not obj:
+        try:
+            fields = requested_fields(review_serializer, REVIEW_SUMMARY_FIELDS)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        version = facade.get_review_version(review_id)
+        if not version:
             return {"error": "Review not found"}, 404
-        return { "id": obj.id, "text": obj.text, "rating": obj.rating }
+
+        def representation():
+            obj = facade.get_review(review_id)
+            if not obj:
+                return {"error": "Review not found"}, 404
+            return review_serializer(obj, fields), 200
+
+        return conditional(version, representation)
 
     @jwt_required()
     @api.expect(review_model)
@@ -100,11 +152,18 @@ class ReviewResource(Resource):
 
 @api.route('/places/<place_id>')
 class PlaceReviewList(Resource):
+    @api.expect(fields_parser)
     @api.response(200, 'List of reviews for the place retrieved successfully')
+    @api.response(400, 'Invalid fields')
     @api.response(404, 'Place not found')
     def get(self, place_id):
         """Get all reviews for a specific place"""
-        reviews = facade.get_reviews_by_place(place_id)
+        try:
+            fields = requested_fields(review_serializer, PLACE_REVIEW_FIELDS)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        reviews = facade.get_place_reviews(place_id, review_serializer.columns(fields))
         if not reviews:
             return {"error": "Place not found"}, 404
-        return [{"id": review.id, "text": review.text, "rating": review.rating, "user_id": review.user_id} for review in facade.get_place(place_id).reviews], 200
+        return review_serializer.many(reviews, fields), 200
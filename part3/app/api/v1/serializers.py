@@ -0,0 +1,131 @@
+import json
+from flask import current_app, request
+from flask_restx import reqparse
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib encoder is used instead
+    orjson = None
+
+def dumps(data):
+    """Encode data to JSON bytes with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+def output_json(data, code, headers=None):
+    """flask-restx representation for application/json using dumps"""
+    response = current_app.response_class(dumps(data) + b"\n", status=code, mimetype="application/json")
+    response.headers.extend(headers or {})
+    return response
+
+fields_parser = reqparse.RequestParser()
+fields_parser.add_argument('fields', type=str, location='args', help='Comma-separated fields to return')
+
+def requested_fields(serializer, default=None, extra=()):
+    """
+    The fields named in ?fields=, or default when it is absent. Names must
+    be fields of serializer or in extra, ValueError otherwise.
+    """
+    value = request.args.get("fields")
+    if value is None:
+        return default
+    fields = tuple(dict.fromkeys(name.strip() for name in value.split(",") if name.strip()))
+    if not fields:
+        raise ValueError("No fields requested")
+    unknown = [name for name in fields if name not in serializer.fields and name not in extra]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    return fields
+
+class Serializer:
+    """
+    Turn model instances into dicts. fields maps every output name to the
+    attribute holding its value, read directly from the column attribute
+    where the public property only returns it. requires lists the column
+    attributes behind the fields that are computed properties.
+
+    The function for each subset of fields is generated once, as a single
+    dict literal, and shared by every endpoint asking for that subset.
+    """
+
+    def __init__(self, fields, requires=None):
+        for attribute in fields.values():
+            if not attribute.isidentifier():
+                raise ValueError(f"Invalid attribute name {attribute!r}")
+        self.fields = fields
+        self.requires = requires or {}
+        self._compiled = {}
+
+    def columns(self, fields=None):
+        """The column attributes to load to serialize fields, for SQLAlchemyRepository.project"""
+        columns = []
+        for name in (self.fields if fields is None else fields):
+            if name in self.fields:
+                columns.extend(self.requires.get(name, (self.fields[name],)))
+        return tuple(dict.fromkeys(columns))
+
+    def __call__(self, obj, fields=None):
+        return self.compile(fields)(obj)
+
+    def many(self, objs, fields=None):
+        serialize = self.compile(fields)
+        return [serialize(obj) for obj in objs]
+
+    @staticmethod
+    def _read(attribute):
+        # Loaded column values sit in the instance __dict__, reading them there
+        # skips the ORM descriptor; anything else (properties, unloaded or
+        # expired columns) goes through normal attribute access
+        return f"state[{attribute!r}] if {attribute!r} in state else obj.{attribute}"
+
+    def compile(self, fields=None):
+        """Return the function serializing fields (every field by default), ValueError if one is unknown"""
+        fields = tuple(self.fields) if fields is None else tuple(fields)
+        function = self._compiled.get(fields)
+        if function is None:
+            unknown = [name for name in fields if name not in self.fields]
+            if unknown:
+                raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+            items = ", ".join(f"{name!r}: {self._read(self.fields[name])}" for name in fields)
+            namespace = {}
+            exec(f"def serialize(obj):\n    state = obj.__dict__\n    return {{{items}}}", namespace)
+            function = self._compiled[fields] = namespace["serialize"]
+        return function
+
+user_serializer = Serializer({
+    "id": "id",
+    "first_name": "_first_name",
+    "last_name": "_last_name",
+    "email": "_email",
+})
+
+amenity_serializer = Serializer({
+    "id": "id",
+    "name": "_name",
+})
+
+place_serializer = Serializer({
+    "id": "id",
+    "title": "_title",
+    "description": "description",
+    "price": "_price",
+    "latitude": "_latitude",
+    "longitude": "_longitude",
+    "owner": "_owner_id",
+    "review_count": "review_count",
+    "average_rating": "average_rating",
+    "rating_histogram": "rating_histogram",
+}, requires={
+    "review_count": ("_review_count",),
+    "average_rating": ("_review_count", "_rating_sum"),
+    "rating_histogram": ("_ratings_1", "_ratings_2", "_ratings_3", "_ratings_4", "_ratings_5"),
+})
+
+review_serializer = Serializer({
+    "id": "id",
+    "text": "text",
+    "rating": "_rating",
+    "place_id": "place_id",
+    "user_id": "user_id",
+})
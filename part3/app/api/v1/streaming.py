@@ -0,0 +1,25 @@
+from flask import current_app, request, stream_with_context
+from .serializers import dumps
+
+NDJSON = "application/x-ndjson"
+
+def wants_ndjson():
+    """True when the Accept header prefers NDJSON over JSON"""
+    return request.accept_mimetypes.best_match(["application/json", NDJSON]) == NDJSON
+
+def stream_ndjson(rows, serialize, chunk_size=500):
+    """
+    Stream one JSON object per line while rows is iterated, so that
+    only one chunk of lines is ever held in memory
+    """
+    def generate():
+        lines = []
+        for row in rows:
+            lines.append(dumps(serialize(row)))
+            if len(lines) >= chunk_size:
+                yield b"\n".join(lines) + b"\n"
+                lines = []
+        if lines:
+            yield b"\n".join(lines) + b"\n"
+
+    return current_app.response_class(stream_with_context(generate()), mimetype=NDJSON)
@@ -1,6 +1,11 @@
 from flask_restx import Namespace, Resource, fields
 from flask_jwt_extended import get_jwt_identity, jwt_required
 from app import facade
+from app.hashing import HashingOverloadedError
+from .batch import batch_get
+from .conditional import conditional
+from .pagination import paginate, pagination_parser
+from .serializers import fields_parser, requested_fields, user_serializer
 
 api = Namespace('users', description='User operations')
 
@@ -30,28 +35,53 @@ class UserList(Resource):
         except ValueError as e:
             return {"error": "Invalid input data"}, 400
 
-        return { "id": new_user.id, "first_name": new_user.first_name, "last_name": new_user.last_name, "email": new_user.email }, 201
+        return user_serializer(new_user), 201
 
+    @api.expect(pagination_parser)
     @api.response(200, 'List of users retrieved successfully')
+    @api.response(400, 'Invalid limit, cursor or fields')
     def get(self):
-        """Retrieve a list of all users"""
-        return [
-            { "id": user.id, "first_name": user.first_name, "last_name": user.last_name, "email": user.email }
-            for user in facade.get_all_users()
-        ]
+        """Retrieve a page of users"""
+        return conditional(facade.get_users_version(), lambda: paginate(
+            facade.get_users_page, user_serializer, facade.iter_users
+        ))
+
+@api.route('/batch')
+class UserBatch(Resource):
+    @api.expect(fields_parser, [fields.String])
+    @api.response(200, 'Users found, in the order asked, and the missing IDs')
+    @api.response(400, 'Invalid list of IDs or fields')
+    def post(self):
+        """Get many users by ID in one request"""
+        return batch_get(api.payload, facade.get_users, user_serializer)
 
 @api.route('/<user_id>')
 class UserResource(Resource):
+    @api.expect(fields_parser)
     @api.response(200, 'User details retrieved successfully')
+    @api.response(304, 'User not modified')
+    @api.response(400, 'Invalid fields')
     @api.response(404, 'User not found')
     def get(self, user_id):
         """Get user details by ID"""
         try:
-            user = facade.get_user(user_id)
-            return { "id": user.id, "first_name": user.first_name, "last_name": user.last_name, "email": user.email }
-        except Exception as e:
+            fields = requested_fields(user_serializer)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        version = facade.get_user_version(user_id)
+        if not version:
             return {'error': 'User not found'}, 404
 
+        def representation():
+            try:
+                user = facade.get_user(user_id)
+                return user_serializer(user, fields), 200
+            except Exception as e:
+                return {'error': 'User not found'}, 404
+
+        return conditional(version, representation)
+
     @jwt_required()
     @api.expect(user_model)
     @api.response(200, 'User updated successfully')
@@ -73,6 +103,9 @@ class UserResource(Resource):
 
             if not user:
                 return {"error": "User not found"}, 404
-            return { "id": user.id, "first_name": user.first_name, "last_name": user.last_name, "email": user.email }
+            return user_serializer(user)
+        except HashingOverloadedError:
+            # A 503 with Retry-After, see create_app
+            raise
         except Exception as e:
             return {"error": "Invalid input data"}, 400
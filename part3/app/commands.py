@@ -0,0 +1,68 @@
+import json
+import click
+
+def register_commands(app):
+    @app.cli.command("check-ratings")
+    @click.option("--fix", is_flag=True, help="Overwrite drifted aggregates with the recomputed values.")
+    def check_ratings(fix):
+        """Recompute place rating aggregates from reviews and report drift."""
+        from app import facade
+
+        drift = facade.check_rating_aggregates(fix=fix)
+        for place in drift:
+            click.echo(f"{place['place_id']}: stored {place['stored']} actual {place['actual']}")
+
+        click.echo(f"{len(drift)} place(s) with drifted rating aggregates{', fixed' if fix and drift else ''}")
+        if drift and not fix:
+            raise click.exceptions.Exit(1)
+
+    @app.cli.command("upgrade-db")
+    @click.option("--dry-run", is_flag=True, help="List what is missing without creating it.")
+    def upgrade_db(dry_run):
+        """Create the tables, columns, indexes and virtual tables the database lacks."""
+        from app import db, facade
+        from app.migrations import pending, upgrade
+
+        if dry_run:
+            missing = pending(db)
+            created = [(kind, name) for kind, name, item in missing if item is not None]
+            unsupported = [(kind, name) for kind, name, item in missing if item is None]
+        else:
+            created, unsupported = upgrade(db)
+        for kind, name in created:
+            click.echo(f"{'missing' if dry_run else 'created'} {kind} {name}")
+        for kind, name in unsupported:
+            click.echo(f"skipped {kind} {name}, add it by hand")
+        click.echo(f"{len(created)} schema item(s) {'missing' if dry_run else 'created'}")
+
+        # Rating aggregate columns added to existing places start at 0
+        if not dry_run and any(kind == "column" and name.startswith("places.") for kind, name in created):
+            drift = facade.check_rating_aggregates(fix=True)
+            click.echo(f"{len(drift)} place(s) with rating aggregates recomputed from their reviews")
+        if unsupported:
+            raise click.exceptions.Exit(1)
+
+    @app.cli.command("index-advisor")
+    @click.argument("workload", type=click.File())
+    @click.option("--json", "as_json", is_flag=True, help="Print the report as JSON.")
+    def index_advisor(workload, as_json):
+        """Explain a captured workload (SQL_CAPTURE_PATH) and list the statements doing full scans."""
+        from app import db
+        from app.index_advisor import advise, read_workload
+
+        try:
+            report, unexplained = advise(db, read_workload(workload))
+        except ValueError as error:
+            raise click.BadParameter(str(error), param_hint="WORKLOAD")
+
+        if as_json:
+            click.echo(json.dumps({"full_scans": report, "unexplained": unexplained}, indent=2))
+        else:
+            for found in report:
+                click.echo(f"{found['count']}x {', '.join(found['routes']) or '<no request>'}: {'; '.join(found['scans'])}")
+                click.echo(f"    {' '.join(found['statement'].split())}")
+            click.echo(f"{len(report)} statement(s) with full scans")
+            if unexplained:
+                click.echo(f"{len(unexplained)} statement(s) not explained, is the schema up to date (flask upgrade-db)?")
+        if report or unexplained:
+            raise click.exceptions.Exit(1)
@@ -0,0 +1,73 @@
+import gzip
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional, only gzip is offered then
+    brotli = None
+
+# Bodies of other types (images, archives) are compressed already
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+class ResponseCompression:
+    """
+    Compress response bodies with the first of COMPRESSION_ENCODINGS that
+    the Accept-Encoding header of the request allows, br only when the
+    brotli package is installed. Bodies under COMPRESSION_MIN_SIZE bytes,
+    streams and responses already encoded are sent as they are.
+
+    A compressed body is another representation, so its ETag turns weak
+    (If-None-Match uses the weak comparison, see conditional).
+    """
+
+    def __init__(self, app=None):
+        self.encodings = ()
+        self.min_size = 0
+        self.levels = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.encodings = tuple(encoding for encoding in app.config.get('COMPRESSION_ENCODINGS', ())
+                               if encoding == "gzip" or (encoding == "br" and brotli is not None))
+        if not self.encodings:
+            return
+        self.min_size = app.config['COMPRESSION_MIN_SIZE']
+        self.levels = {"gzip": app.config['COMPRESSION_LEVEL'], "br": app.config['COMPRESSION_BROTLI_QUALITY']}
+        app.after_request(self._compress_response)
+
+    def compressible(self, response):
+        """Whether the body of response is worth compressing for some client"""
+        return (bool(self.encodings) and 200 <= response.status_code < 300
+                and response.status_code not in (204, 206)
+                and not response.is_streamed and not response.direct_passthrough
+                and "Content-Encoding" not in response.headers
+                and (response.mimetype or "").startswith(COMPRESSIBLE_TYPES)
+                and (response.content_length or 0) >= self.min_size)
+
+    def negotiate(self):
+        """The encoding to send to the client of the current request, None for none"""
+        return request.accept_encodings.best_match(self.encodings)
+
+    def encode(self, body, encoding):
+        if encoding == "br":
+            return brotli.compress(body, quality=self.levels["br"])
+        # mtime=0 keeps the output of a body the same from one call to the next
+        return gzip.compress(body, compresslevel=self.levels["gzip"], mtime=0)
+
+    def apply(self, response, body, encoding):
+        """Make response send body, the response body encoded with encoding"""
+        response.set_data(body)
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+
+    def _compress_response(self, response):
+        if not self.compressible(response):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = self.negotiate()
+        if encoding is not None:
+            self.apply(response, self.encode(response.get_data(), encoding), encoding)
+        return response
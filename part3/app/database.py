@@ -0,0 +1,128 @@
+import random
+import time
+from flask import current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.sql.dml import UpdateBase
+
+READ_BIND_PREFIX = "read_"
+
+# Read engine -> time until which it is skipped after a failure
+_failed_until = {}
+
+class RoutingSession(Session):
+    """
+    Session sending reads to one of the read binds (see configure_read_binds)
+    and writes to the default bind.
+
+    The first read picks a read bind, which serves the session until it
+    writes: from the first flush or DML statement every statement goes to
+    the default bind, so that a request reads its own writes. A read that
+    fails on a read bind marks it failed for DATABASE_REPLICA_RETRY_SECONDS
+    and is retried on the default bind.
+    """
+
+    def __init__(self, db, **kwargs):
+        super().__init__(db, **kwargs)
+        self._read_engine = None
+        self._wrote = False
+        self._last_engine = None
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or isinstance(clause, UpdateBase):
+                self._wrote = True
+            elif not self._wrote:
+                engine = self._read_engine
+                if engine is None:
+                    engine = self._read_engine = self._pick_read_engine()
+                if engine is not False:
+                    self._last_engine = engine
+                    return engine
+        self._last_engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        return self._last_engine
+
+    def _pick_read_engine(self):
+        """A random read engine that has not failed recently, False for the default bind"""
+        now = time.monotonic()
+        engines = [engine for key, engine in self._db.engines.items()
+                   if key and key.startswith(READ_BIND_PREFIX) and _failed_until.get(engine, 0) <= now]
+        return random.choice(engines) if engines else False
+
+    def _with_fallback(self, method, *args, **kwargs):
+        try:
+            return method(*args, **kwargs)
+        except OperationalError:
+            engine = self._read_engine
+            if not engine or self._last_engine is not engine or self._wrote or self.new or self.dirty or self.deleted:
+                raise
+            _failed_until[engine] = time.monotonic() + current_app.config.get('DATABASE_REPLICA_RETRY_SECONDS', 30)
+            current_app.logger.warning("Read bind %s failed, falling back to the primary", engine.url, exc_info=True)
+            # Nothing was written, the rollback only ends the read transactions
+            self.rollback()
+            self._read_engine = False
+            return method(*args, **kwargs)
+
+    def execute(self, *args, **kwargs):
+        return self._with_fallback(super().execute, *args, **kwargs)
+
+    def scalar(self, *args, **kwargs):
+        return self._with_fallback(super().scalar, *args, **kwargs)
+
+    def scalars(self, *args, **kwargs):
+        return self._with_fallback(super().scalars, *args, **kwargs)
+
+def configure_read_binds(app):
+    """
+    Add the read binds to SQLALCHEMY_BINDS: one per DATABASE_REPLICAS
+    URI, or else a second pool on the default database when
+    DATABASE_READ_POOL is set. They take the DATABASE_READ_POOL engine
+    options. Must run before db.init_app.
+    """
+    options = app.config.get('DATABASE_READ_POOL')
+    urls = app.config.get('DATABASE_REPLICAS') or []
+    if not urls and options is not None:
+        urls = [app.config['SQLALCHEMY_DATABASE_URI']]
+    if not urls:
+        return
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    for i, url in enumerate(urls):
+        binds[f"{READ_BIND_PREFIX}{i}"] = {"url": url, **(options or {})}
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+def apply_sqlite_pragmas(app, db, functions=None):
+    """
+    Run SQLITE_PRAGMAS on every new SQLite connection, and make the
+    connections of the read binds query_only. functions ({name: (number
+    of arguments, function)}) are registered on the connections as
+    deterministic SQL functions.
+    """
+    pragmas = app.config.get('SQLITE_PRAGMAS') or {}
+    with app.app_context():
+        for key, engine in db.engines.items():
+            if engine.dialect.name != "sqlite":
+                continue
+            if functions:
+                event.listen(engine, "connect", _functions_listener(functions))
+            statements = [f"PRAGMA {name} = {value}" for name, value in pragmas.items()]
+            if key and key.startswith(READ_BIND_PREFIX):
+                statements.append("PRAGMA query_only = 1")
+            if statements:
+                event.listen(engine, "connect", _pragma_listener(statements))
+
+def _functions_listener(functions):
+    def create_functions(dbapi_connection, connection_record):
+        for name, (arguments, function) in functions.items():
+            dbapi_connection.create_function(name, arguments, function, deterministic=True)
+    return create_functions
+
+def _pragma_listener(statements):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+    return set_pragmas
@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+class HashingOverloadedError(Exception):
+    """Raised when every hashing worker is busy and the queue is full"""
+
+class PasswordHasher:
+    """
+    Run bcrypt hashing and verification on a dedicated, bounded pool of
+    threads so that bursts of logins and sign-ups cannot starve the
+    request workers serving cheap reads.
+    """
+
+    def __init__(self, bcrypt, app=None):
+        self.bcrypt = bcrypt
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self._stats = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        workers = app.config.get('PASSWORD_HASH_WORKERS') or os.cpu_count() or 1
+        queue_limit = app.config.get('PASSWORD_HASH_QUEUE_LIMIT', 4 * workers)
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        # One slot per running task plus one per queued task
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+
+    def generate_password_hash(self, password):
+        return self._run('hash', self.bcrypt.generate_password_hash, password)
+
+    def check_password_hash(self, pw_hash, password):
+        return self._run('verify', self.bcrypt.check_password_hash, pw_hash, password)
+
+    def _run(self, operation, func, *args):
+        if self._executor is None:
+            return func(*args)
+
+        if not self._slots.acquire(blocking=False):
+            self._record(operation, rejected=True)
+            raise HashingOverloadedError("Password hashing queue is full")
+
+        queued_at = time.perf_counter()
+
+        def task():
+            started_at = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                self._record(operation, wait=started_at - queued_at, duration=time.perf_counter() - started_at)
+                self._slots.release()
+
+        return self._executor.submit(task).result()
+
+    def _record(self, operation, wait=0.0, duration=None, rejected=False):
+        with self._lock:
+            stats = self._stats.setdefault(operation, {
+                "count": 0, "rejected": 0, "wait": 0.0, "durations": deque(maxlen=1024)
+            })
+            if rejected:
+                stats["rejected"] += 1
+                return
+            stats["count"] += 1
+            stats["wait"] += wait
+            stats["durations"].append(duration)
+
+    def stats(self):
+        """Per-operation counters and latency percentiles, in milliseconds"""
+        result = {}
+        with self._lock:
+            for operation, stats in self._stats.items():
+                durations = sorted(stats["durations"])
+                result[operation] = {
+                    "count": stats["count"],
+                    "rejected": stats["rejected"],
+                    "avg_wait_ms": round(1000 * stats["wait"] / stats["count"], 3) if stats["count"] else None,
+                    "p50_ms": _percentile(durations, 0.50),
+                    "p95_ms": _percentile(durations, 0.95),
+                    "max_ms": _percentile(durations, 1.0),
+                }
+        return result
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    return round(1000 * values[min(len(values) - 1, int(fraction * len(values)))], 3)
@@ -0,0 +1,71 @@
+import json
+from sqlalchemy.exc import DBAPIError
+
+# Statements that read tables, INSERT ... VALUES never scans
+EXPLAINED = ("SELECT", "WITH", "UPDATE", "DELETE")
+
+def read_workload(lines):
+    """
+    Parse a workload captured by QueryInstrumentation (SQL_CAPTURE_PATH):
+    one JSON object per line with statement, parameters and route.
+    """
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+            entry["statement"]
+        except (ValueError, TypeError, KeyError):
+            raise ValueError(f"Line {number} is not a captured statement")
+        yield entry
+
+def full_scans(plan):
+    """
+    The steps of an EXPLAIN QUERY PLAN that read a whole table without an
+    index. Scans of virtual tables, subqueries and CTEs are left out.
+    """
+    derived = {detail.split(" ", 1)[1] for detail in plan if detail.startswith(("MATERIALIZE ", "CO-ROUTINE "))}
+    scans = []
+    for detail in plan:
+        if not detail.startswith("SCAN ") or "USING" in detail or "VIRTUAL TABLE" in detail:
+            continue
+        name = detail[len("SCAN "):]
+        if name != "CONSTANT ROW" and name not in derived:
+            scans.append(detail)
+    return scans
+
+def advise(db, workload):
+    """
+    Replay the distinct statements of workload (see read_workload) through
+    EXPLAIN QUERY PLAN on the database of db. Returns those still doing a
+    full scan, most frequent first, as dicts with the statement, how often
+    and from which routes it ran, and the scanning plan steps; then the
+    statements the schema could not explain, with the error.
+    """
+    statements = {}
+    for entry in workload:
+        statement = entry["statement"].strip()
+        if not statement.upper().startswith(EXPLAINED):
+            continue
+        found = statements.setdefault(statement, {"statement": statement, "count": 0, "routes": set(),
+                                                  "parameters": entry.get("parameters") or ()})
+        found["count"] += 1
+        if entry.get("route"):
+            found["routes"].add(entry["route"])
+
+    report, unexplained = [], []
+    with db.engine.connect() as connection:
+        for found in statements.values():
+            try:
+                rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {found['statement']}",
+                                                  tuple(found["parameters"])).fetchall()
+            except DBAPIError as error:
+                connection.rollback()
+                unexplained.append({"statement": found["statement"], "error": str(error.orig)})
+                continue
+            scans = full_scans([row[3] for row in rows])
+            if scans:
+                report.append({"statement": found["statement"], "count": found["count"],
+                               "routes": sorted(found["routes"]), "scans": scans})
+    report.sort(key=lambda found: -found["count"])
+    return report, unexplained
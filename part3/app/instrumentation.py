@@ -0,0 +1,79 @@
+import json
+import logging
+import threading
+import time
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+class QueryInstrumentation:
+    """
+    Count the statements each request sends to the database, time them,
+    and report the totals in a Server-Timing header. Statements slower
+    than SLOW_QUERY_THRESHOLD_MS are logged with their parameters and
+    the route that issued them. With SQL_CAPTURE_PATH, every statement
+    is also appended to that file as a JSON line for the index advisor.
+    """
+
+    def __init__(self, db, app=None):
+        self.db = db
+        self.slow_query_threshold = None
+        self.capture = None
+        self._capture_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get('SQL_INSTRUMENTATION', True):
+            return
+        threshold = app.config.get('SLOW_QUERY_THRESHOLD_MS')
+        self.slow_query_threshold = threshold / 1000 if threshold is not None else None
+        if app.config.get('SQL_CAPTURE_PATH'):
+            self.capture = open(app.config['SQL_CAPTURE_PATH'], 'a', buffering=1)
+
+        with app.app_context():
+            for engine in self.db.engines.values():
+                event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+                event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+        app.before_request(self._start_request)
+        app.after_request(self._add_server_timing)
+
+    def _start_request(self):
+        g.sql_stats = {"statements": 0, "duration": 0.0, "slowest": 0.0, "started_at": time.perf_counter()}
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started_at', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started_at'].pop()
+
+        route = None
+        if has_request_context():
+            route = f"{request.method} {request.url_rule.rule if request.url_rule else request.path}"
+            stats = g.get('sql_stats')
+            if stats is not None:
+                stats["statements"] += 1
+                stats["duration"] += elapsed
+                stats["slowest"] = max(stats["slowest"], elapsed)
+
+        if self.slow_query_threshold is not None and elapsed >= self.slow_query_threshold:
+            logger.warning("Slow query (%.1f ms) on %s: %s; parameters: %r",
+                           1000 * elapsed, route or "<no request>", statement, parameters)
+
+        if self.capture is not None:
+            line = json.dumps({"route": route, "statement": statement,
+                               "parameters": parameters[0] if executemany else parameters}, default=str)
+            with self._capture_lock:
+                self.capture.write(line + "\n")
+
+    def _add_server_timing(self, response):
+        stats = g.pop('sql_stats', None)
+        if stats is None:
+            return response
+        total = time.perf_counter() - stats["started_at"]
+        response.headers.add('Server-Timing', f'db;dur={1000 * stats["duration"]:.3f};desc="{stats["statements"]} statements"')
+        response.headers.add('Server-Timing', f'db-slowest;dur={1000 * stats["slowest"]:.3f}')
+        response.headers.add('Server-Timing', f'app;dur={1000 * total:.3f}')
+        return response
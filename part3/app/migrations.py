@@ -0,0 +1,93 @@
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateColumn
+
+def _addable(column):
+    """Whether ALTER TABLE ADD COLUMN can add column to a table that has rows"""
+    return not column.primary_key and (column.nullable or column.server_default is not None)
+
+def pending(db):
+    """
+    The schema items declared by the models that the database of db lacks,
+    as (kind, name, schema item) in creation order. kind is "table",
+    "column", "index" or "virtual table" (the SQLite virtual tables listed
+    in the info of a table, see PLACES_RTREE_DDL, whose item is the list
+    of statements creating and filling them). The virtual tables of a table
+    that lacks columns are rebuilt too, their triggers may need the new
+    columns.
+
+    Columns that existing rows cannot get (NOT NULL without a server
+    default) and the indexes on them come with the kind "unsupported
+    column" or "unsupported index" and no item.
+    """
+    inspector = inspect(db.engine)
+    tables = set(inspector.get_table_names())
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            # Created with its indexes and virtual tables
+            missing.append(("table", table.name, table))
+            continue
+
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        unsupported = set()
+        added = False
+        for column in table.columns:
+            if column.name in columns:
+                continue
+            if _addable(column):
+                added = True
+                missing.append(("column", f"{table.name}.{column.name}", column))
+            else:
+                unsupported.add(column.name)
+                missing.append(("unsupported column", f"{table.name}.{column.name}", None))
+
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name in indexes:
+                continue
+            if unsupported.intersection(column.name for column in index.columns):
+                missing.append(("unsupported index", index.name, None))
+            else:
+                missing.append(("index", index.name, index))
+
+        if db.engine.dialect.name == "sqlite":
+            missing += [("virtual table", name, statements)
+                        for name, statements in table.info.get("sqlite_virtual_tables", {}).items()
+                        if added or name not in tables]
+    return missing
+
+def upgrade(db):
+    """
+    Bring an existing database up to the models: create the missing tables,
+    with their indexes, triggers and virtual tables; add the missing
+    columns, indexes and virtual tables (filled from the existing rows) of
+    existing tables. All in one transaction, safe to run again.
+    Returns the (kind, name) pairs created, then those it cannot create.
+    """
+    missing = pending(db)
+    created, unsupported = [], []
+    with db.engine.begin() as connection:
+        for kind, name, item in missing:
+            if item is None:
+                unsupported.append((kind, name))
+                continue
+            if kind == "column":
+                table = connection.dialect.identifier_preparer.format_table(item.table)
+                ddl = CreateColumn(item).compile(dialect=connection.dialect)
+                connection.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {ddl}")
+            elif kind == "virtual table":
+                _drop_virtual_table(connection, name)
+                for statement in item:
+                    connection.exec_driver_sql(statement)
+            else:
+                item.create(connection)
+            created.append((kind, name))
+    return created, unsupported
+
+def _drop_virtual_table(connection, name):
+    """Drop the SQLite virtual table name, if any, and the triggers filling it"""
+    triggers = connection.exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND sql LIKE ?", (f"%{name}%",)).scalars().all()
+    for trigger in triggers:
+        connection.exec_driver_sql(f'DROP TRIGGER "{trigger}"')
+    connection.exec_driver_sql(f'DROP TABLE IF EXISTS "{name}"')
@@ -1,5 +1,6 @@
 import uuid
 from datetime import datetime
+from sqlalchemy.orm import declared_attr
 from app import db
 
 class BaseModel(db.Model):
@@ -8,3 +9,31 @@ class BaseModel(db.Model):
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     created_at = db.Column(db.DateTime, default=datetime.now)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    @classmethod
+    def _table_indexes(cls):
+        # Keyset pagination walks every table in (created_at, id) order,
+        # collection ETags read max(updated_at)
+        return (
+            db.Index(f"ix_{cls.__tablename__}_created_at_id", "created_at", "id"),
+            db.Index(f"ix_{cls.__tablename__}_updated_at", "updated_at"),
+        )
+
+    @declared_attr
+    def __table_args__(cls):
+        return cls._table_indexes()
+
+def search_rowid_ddl(table):
+    """
+    The SQLite statements numbering search_rowid, the integer key of the
+    rows of table in its search indexes (rowid is not stable for a table
+    with a text primary key, VACUUM may renumber it): the first numbers the
+    existing rows, the second opens the AFTER INSERT triggers of the
+    indexes. Both are idempotent, so the triggers may fire in any order.
+    """
+    return (
+        f"UPDATE {table} SET search_rowid = rowid + (SELECT coalesce(max(search_rowid), 0) FROM {table}) "
+        "WHERE search_rowid IS NULL",
+        f"UPDATE {table} SET search_rowid = (SELECT coalesce(max(search_rowid), 0) + 1 FROM {table}) "
+        "WHERE id = new.id AND search_rowid IS NULL;",
+    )
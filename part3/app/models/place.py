@@ -1,10 +1,13 @@
-from .base import BaseModel
+from sqlalchemy import DDL, event
+from .base import BaseModel, search_rowid_ddl
 from app import db
 
 place_amenities = db.Table(
     'place_amenities',
     db.Column('place_id', db.String(36), db.ForeignKey('places.id'), primary_key=True),
-    db.Column('amenity_id', db.String(36), db.ForeignKey('amenities.id'), primary_key=True)
+    db.Column('amenity_id', db.String(36), db.ForeignKey('amenities.id'), primary_key=True),
+    # The primary key serves place.amenities, this index amenity.places
+    db.Index('ix_place_amenities_amenity_id', 'amenity_id'),
 )
 
 class Place(BaseModel):
@@ -16,15 +19,57 @@ class Place(BaseModel):
     _latitude = db.Column("latitude", db.Float, nullable=False)
     _longitude = db.Column("longitude", db.Float, nullable=False)
     _owner_id = db.Column("owner", db.String(36), db.ForeignKey("users.id"), nullable=False)
+    # Key of the place in the SQLite search indexes, see search_rowid_ddl
+    _search_rowid = db.Column("search_rowid", db.Integer)
+
+    # Rating aggregates, maintained incrementally by HBnBFacade
+    _review_count = db.Column("review_count", db.Integer, nullable=False, default=0, server_default="0")
+    _rating_sum = db.Column("rating_sum", db.Integer, nullable=False, default=0, server_default="0")
+    _average_rating = db.Column("average_rating", db.Float, nullable=False, default=0.0, server_default="0")
+    _ratings_1 = db.Column("ratings_1", db.Integer, nullable=False, default=0, server_default="0")
+    _ratings_2 = db.Column("ratings_2", db.Integer, nullable=False, default=0, server_default="0")
+    _ratings_3 = db.Column("ratings_3", db.Integer, nullable=False, default=0, server_default="0")
+    _ratings_4 = db.Column("ratings_4", db.Integer, nullable=False, default=0, server_default="0")
+    _ratings_5 = db.Column("ratings_5", db.Integer, nullable=False, default=0, server_default="0")
 
     owner = db.relationship("User", back_populates="places")
     reviews = db.relationship("Review", back_populates="place", lazy="dynamic")
     amenities = db.relationship("Amenity", secondary=place_amenities, back_populates="places", lazy="dynamic")
 
+    @classmethod
+    def _table_indexes(cls):
+        return super()._table_indexes() + (
+            db.Index("ix_places_average_rating_id", "average_rating", "id"),
+            db.Index("ix_places_review_count_id", "review_count", "id"),
+            # Listing filters and the price sort
+            db.Index("ix_places_price_id", "price", "id"),
+            # Also serves user.places, owner is its leading column
+            db.Index("ix_places_owner_created_at_id", "owner", "created_at", "id"),
+            db.Index("ix_places_search_rowid", "search_rowid", unique=True),
+        )
+
     @property
     def owner_id(self):
         return self._owner_id
 
+    @property
+    def review_count(self):
+        return self._review_count or 0
+
+    @property
+    def rating_sum(self):
+        return self._rating_sum or 0
+
+    @property
+    def average_rating(self):
+        if not self.review_count:
+            return None
+        return round(self.rating_sum / self.review_count, 2)
+
+    @property
+    def rating_histogram(self):
+        return {str(rating): getattr(self, f"_ratings_{rating}") or 0 for rating in range(1, 6)}
+
     @property
     def title(self):
         return self._title
@@ -64,3 +109,57 @@ class Place(BaseModel):
         if not (-180.0 <= value <= 180.0):
             raise ValueError("Longitude must be between -180 and 180")
         self._longitude = value
+
+
+# On SQLite, places are mirrored into an R*Tree virtual table by triggers so
+# that radius and bounding-box searches only visit candidates inside the box.
+# Rows are keyed on places.search_rowid and carry the place id as auxiliary
+# column.
+PLACES_SEARCH_ROWID, PLACES_ASSIGN_SEARCH_ROWID = search_rowid_ddl("places")
+PLACES_RTREE_DDL = [
+    PLACES_SEARCH_ROWID,
+    "CREATE VIRTUAL TABLE IF NOT EXISTS places_rtree USING rtree(id, min_lat, max_lat, min_lng, max_lng, +place_id)",
+    "INSERT INTO places_rtree (id, min_lat, max_lat, min_lng, max_lng, place_id) "
+    "SELECT search_rowid, latitude, latitude, longitude, longitude, id FROM places",
+    "CREATE TRIGGER IF NOT EXISTS places_rtree_insert AFTER INSERT ON places BEGIN "
+    f"{PLACES_ASSIGN_SEARCH_ROWID} "
+    "INSERT INTO places_rtree (id, min_lat, max_lat, min_lng, max_lng, place_id) "
+    "SELECT search_rowid, latitude, latitude, longitude, longitude, id FROM places WHERE id = new.id; END",
+    "CREATE TRIGGER IF NOT EXISTS places_rtree_update AFTER UPDATE OF latitude, longitude ON places BEGIN "
+    "UPDATE places_rtree SET min_lat = new.latitude, max_lat = new.latitude, "
+    "min_lng = new.longitude, max_lng = new.longitude WHERE id = new.search_rowid; END",
+    "CREATE TRIGGER IF NOT EXISTS places_rtree_delete AFTER DELETE ON places BEGIN "
+    "DELETE FROM places_rtree WHERE id = old.search_rowid; END",
+]
+
+for statement in PLACES_RTREE_DDL:
+    event.listen(Place.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(Place.__table__, "before_drop", DDL("DROP TABLE IF EXISTS places_rtree").execute_if(dialect="sqlite"))
+
+# Full-text index over titles and descriptions, an external-content FTS5
+# table reading the places table and kept in sync by triggers, keyed on
+# search_rowid like the R*Tree.
+PLACES_FTS_DDL = [
+    PLACES_SEARCH_ROWID,
+    "CREATE VIRTUAL TABLE IF NOT EXISTS places_fts USING fts5(title, description, content='places', "
+    "content_rowid='search_rowid')",
+    "INSERT INTO places_fts (places_fts) VALUES ('rebuild')",
+    "CREATE TRIGGER IF NOT EXISTS places_fts_insert AFTER INSERT ON places BEGIN "
+    f"{PLACES_ASSIGN_SEARCH_ROWID} "
+    "INSERT INTO places_fts (rowid, title, description) "
+    "SELECT search_rowid, title, description FROM places WHERE id = new.id; END",
+    "CREATE TRIGGER IF NOT EXISTS places_fts_update AFTER UPDATE OF title, description ON places BEGIN "
+    "INSERT INTO places_fts (places_fts, rowid, title, description) "
+    "VALUES ('delete', old.search_rowid, old.title, old.description); "
+    "INSERT INTO places_fts (rowid, title, description) VALUES (new.search_rowid, new.title, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS places_fts_delete AFTER DELETE ON places BEGIN "
+    "INSERT INTO places_fts (places_fts, rowid, title, description) "
+    "VALUES ('delete', old.search_rowid, old.title, old.description); END",
+]
+
+for statement in PLACES_FTS_DDL:
+    event.listen(Place.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(Place.__table__, "before_drop", DDL("DROP TABLE IF EXISTS places_fts").execute_if(dialect="sqlite"))
+
+# For flask upgrade-db, on databases created before them
+Place.__table__.info["sqlite_virtual_tables"] = {"places_rtree": PLACES_RTREE_DDL, "places_fts": PLACES_FTS_DDL}
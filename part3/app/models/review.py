@@ -1,4 +1,5 @@
-from .base import BaseModel
+from sqlalchemy import DDL, event
+from .base import BaseModel, search_rowid_ddl
 from app import db
 
 class Review(BaseModel):
@@ -8,16 +9,52 @@ class Review(BaseModel):
     _rating = db.Column('rating', db.Integer, nullable=False)
     place_id = db.Column(db.String(36), db.ForeignKey('places.id'), nullable=False)
     user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
+    # Key of the review in the SQLite full-text index, see search_rowid_ddl
+    _search_rowid = db.Column('search_rowid', db.Integer)
 
     place = db.relationship('Place', back_populates='reviews')
     user = db.relationship('User', back_populates='reviews')
 
+    @classmethod
+    def _table_indexes(cls):
+        return super()._table_indexes() + (
+            # Serves place.reviews and the latest review write of a place, see PlacesRepository.get_version
+            db.Index("ix_reviews_place_id_updated_at", "place_id", "updated_at"),
+            db.Index("ix_reviews_user_id", "user_id"),
+            db.Index("ix_reviews_search_rowid", "search_rowid", unique=True),
+        )
+
     @property
     def rating(self):
         return self._rating
 
     @rating.setter
     def rating(self, value):
-        if not (1 <= value <= 5):
-            raise ValueError("Rating must be between 1 and 5")
+        # The rating aggregates of places have one column per integer rating
+        if isinstance(value, bool) or not isinstance(value, int) or not (1 <= value <= 5):
+            raise ValueError("Rating must be an integer between 1 and 5")
         self._rating = value
+
+
+# Full-text index over review texts, see PLACES_FTS_DDL
+REVIEWS_SEARCH_ROWID, REVIEWS_ASSIGN_SEARCH_ROWID = search_rowid_ddl("reviews")
+REVIEWS_FTS_DDL = [
+    REVIEWS_SEARCH_ROWID,
+    "CREATE VIRTUAL TABLE IF NOT EXISTS reviews_fts USING fts5(text, content='reviews', content_rowid='search_rowid')",
+    "INSERT INTO reviews_fts (reviews_fts) VALUES ('rebuild')",
+    "CREATE TRIGGER IF NOT EXISTS reviews_fts_insert AFTER INSERT ON reviews BEGIN "
+    f"{REVIEWS_ASSIGN_SEARCH_ROWID} "
+    "INSERT INTO reviews_fts (rowid, text) SELECT search_rowid, text FROM reviews WHERE id = new.id; END",
+    "CREATE TRIGGER IF NOT EXISTS reviews_fts_update AFTER UPDATE OF text ON reviews BEGIN "
+    "INSERT INTO reviews_fts (reviews_fts, rowid, text) VALUES ('delete', old.search_rowid, old.text); "
+    "INSERT INTO reviews_fts (rowid, text) VALUES (new.search_rowid, new.text); END",
+    "CREATE TRIGGER IF NOT EXISTS reviews_fts_delete AFTER DELETE ON reviews BEGIN "
+    "INSERT INTO reviews_fts (reviews_fts, rowid, text) VALUES ('delete', old.search_rowid, old.text); END",
+]
+
+for statement in REVIEWS_FTS_DDL:
+    event.listen(Review.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(Review.__table__, "before_drop", DDL("DROP TABLE IF EXISTS reviews_fts").execute_if(dialect="sqlite"))
+
+# For flask upgrade-db, see Place
+Review.__table__.info["sqlite_virtual_tables"] = {"reviews_fts": REVIEWS_FTS_DDL}
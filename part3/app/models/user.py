@@ -1,5 +1,5 @@
 from .base import BaseModel
-from app import bcrypt, db
+from app import db, hasher
 import re
 
 class User(BaseModel):
@@ -58,7 +58,7 @@ class User(BaseModel):
 
     @password.setter
     def password(self, password):
-        self._password = bcrypt.generate_password_hash(password).decode('utf-8')
+        self._password = hasher.generate_password_hash(password).decode('utf-8')
 
     def verify_password(self, password):
-        return bcrypt.check_password_hash(self._password, password)
+        return hasher.check_password_hash(self._password, password)
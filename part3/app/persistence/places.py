@@ -1,7 +1,366 @@
-from app.models.place import Place
+import math
+import re
+from app.models.amenity import Amenity
+from app.models.place import Place, place_amenities
+from app.models.review import Review
+from app.models.user import User
 from app.persistence.repository import SQLAlchemyRepository
 from app import db
 
+EARTH_RADIUS_KM = 6371.0088
+
+places_rtree = db.table(
+    "places_rtree",
+    db.column("id"), db.column("min_lat"), db.column("max_lat"),
+    db.column("min_lng"), db.column("max_lng"), db.column("place_id")
+)
+
+places_fts = db.table("places_fts", db.column("rowid"))
+reviews_fts = db.table("reviews_fts", db.column("rowid"))
+
+def fts_query(text):
+    """
+    Turn free text into an FTS5 query: every word must match, the last one
+    as a prefix. Returns None when there is no word to search for.
+    """
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    return " ".join(f'"{word}"' for word in words) + "*"
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points, in kilometers"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+# Registered on every SQLite connection, see apply_sqlite_pragmas
+SQLITE_FUNCTIONS = {"haversine_km": (4, haversine_km)}
+
+def distance_km(lat, lng):
+    """SQL expression of the haversine_km distance from (lat, lng) to each place"""
+    if db.session.get_bind().dialect.name == "sqlite":
+        return db.func.haversine_km(lat, lng, Place._latitude, Place._longitude)
+    f = db.func
+    a = (f.pow(f.sin(f.radians(Place._latitude - lat) / 2.0), 2)
+         + math.cos(math.radians(lat)) * f.cos(f.radians(Place._latitude))
+         * f.pow(f.sin(f.radians(Place._longitude - lng) / 2.0), 2))
+    return 2 * EARTH_RADIUS_KM * f.asin(f.sqrt(f.least(a, 1.0)))
+
+def radius_boxes(lat, lng, radius_km):
+    """
+    Return the (south, north, west, east) boxes covering a circle, split in
+    two when it crosses the antimeridian and widened to every longitude when
+    it reaches a pole.
+    """
+    angle = radius_km / EARTH_RADIUS_KM
+    south, north = lat - math.degrees(angle), lat + math.degrees(angle)
+    if south <= -90.0 or north >= 90.0 or angle >= math.pi / 2:
+        return [(max(south, -90.0), min(north, 90.0), -180.0, 180.0)]
+
+    ratio = math.sin(angle) / math.cos(math.radians(lat))
+    if ratio >= 1.0:
+        return [(south, north, -180.0, 180.0)]
+    delta = math.degrees(math.asin(ratio))
+    return viewport_boxes(south, lng - delta, north, lng + delta)
+
+def viewport_boxes(south, west, north, east):
+    """Normalize a viewport whose longitudes may wrap around +/-180"""
+    if east - west >= 360.0:
+        return [(south, north, -180.0, 180.0)]
+    if west < -180.0:
+        west += 360.0
+    if east > 180.0:
+        east -= 360.0
+    if west <= east:
+        return [(south, north, west, east)]
+    return [(south, north, west, 180.0), (south, north, -180.0, east)]
+
+RATING_COLUMNS = {rating: getattr(Place, f"_ratings_{rating}") for rating in range(1, 6)}
+
 class PlacesRepository(SQLAlchemyRepository):
+    SORTS = {
+        "created_at": Place.created_at,
+        "price": Place._price,
+        "rating": Place._average_rating,
+        "review_count": Place._review_count,
+    }
+
     def __init__(self):
         super().__init__(Place)
+
+    def get_listing(self, limit, cursor=None, sort="created_at", columns=None, filters=None):
+        """
+        Page through places ordered by one of SORTS, prefixed with '-' for
+        descending order, and matching filters (see _filtered)
+        """
+        descending = sort.startswith("-")
+        return self.get_page(limit, cursor, query=self._filtered(filters), sort=self.SORTS[sort.lstrip("-")],
+                             descending=descending, columns=columns)
+
+    def iter_listing(self, cursor=None, sort="created_at", batch_size=1000, columns=None, filters=None):
+        """Iterate over every place in the order of get_listing, see iter_all"""
+        descending = sort.startswith("-")
+        return self.iter_all(cursor, query=self._filtered(filters), sort=self.SORTS[sort.lstrip("-")],
+                             descending=descending, batch_size=batch_size, columns=columns)
+
+    def _filtered(self, filters):
+        """
+        Places matching every filter: min_price, max_price, owner_id,
+        min_rating and amenities, a list of amenity IDs the place must all
+        have. Each amenity is an EXISTS probe on the place_amenities key.
+        """
+        query = self.model.query
+        filters = filters or {}
+        if filters.get("min_price") is not None:
+            query = query.filter(Place._price >= filters["min_price"])
+        if filters.get("max_price") is not None:
+            query = query.filter(Place._price <= filters["max_price"])
+        if filters.get("owner_id") is not None:
+            query = query.filter(Place._owner_id == filters["owner_id"])
+        if filters.get("min_rating") is not None:
+            query = query.filter(Place._review_count > 0, Place._average_rating >= filters["min_rating"])
+        for amenity_id in dict.fromkeys(filters.get("amenities") or ()):
+            query = query.filter(db.exists().where(
+                place_amenities.c.place_id == Place.id, place_amenities.c.amenity_id == amenity_id
+            ))
+        return query
+
+    def get_ids_by_owner(self, owner_id):
+        return [row.id for row in db.session.query(Place.id).filter(Place._owner_id == owner_id)]
+
+    def get_ids_by_amenity(self, amenity_id):
+        query = db.session.query(place_amenities.c.place_id).filter(place_amenities.c.amenity_id == amenity_id)
+        return [row.place_id for row in query]
+
+    def delete_cascade(self, place_id):
+        """
+        Delete a place with its reviews and amenity links, one DELETE per
+        table whatever their number. The amenities themselves are shared and
+        kept. Returns {"reviews": n, "amenity_links": n}, or None if the
+        place does not exist. Not committed.
+        """
+        # The rows referencing the place go first, for the foreign keys
+        links = db.session.execute(
+            db.delete(place_amenities).where(place_amenities.c.place_id == place_id)
+        ).rowcount
+        # "fetch" also removes the loaded reviews from the session, expired
+        # ones included, with RETURNING where the database has it
+        reviews = db.session.execute(
+            db.delete(Review).where(Review.place_id == place_id).execution_options(synchronize_session="fetch")
+        ).rowcount
+        deleted = db.session.execute(
+            db.delete(Place).where(Place.id == place_id).execution_options(synchronize_session=False)
+        ).rowcount
+        if not deleted:
+            return None
+
+        place = db.session.identity_map.get(db.inspect(Place).identity_key_from_primary_key([place_id]))
+        if place is not None:
+            db.session.expunge(place)
+        return {"reviews": reviews, "amenity_links": links}
+
+    def apply_rating_deltas(self, place_id, deltas):
+        """
+        Add deltas ({rating: number of reviews added or removed}) to the
+        aggregates of a place with a single UPDATE, computed by the database
+        so that concurrent writers cannot lose increments. Not committed.
+        Raises ValueError for a rating that is not an integer from 1 to 5.
+        """
+        if any(isinstance(rating, bool) or rating not in RATING_COLUMNS for rating in deltas):
+            raise ValueError("Rating must be an integer between 1 and 5")
+        count = sum(deltas.values())
+        total = sum(rating * n for rating, n in deltas.items())
+        new_count = Place._review_count + count
+        new_sum = Place._rating_sum + total
+
+        values = {Place._review_count: new_count, Place._rating_sum: new_sum}
+        values[Place._average_rating] = db.case((new_count > 0, new_sum * 1.0 / new_count), else_=0.0)
+        for rating, n in deltas.items():
+            if n:
+                values[RATING_COLUMNS[rating]] = RATING_COLUMNS[rating] + n
+
+        db.session.execute(
+            db.update(Place).where(Place.id == place_id).values(values)
+            .execution_options(synchronize_session=False)
+        )
+        identity = db.inspect(Place).identity_key_from_primary_key([place_id])
+        place = db.session.identity_map.get(identity)
+        if place is not None:
+            db.session.expire(place)
+
+    def find_rating_drift(self):
+        """Recompute every aggregate from the reviews table and return the places that disagree"""
+        actual = {}
+        histogram = [db.func.sum(db.case((Review._rating == rating, 1), else_=0)) for rating in RATING_COLUMNS]
+        rows = db.session.query(Review.place_id, db.func.count(), db.func.sum(Review._rating), *histogram)
+        for place_id, count, total, *ratings in rows.group_by(Review.place_id):
+            actual[place_id] = (count, total, *ratings)
+
+        drift = []
+        stored = db.session.query(Place.id, Place._review_count, Place._rating_sum, *RATING_COLUMNS.values())
+        for place_id, *values in stored.execution_options(yield_per=1000):
+            expected = actual.get(place_id, (0, 0, 0, 0, 0, 0, 0))
+            if tuple(values) != expected:
+                drift.append({
+                    "place_id": place_id,
+                    "stored": self._aggregates(values),
+                    "actual": self._aggregates(expected),
+                })
+        return drift
+
+    def set_rating_aggregates(self, place_id, review_count, rating_sum, histogram):
+        """Overwrite the aggregates of a place, histogram is {"1": n, ..., "5": n}. Not committed."""
+        values = {Place._review_count: review_count, Place._rating_sum: rating_sum}
+        values[Place._average_rating] = rating_sum / review_count if review_count else 0.0
+        for rating, column in RATING_COLUMNS.items():
+            values[column] = histogram[str(rating)]
+        db.session.execute(
+            db.update(Place).where(Place.id == place_id).values(values)
+            .execution_options(synchronize_session=False)
+        )
+
+    @staticmethod
+    def _aggregates(values):
+        count, total, *ratings = values
+        return {
+            "review_count": count,
+            "rating_sum": total,
+            "rating_histogram": {str(rating): n for rating, n in zip(RATING_COLUMNS, ratings)},
+        }
+
+    def get_detail(self, place_id, columns=None, include=("owner", "reviews", "amenities")):
+        """
+        Load a place with its owner, reviews and amenities in three statements:
+        the owner is joined onto the place row and each dynamic collection is
+        fetched with a single query, whatever the number of reviews.
+        Relations missing from include are not loaded and returned as None,
+        columns restricts the place columns loaded.
+        """
+        query = self.project(self.model.query, columns)
+        if "owner" in include:
+            query = query.options(db.joinedload(Place.owner))
+        place = query.filter_by(id=place_id).first()
+        if not place:
+            return None
+        reviews = place.reviews.all() if "reviews" in include else None
+        amenities = place.amenities.all() if "amenities" in include else None
+        return place, reviews, amenities
+
+    def get_collection_version(self):
+        """As for every table, plus the amenity links that the amenity filter reads"""
+        links = db.session.query(db.func.count()).select_from(place_amenities).scalar()
+        return super().get_collection_version() + (links,)
+
+    def get_version(self, place_id):
+        """
+        Timestamps and counts covering everything get_detail returns, in
+        one statement: the place (its rating aggregates included), the
+        owner, the latest review write and the linked amenities.
+        """
+        reviews = db.select(db.func.max(Review.updated_at)).where(Review.place_id == Place.id)
+        amenity_links = place_amenities.join(Amenity, Amenity.id == place_amenities.c.amenity_id)
+        amenity_count = db.select(db.func.count()).select_from(amenity_links).where(place_amenities.c.place_id == Place.id)
+        amenity_updated = db.select(db.func.max(Amenity.updated_at)).select_from(amenity_links).where(place_amenities.c.place_id == Place.id)
+
+        row = db.session.execute(
+            db.select(
+                Place.updated_at, User.updated_at, reviews.scalar_subquery(),
+                amenity_count.scalar_subquery(), amenity_updated.scalar_subquery(),
+            ).outerjoin(User, User.id == Place._owner_id).where(Place.id == place_id)
+        ).first()
+        return tuple(row) if row else None
+
+    def search_nearby(self, lat, lng, radius_km, limit, columns=None):
+        """Return up to limit (place, distance_km) pairs within radius_km, nearest first"""
+        distance = distance_km(lat, lng)
+        return self._nearest(radius_boxes(lat, lng, radius_km), distance, limit, columns, distance <= radius_km)
+
+    def search_viewport(self, south, west, north, east, limit, columns=None):
+        """Return up to limit (place, distance_km) pairs inside a viewport, nearest to its center first"""
+        lat = (south + north) / 2
+        lng = west + ((east - west) % 360.0) / 2
+        if lng > 180.0:
+            lng -= 360.0
+
+        return self._nearest(viewport_boxes(south, west, north, east), distance_km(lat, lng), limit, columns)
+
+    def _nearest(self, boxes, distance, limit, columns=None, condition=None):
+        """
+        The limit (place, distance) pairs nearest first among the places
+        inside any of the (south, north, west, east) boxes that meet
+        condition. The database ranks the candidates by distance, only the
+        limit nearest are loaded whatever the size of the boxes.
+        """
+        distance = distance.label("distance")
+        query = self.project(db.session.query(Place, distance), columns)
+        if db.session.get_bind().dialect.name == "sqlite":
+            rtree = places_rtree.c
+            query = query.join(places_rtree, rtree.place_id == Place.id)
+            lat, lng = (rtree.min_lat, rtree.max_lat), (rtree.min_lng, rtree.max_lng)
+        else:
+            lat, lng = (Place._latitude, Place._latitude), (Place._longitude, Place._longitude)
+
+        query = query.filter(db.or_(*[
+            db.and_(lat[1] >= south, lat[0] <= north, lng[1] >= west, lng[0] <= east)
+            for south, north, west, east in boxes
+        ]))
+        if condition is not None:
+            query = query.filter(condition)
+        return [tuple(row) for row in query.order_by(distance, Place.id).limit(limit)]
+
+    def search_text(self, text, limit, include_reviews=False, columns=None):
+        """
+        Return up to limit (place, rank, snippet) triples matching text,
+        best BM25 rank first. With include_reviews, places whose reviews
+        match are returned too, with a snippet of the best matching review.
+        """
+        match = fts_query(text)
+        if match is None:
+            return []
+        if db.session.get_bind().dialect.name != "sqlite":
+            return self._search_text_fallback(text, limit, columns)
+
+        fts = db.literal_column("places_fts")
+        # Matches in titles weigh ten times more than in descriptions
+        rank = db.func.bm25(fts, 10.0, 1.0).label("rank")
+        snippet = db.func.snippet(fts, -1, "[", "]", "...", 12).label("snippet")
+        results = (
+            self.project(db.session.query(Place, rank, snippet), columns)
+            .join(places_fts, places_fts.c.rowid == Place._search_rowid)
+            .filter(fts.op("MATCH")(match))
+            .order_by(rank).limit(limit).all()
+        )
+        if not include_reviews:
+            return results
+
+        fts = db.literal_column("reviews_fts")
+        rank = db.func.bm25(fts).label("rank")
+        snippet = db.func.snippet(fts, 0, "[", "]", "...", 12).label("snippet")
+        hits = (
+            db.session.query(Review.place_id, rank, snippet)
+            .join(reviews_fts, reviews_fts.c.rowid == Review._search_rowid)
+            .filter(fts.op("MATCH")(match))
+            .order_by(rank).limit(limit * 10).all()
+        )
+
+        best = {place.id: (place, place_rank, place_snippet) for place, place_rank, place_snippet in results}
+        review_hits = {}
+        for place_id, review_rank, review_snippet in hits:
+            if place_id not in best and place_id not in review_hits:
+                review_hits[place_id] = (review_rank, review_snippet)
+        if review_hits:
+            for place in self.project(self.model.query, columns).filter(Place.id.in_(list(review_hits))):
+                best[place.id] = (place, *review_hits[place.id])
+
+        return sorted(best.values(), key=lambda result: result[1])[:limit]
+
+    def _search_text_fallback(self, text, limit, columns=None):
+        """Unranked LIKE search for databases without FTS5"""
+        query = self.project(self.model.query, columns)
+        for word in re.findall(r"\w+", text):
+            pattern = f"%{word}%"
+            query = query.filter(db.or_(Place._title.ilike(pattern), Place.description.ilike(pattern)))
+        return [(place, None, None) for place in query.limit(limit)]
@@ -1,4 +1,9 @@
 from abc import ABC, abstractmethod
+import base64
+import binascii
+import json
+from contextlib import contextmanager
+from datetime import datetime
 from app import db
 
 class Repository(ABC):
@@ -6,14 +11,26 @@ class Repository(ABC):
     def add(self, obj):
         pass
 
+    @abstractmethod
+    def add_many(self, objs, batch_size=1000):
+        pass
+
     @abstractmethod
     def get(self, obj_id):
         pass
 
+    @abstractmethod
+    def get_many(self, ids):
+        pass
+
     @abstractmethod
     def get_all(self):
         pass
 
+    @abstractmethod
+    def get_page(self, limit, cursor=None):
+        pass
+
     @abstractmethod
     def update(self, obj_id, data):
         pass
@@ -26,33 +43,198 @@ class Repository(ABC):
     def get_by_attribute(self, attr_name, attr_value):
         pass
 
+@contextmanager
+def unit_of_work():
+    """
+    Run the block as one transaction: repository writes inside it are not
+    committed one by one, the outermost block commits them all on exit or
+    rolls them all back if it raises. Blocks nest, inner ones join the
+    outer transaction.
+    """
+    info = db.session.info
+    depth = info.get("unit_of_work", 0)
+    info["unit_of_work"] = depth + 1
+    try:
+        yield
+        if depth == 0:
+            db.session.commit()
+    except BaseException:
+        if depth == 0:
+            db.session.rollback()
+        raise
+    finally:
+        info["unit_of_work"] = depth
+
+def in_unit_of_work():
+    return db.session.info.get("unit_of_work", 0) > 0
+
+def encode_cursor(value, obj_id):
+    """Pack the sort key of the last row of a page into an opaque token"""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([value, obj_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor, column):
+    """Unpack a token made by encode_cursor, raise ValueError if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, obj_id = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+    if not isinstance(obj_id, str):
+        raise ValueError("Invalid cursor")
+    # Sort keys are strings, numbers or NULL, anything else would reach the database
+    if value is not None and (isinstance(value, bool) or not isinstance(value, (str, int, float))):
+        raise ValueError("Invalid cursor")
+    if value is not None and column.type.python_type is datetime:
+        # A crafted cursor can hold any JSON value in place of the ISO string
+        try:
+            value = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid cursor")
+    return value, obj_id
+
 class SQLAlchemyRepository(Repository):
     def __init__(self, model):
         self.model = model
 
+    @staticmethod
+    def _commit(flush=False):
+        """
+        Commit, or inside unit_of_work leave it to the end of the unit and
+        only flush when flush is set
+        """
+        if in_unit_of_work():
+            if flush:
+                db.session.flush()
+            return
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
     def add(self, obj):
         db.session.add(obj)
-        db.session.commit()
+        # Flushed inside a unit of work too, so that obj gets its id
+        self._commit(flush=True)
+
+    def add_many(self, objs, batch_size=1000):
+        """Insert objs with one flush per batch_size objects and a single commit"""
+        with unit_of_work():
+            for start in range(0, len(objs), batch_size):
+                db.session.add_all(objs[start:start + batch_size])
+                db.session.flush()
+
+    def get_existing_ids(self, ids, chunk_size=500):
+        """Return the subset of ids that exist, without loading the rows"""
+        ids, found = list({i for i in ids if isinstance(i, str)}), set()
+        for start in range(0, len(ids), chunk_size):
+            rows = db.session.query(self.model.id).filter(self.model.id.in_(ids[start:start + chunk_size]))
+            found.update(row.id for row in rows)
+        return found
 
     def get(self, obj_id):
         return self.model.query.get(obj_id)
 
+    def get_many(self, ids, columns=None, chunk_size=500):
+        """
+        The objects with the given ids in the order asked, once each, unknown
+        ids are skipped. One IN query per chunk_size ids, see project for
+        columns.
+        """
+        ids = list(dict.fromkeys(i for i in ids if isinstance(i, str)))
+        found = {}
+        for start in range(0, len(ids), chunk_size):
+            query = self.model.query.filter(self.model.id.in_(ids[start:start + chunk_size]))
+            found.update((obj.id, obj) for obj in self.project(query, columns))
+        return [found[i] for i in ids if i in found]
+
     def get_all(self):
         return self.model.query.all()
 
+    def project(self, query, columns):
+        """
+        Load only the named column attributes of the model in query, the
+        primary key is always loaded. Other attributes are loaded on access.
+        """
+        if not columns:
+            return query
+        return query.options(db.load_only(*(getattr(self.model, name) for name in dict.fromkeys(columns))))
+
+    def get_version(self, obj_id):
+        """
+        Values that change whenever obj_id is written, read without loading
+        the entity, or None if it does not exist
+        """
+        row = db.session.query(self.model.updated_at).filter(self.model.id == obj_id).first()
+        return tuple(row) if row else None
+
+    def get_collection_version(self):
+        """Row count and latest write of the table, which change with any insert, update or delete"""
+        # count(*) rather than count(id) so that the updated_at index covers the query
+        return tuple(db.session.query(db.func.count(), db.func.max(self.model.updated_at)).select_from(self.model).one())
+
+    def get_page(self, limit, cursor=None, query=None, sort=None, descending=False, columns=None):
+        """
+        Return (items, next_cursor) for one page ordered by (sort, id).
+
+        Pages are fetched by seeking past the (sort, id) pair stored in the
+        cursor rather than with OFFSET, so every page costs one index range
+        scan no matter how deep the client has paged.
+        With columns, only those attributes (and the sort key) are loaded.
+        """
+        query, sort = self._ordered(query, cursor, sort, descending, columns)
+        items = query.limit(limit + 1).all()
+        if len(items) <= limit:
+            return items, None
+
+        items = items[:limit]
+        last = items[-1]
+        return items, encode_cursor(getattr(last, sort.key), last.id)
+
+    def iter_all(self, cursor=None, query=None, sort=None, descending=False, batch_size=1000, columns=None):
+        """
+        Return an iterable over every row after cursor in the order of
+        get_page. Nothing runs until it is iterated, then rows are fetched
+        batch_size at a time so that memory does not grow with the table.
+        An invalid cursor raises ValueError right away.
+        """
+        query, sort = self._ordered(query, cursor, sort, descending, columns)
+        return query.yield_per(batch_size)
+
+    def _ordered(self, query, cursor, sort, descending, columns=None):
+        if query is None:
+            query = self.model.query
+        if sort is None:
+            sort = self.model.created_at
+        if columns:
+            query = self.project(query, (*columns, sort.key))
+
+        key = db.tuple_(sort, self.model.id)
+        if cursor:
+            after = db.tuple_(*decode_cursor(cursor, sort))
+            query = query.filter(key < after if descending else key > after)
+
+        if descending:
+            return query.order_by(sort.desc(), self.model.id.desc()), sort
+        return query.order_by(sort, self.model.id), sort
+
     def update(self, obj_id, data):
         obj = self.get(obj_id)
         if obj:
             for key, value in data.items():
                 setattr(obj, key, value)
-            db.session.commit()
+            self._commit()
         return obj
 
     def delete(self, obj_id):
         obj = self.get(obj_id)
         if obj:
             db.session.delete(obj)
-            db.session.commit()
+            self._commit()
 
     def get_by_attribute(self, attr_name, attr_value):
         return self.model.query.filter_by(**{attr_name: attr_value}).first()
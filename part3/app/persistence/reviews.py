@@ -5,3 +5,8 @@ from app import db
 class ReviewsRepository(SQLAlchemyRepository):
     def __init__(self):
         super().__init__(Review)
+
+    def get_by_place(self, place_id, columns=None):
+        """Every review of a place, oldest first"""
+        query = self.project(self.model.query, columns).filter(Review.place_id == place_id)
+        return query.order_by(Review.created_at, Review.id).all()
@@ -0,0 +1,179 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+class Cache(ABC):
+    """
+    Key/value store used by the facade. Values are only ever read back by
+    the process that asked for them, so a backend for a shared cache only
+    has to be able to round-trip them (e.g. by pickling).
+    """
+
+    @abstractmethod
+    def get(self, key):
+        pass
+
+    @abstractmethod
+    def set(self, key, value):
+        pass
+
+    @abstractmethod
+    def delete(self, key):
+        pass
+
+    @abstractmethod
+    def clear(self):
+        pass
+
+    @abstractmethod
+    def stats(self):
+        pass
+
+class LRUCache(Cache):
+    """In-process cache evicting the least recently used entry, entries expire after ttl seconds"""
+
+    def __init__(self, maxsize=1024, ttl=60, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                self._counters["expirations"] += 1
+                self._counters["misses"] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return dict(
+                self._counters,
+                size=len(self._entries),
+                maxsize=self.maxsize,
+                hit_ratio=round(self._counters["hits"] / lookups, 4) if lookups else None
+            )
+
+class ResponseCache:
+    """
+    In-process cache of rendered responses, least recently used first out
+    once their bodies exceed maxbytes, expiring after ttl seconds. Each
+    entry carries tags (e.g. "places", "places:<id>") and invalidate(tag)
+    drops every entry carrying it.
+
+    epoch counts the invalidations: a value rendered from data read before
+    one may be stale, so set skips it when given an older epoch.
+    """
+
+    def __init__(self, maxbytes=64 * 1024 * 1024, ttl=30, clock=time.monotonic):
+        self.maxbytes = maxbytes
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, value, size, tags)
+        self._tags = {}  # tag -> set of keys
+        self._size = 0
+        self.epoch = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            if entry[0] <= self._clock():
+                self._remove(key)
+                self._counters["expirations"] += 1
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return entry[1]
+
+    def set(self, key, value, size, tags=(), epoch=None):
+        """Store value, whose size in bytes counts towards maxbytes, under key"""
+        if size > self.maxbytes:
+            return
+        with self._lock:
+            if epoch is not None and epoch != self.epoch:
+                return
+            self._remove(key)
+            self._entries[key] = (self._clock() + self.ttl, value, size, tuple(tags))
+            self._size += size
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while self._size > self.maxbytes:
+                self._remove(next(iter(self._entries)))
+                self._counters["evictions"] += 1
+
+    def invalidate(self, *tags):
+        with self._lock:
+            self.epoch += 1
+            for tag in tags:
+                for key in self._tags.pop(tag, ()):
+                    if key in self._entries:
+                        self._remove(key)
+                        self._counters["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self._size = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._size -= entry[2]
+        for tag in entry[3]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return dict(
+                self._counters,
+                size=len(self._entries),
+                bytes=self._size,
+                maxbytes=self.maxbytes,
+                hit_ratio=round(self._counters["hits"] / lookups, 4) if lookups else None
+            )
@@ -1,16 +1,144 @@
+import threading
 from app.persistence.user import UserRepository
 from app.persistence.amenities import AmenitiesRepository
 from app.persistence.places import PlacesRepository
 from app.persistence.reviews import ReviewsRepository
+from app.persistence.repository import in_unit_of_work, unit_of_work
 from app.models import *
+from app import db
+from sqlalchemy import event
 
 
+def _required(data, name):
+    """data[name], KeyError as for a missing field when it is null"""
+    value = data[name]
+    if value is None:
+        raise KeyError(name)
+    return value
+
+def _after_commit(invalidate, keys):
+    """Call invalidate(*keys) again once the transaction of the session commits"""
+    pending = db.session.info.setdefault("invalidate_after_commit", {})
+    pending.setdefault(invalidate, set()).update(keys)
+
+def _invalidate_committed(session):
+    for invalidate, keys in session.info.pop("invalidate_after_commit", {}).items():
+        invalidate(*keys)
+
+# Once for all the facades, which queue their invalidations in the session
+event.listen(db.session, "after_commit", _invalidate_committed)
+
 class HBnBFacade:
-    def __init__(self):
+    def __init__(self, cache=None, response_cache=None):
         self.user_repo = UserRepository()
         self.place_repo = PlacesRepository()
         self.review_repo = ReviewsRepository()
         self.amenity_repo = AmenitiesRepository()
+        self.cache = cache
+        # Bumped by every entity cache invalidation, see _cached_get
+        self._cache_generation = 0
+        self._cache_lock = threading.Lock()
+        self.response_cache = response_cache
+
+    def transaction(self):
+        """
+        Context manager grouping facade calls into one transaction, committed
+        once at the end of the block and rolled back as a whole on error:
+
+            with facade.transaction():
+                facade.delete_review(review_id)
+                facade.delete_place(place_id)
+        """
+        return unit_of_work()
+
+    def _cached_get(self, repo, obj_id):
+        """
+        Read-through lookup by id. The cache keeps a detached copy of each
+        entity and callers get it merged into the current session without a
+        SELECT, so they can use it like any freshly loaded object.
+
+        A row loaded inside a transaction, or before an invalidation made
+        while it was loading, is returned but not cached: it may be rolled
+        back or already stale.
+        """
+        if self.cache is None:
+            return repo.get(obj_id)
+
+        # An instance already in the session is the freshest copy there is
+        identity = db.inspect(repo.model).identity_key_from_primary_key([obj_id])
+        current = db.session.identity_map.get(identity)
+        if current is not None:
+            return current
+
+        key = f"{repo.model.__tablename__}:{obj_id}"
+        cached = self.cache.get(key)
+        if cached is not None:
+            return db.session.merge(cached, load=False)
+
+        generation = self._cache_generation
+        obj = repo.get(obj_id)
+        if obj is None or in_unit_of_work() or generation != self._cache_generation:
+            return obj
+
+        db.session.expunge(obj)
+        self.cache.set(key, obj)
+        return db.session.merge(obj, load=False)
+
+    def _create_many(self, repo, factory, items, batch_size, prepare=None):
+        """
+        Build every object first so that validation errors are reported per
+        item, then insert the valid ones in batches inside one transaction.
+        prepare(objs) runs in that transaction before the insert.
+        Returns one (obj, error) pair per item, in order.
+        """
+        results, objs = [], []
+        for item in items:
+            try:
+                obj = factory(item)
+            except KeyError as e:
+                results.append((None, f"Missing field {e}"))
+            except ValueError as e:
+                results.append((None, str(e)))
+            except TypeError:
+                results.append((None, "Invalid input data"))
+            else:
+                results.append((obj, None))
+                objs.append(obj)
+
+        with self.transaction():
+            if prepare is not None:
+                prepare(objs)
+            repo.add_many(objs, batch_size)
+        return results
+
+    def _invalidate(self, repo, obj_id):
+        """Forget the cached copies of an entity that is being written, and the responses showing it"""
+        table = repo.model.__tablename__
+        if self.cache is not None:
+            key = f"{table}:{obj_id}"
+            self._drop_cached(key)
+            _after_commit(self._drop_cached, (key,))
+        self._invalidate_responses(table, f"{table}:{obj_id}")
+
+    def _drop_cached(self, *keys):
+        with self._cache_lock:
+            self._cache_generation += 1
+        for key in keys:
+            self.cache.delete(key)
+
+    def _invalidate_responses(self, *tags):
+        """
+        Drop the cached responses tagged with a table name (its lists) or
+        "table:id" (one entity). Done again once the transaction commits, as
+        a request may cache the old data in between.
+        """
+        if self.response_cache is None or not tags:
+            return
+        self.response_cache.invalidate(*tags)
+        _after_commit(self.response_cache.invalidate, tags)
+
+    def _invalidate_place_responses(self, place_ids):
+        self._invalidate_responses(*(f"places:{place_id}" for place_id in place_ids))
 
     def create_user(self, user_data):
         user = User(**user_data)
@@ -18,78 +146,263 @@ class HBnBFacade:
         return user
 
     def get_user(self, user_id):
-        return self.user_repo.get(user_id)
+        return self._cached_get(self.user_repo, user_id)
+
+    def create_many_users(self, users_data, batch_size=1000):
+        return self._create_many(self.user_repo, lambda data: User(**data), users_data, batch_size)
+
+    def get_existing_user_ids(self, user_ids):
+        return self.user_repo.get_existing_ids(user_ids)
+
+    def get_users(self, user_ids, columns=None):
+        return self.user_repo.get_many(user_ids, columns)
 
     def get_user_by_email(self, email):
         return self.user_repo.get_user_by_email(email)
 
     def update_user(self, user_id, user_data):
+        self._invalidate(self.user_repo, user_id)
+        # Place details show their owner
+        if self.response_cache is not None:
+            self._invalidate_place_responses(self.place_repo.get_ids_by_owner(user_id))
         return self.user_repo.update(user_id, user_data)
 
     def get_all_users(self):
         return self.user_repo.get_all()
 
+    def get_users_page(self, limit, cursor=None, columns=None):
+        return self.user_repo.get_page(limit, cursor, columns=columns)
+
+    def iter_users(self, cursor=None, columns=None):
+        return self.user_repo.iter_all(cursor, columns=columns)
+
+    def get_user_version(self, user_id):
+        return self.user_repo.get_version(user_id)
+
+    def get_users_version(self):
+        return self.user_repo.get_collection_version()
+
     def create_amenity(self, amenity_data):
         amenity = Amenity(**amenity_data)
+        self._invalidate_responses("amenities")
         self.amenity_repo.add(amenity)
         return amenity
 
+    def create_many_amenities(self, amenities_data, batch_size=1000):
+        self._invalidate_responses("amenities")
+        return self._create_many(self.amenity_repo, lambda data: Amenity(**data), amenities_data, batch_size)
+
     def get_amenity(self, amenity_id):
-        return self.amenity_repo.get_by_attribute('id', amenity_id)
+        return self._cached_get(self.amenity_repo, amenity_id)
+
+    def get_amenities(self, amenity_ids, columns=None):
+        return self.amenity_repo.get_many(amenity_ids, columns)
 
     def get_all_amenities(self):
         return self.amenity_repo.get_all()
 
+    def get_amenities_page(self, limit, cursor=None, columns=None):
+        return self.amenity_repo.get_page(limit, cursor, columns=columns)
+
+    def iter_amenities(self, cursor=None, columns=None):
+        return self.amenity_repo.iter_all(cursor, columns=columns)
+
+    def get_amenity_version(self, amenity_id):
+        return self.amenity_repo.get_version(amenity_id)
+
+    def get_amenities_version(self):
+        return self.amenity_repo.get_collection_version()
+
+    def _invalidate_amenity(self, amenity_id):
+        self._invalidate(self.amenity_repo, amenity_id)
+        # Place details list their amenities
+        if self.response_cache is not None:
+            self._invalidate_place_responses(self.place_repo.get_ids_by_amenity(amenity_id))
+
     def update_amenity(self, amenity_id, amenity_data):
+        self._invalidate_amenity(amenity_id)
         return self.amenity_repo.update(amenity_id, amenity_data)
 
     def delete_amenity(self, amenity_id):
+        self._invalidate_amenity(amenity_id)
         return self.amenity_repo.delete(amenity_id)
 
-    def create_place(self, place_data):
-        place = Place(
-            title=place_data["title"],
-            description=place_data["description"],
-            price=place_data["price"],
-            latitude=place_data["latitude"],
-            longitude=place_data["longitude"],
-            _owner_id=place_data["owner"]
+    @staticmethod
+    def _new_place(place_data):
+        return Place(
+            title=_required(place_data, "title"),
+            description=_required(place_data, "description"),
+            price=_required(place_data, "price"),
+            latitude=_required(place_data, "latitude"),
+            longitude=_required(place_data, "longitude"),
+            _owner_id=_required(place_data, "owner")
         )
 
+    def create_place(self, place_data):
+        place = self._new_place(place_data)
+        self._invalidate_responses("places")
         self.place_repo.add(place)
         return place
 
+    def create_many_places(self, places_data, batch_size=1000):
+        self._invalidate_responses("places")
+        return self._create_many(self.place_repo, self._new_place, places_data, batch_size)
+
+    def get_existing_place_ids(self, place_ids):
+        return self.place_repo.get_existing_ids(place_ids)
+
     def get_place(self, place_id):
-        return self.place_repo.get(place_id)
+        return self._cached_get(self.place_repo, place_id)
+
+    def get_places(self, place_ids, columns=None):
+        return self.place_repo.get_many(place_ids, columns)
+
+    def get_place_detail(self, place_id, columns=None, include=("owner", "reviews", "amenities")):
+        return self.place_repo.get_detail(place_id, columns, include)
+
+    def search_places_nearby(self, lat, lng, radius_km, limit, columns=None):
+        return self.place_repo.search_nearby(lat, lng, radius_km, limit, columns)
+
+    def search_places_in_viewport(self, south, west, north, east, limit, columns=None):
+        return self.place_repo.search_viewport(south, west, north, east, limit, columns)
+
+    def search_places_text(self, text, limit, include_reviews=False, columns=None):
+        return self.place_repo.search_text(text, limit, include_reviews, columns)
 
     def get_all_places(self):
         return self.place_repo.get_all()
 
+    def get_places_page(self, limit, cursor=None, sort="created_at", columns=None, filters=None):
+        return self.place_repo.get_listing(limit, cursor, sort, columns, filters)
+
+    def iter_places(self, cursor=None, sort="created_at", columns=None, filters=None):
+        return self.place_repo.iter_listing(cursor, sort, columns=columns, filters=filters)
+
+    def get_place_version(self, place_id):
+        return self.place_repo.get_version(place_id)
+
+    def get_places_version(self):
+        return self.place_repo.get_collection_version()
+
     def get_place_by_user(self, user_id):
         return self.place_repo.get_by_attribute("id", user_id)
 
     def update_place(self, place_id, place_data):
+        self._invalidate(self.place_repo, place_id)
         return self.place_repo.update(place_id, place_data)
 
     def delete_place(self, place_id):
+        self._invalidate(self.place_repo, place_id)
         return self.place_repo.delete(place_id)
 
+    def add_place_amenity(self, place, amenity):
+        """Link amenity to place, once"""
+        with self.transaction():
+            self._invalidate(self.place_repo, place.id)
+            if amenity not in place.amenities:
+                place.amenities.append(amenity)
+        return place
+
+    def delete_place_cascade(self, place_id):
+        """
+        Delete a place, its reviews and its amenity links in one transaction.
+        Returns the number of reviews and amenity links removed, or None if
+        the place does not exist.
+        """
+        with self.transaction():
+            removed = self.place_repo.delete_cascade(place_id)
+        self._invalidate(self.place_repo, place_id)
+        return removed
+
+    def _apply_ratings(self, place_id, deltas):
+        self.place_repo.apply_rating_deltas(place_id, deltas)
+        self._invalidate(self.place_repo, place_id)
+
+    def _add_ratings(self, reviews):
+        deltas = {}
+        for review in reviews:
+            place_deltas = deltas.setdefault(review.place_id, {})
+            place_deltas[review.rating] = place_deltas.get(review.rating, 0) + 1
+        for place_id, place_deltas in deltas.items():
+            self._apply_ratings(place_id, place_deltas)
+
+    @staticmethod
+    def _new_review(review_data):
+        return Review(
+            text=_required(review_data, "text"),
+            rating=_required(review_data, "rating"),
+            place_id=_required(review_data, "place_id"),
+            user_id=_required(review_data, "user_id")
+        )
+
     def create_review(self, review_data):
-        review = Review(**review_data)
-        self.review_repo.add(review)
+        review = self._new_review(review_data)
+        # The aggregates are committed together with the review
+        with self.transaction():
+            self._add_ratings([review])
+            self.review_repo.add(review)
         return review
 
+    def create_many_reviews(self, reviews_data, batch_size=1000):
+        return self._create_many(self.review_repo, self._new_review, reviews_data, batch_size,
+                                 prepare=self._add_ratings)
+
     def get_review(self, review_id):
         return self.review_repo.get(review_id)
 
     def get_all_reviews(self):
         return self.review_repo.get_all()
 
+    def get_reviews_page(self, limit, cursor=None, columns=None):
+        return self.review_repo.get_page(limit, cursor, columns=columns)
+
+    def iter_reviews(self, cursor=None, columns=None):
+        return self.review_repo.iter_all(cursor, columns=columns)
+
+    def get_review_version(self, review_id):
+        return self.review_repo.get_version(review_id)
+
+    def get_reviews_version(self):
+        return self.review_repo.get_collection_version()
+
     def get_reviews_by_place(self, place_id):
         return self.review_repo.get_by_attribute('place_id', place_id)
 
+    def get_place_reviews(self, place_id, columns=None):
+        return self.review_repo.get_by_place(place_id, columns)
+
     def update_review(self, review_id, review_data):
-        return self.review_repo.update(review_id, review_data)
+        review = self.review_repo.get(review_id)
+        if not review:
+            return None
+
+        old_place_id, old_rating = review.place_id, review.rating
+        new_place_id = review_data.get("place_id", old_place_id)
+        new_rating = review_data.get("rating", old_rating)
+        # An invalid rating makes the update below raise, which rolls back the aggregates
+        with self.transaction():
+            if isinstance(new_rating, int) and 1 <= new_rating <= 5 and (new_place_id, new_rating) != (old_place_id, old_rating):
+                self._apply_ratings(old_place_id, {old_rating: -1})
+                self._apply_ratings(new_place_id, {new_rating: 1})
+            # Place details show the text of their reviews
+            self._invalidate_place_responses({old_place_id, new_place_id})
+            return self.review_repo.update(review_id, review_data)
 
     def delete_review(self, review_id):
-        return self.review_repo.delete(review_id)
+        with self.transaction():
+            review = self.review_repo.get(review_id)
+            if review:
+                self._apply_ratings(review.place_id, {review.rating: -1})
+            return self.review_repo.delete(review_id)
+
+    def check_rating_aggregates(self, fix=False):
+        """Compare stored rating aggregates with the reviews, optionally overwrite the drifted ones"""
+        drift = self.place_repo.find_rating_drift()
+        if fix and drift:
+            with self.transaction():
+                for place in drift:
+                    actual = place["actual"]
+                    self.place_repo.set_rating_aggregates(
+                        place["place_id"], actual["review_count"], actual["rating_sum"], actual["rating_histogram"])
+                    self._invalidate(self.place_repo, place["place_id"])
+        return drift
@@ -0,0 +1,37 @@
+import random
+import time
+from app import db
+from . import dataset, workload
+from .report import compare, summarize
+
+def run_benchmark(app, users=100, places=200, reviews=1000, amenities=20, amenities_per_place=3,
+                  requests=2000, warmup=200, seed=0, weights=None):
+    """
+    Seed the database of app (its tables must not exist yet), then drive a
+    mixed read/write workload through its test client.
+    Returns the JSON-serializable report.
+    """
+    import app as application
+
+    rng = random.Random(seed)
+    with app.app_context():
+        db.create_all()
+        started_at = time.perf_counter()
+        data = dataset.seed(application.facade, users, places, reviews, amenities, amenities_per_place, rng)
+        seeded_in = time.perf_counter() - started_at
+        db.session.remove()
+
+    client = app.test_client()
+    started_at = time.perf_counter()
+    samples = workload.run(client, data, rng, requests, weights, warmup)
+    duration = time.perf_counter() - started_at
+
+    report = summarize(samples, duration)
+    report["config"] = {
+        "users": users, "places": places, "reviews": reviews, "amenities": amenities,
+        "amenities_per_place": amenities_per_place, "requests": requests, "warmup": warmup, "seed": seed,
+        "weights": weights or {}, "database": app.config["SQLALCHEMY_DATABASE_URI"],
+    }
+    report["seed_duration_s"] = round(seeded_in, 3)
+    report["duration_s"] = round(duration, 3)
+    return report
@@ -0,0 +1,114 @@
+import argparse
+import json
+import sys
+from app import create_app
+import config
+from . import compare, run_benchmark
+from .workload import OPERATIONS
+
+def _weight(value):
+    name, _, weight = value.partition("=")
+    try:
+        weight = int(weight)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected name=weight, got {value!r}")
+    if name not in OPERATIONS:
+        raise argparse.ArgumentTypeError(f"Unknown operation {name!r}, expected one of {', '.join(OPERATIONS)}")
+    if weight < 0:
+        raise argparse.ArgumentTypeError(f"Weight of {name} must not be negative, got {weight}")
+    return name, weight
+
+def _print_regressions(regressions, threshold):
+    for regression in regressions:
+        print(f"REGRESSION {regression['section']} {regression['metric']}: "
+              f"{regression['baseline']} -> {regression['current']}", file=sys.stderr)
+    print(f"{len(regressions)} regression(s) beyond {threshold:.0%}", file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="HBnB API benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Seed a database, run the workload and print the JSON report")
+    run.add_argument("--users", type=int, default=100)
+    run.add_argument("--places", type=int, default=200)
+    run.add_argument("--reviews", type=int, default=1000)
+    run.add_argument("--amenities", type=int, default=20)
+    run.add_argument("--amenities-per-place", type=int, default=3)
+    run.add_argument("--requests", type=int, default=2000)
+    run.add_argument("--warmup", type=int, default=200)
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--weight", type=_weight, action="append", default=[],
+                     help="Override an operation weight, e.g. places.get=30 (0 disables it)")
+    run.add_argument("--database", help="SQLAlchemy URI of an empty database, in memory by default")
+    run.add_argument("--output", help="Write the report to this file instead of stdout")
+    run.add_argument("--capture", help="Append every SQL statement to this file, for flask index-advisor")
+    run.add_argument("--baseline", help="Compare with this report and exit with 1 on regressions")
+    run.add_argument("--threshold", type=float, default=0.2, help="Tolerated regression, as a fraction")
+    run.add_argument("--min-samples", type=int, default=50, help="Fewest requests to compare the timings of")
+
+    check = commands.add_parser("compare", help="Compare two reports and exit with 1 on regressions")
+    check.add_argument("baseline")
+    check.add_argument("current")
+    check.add_argument("--threshold", type=float, default=0.2, help="Tolerated regression, as a fraction")
+    check.add_argument("--min-samples", type=int, default=50, help="Fewest requests to compare the timings of")
+
+    serializers = commands.add_parser("serializers", help="Time the JSON body of a place list response")
+    serializers.add_argument("--items", type=int, default=1000)
+    serializers.add_argument("--repeat", type=int, default=20)
+
+    concurrency = commands.add_parser("concurrency", help="Compare config profiles under concurrent readers and writers")
+    concurrency.add_argument("--profile", action="append", choices=("development", "production"),
+                             help="Config profile to run, repeat for several (default: development and production)")
+    concurrency.add_argument("--readers", type=int, default=8)
+    concurrency.add_argument("--writers", type=int, default=2)
+    concurrency.add_argument("--seconds", type=float, default=5.0)
+    concurrency.add_argument("--places", type=int, default=500)
+    concurrency.add_argument("--reviews", type=int, default=2000)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        with open(args.baseline) as baseline, open(args.current) as current:
+            regressions = compare(json.load(baseline), json.load(current), args.threshold, args.min_samples)
+        _print_regressions(regressions, args.threshold)
+        return 1 if regressions else 0
+
+    if args.command == "serializers":
+        from .serialization import run_serialization
+        with create_app(config.BenchmarkConfig).app_context():
+            print(json.dumps(run_serialization(args.items, args.repeat), indent=2))
+        return 0
+
+    if args.command == "concurrency":
+        from .concurrency import compare_profiles
+        results = compare_profiles(args.profile or ("development", "production"), readers=args.readers,
+                                   writers=args.writers, seconds=args.seconds, places=args.places,
+                                   reviews=args.reviews)
+        print(json.dumps(results, indent=2))
+        return 0
+
+    overrides = {}
+    if args.database:
+        overrides["SQLALCHEMY_DATABASE_URI"] = args.database
+    if args.capture:
+        overrides["SQL_CAPTURE_PATH"] = args.capture
+    config_class = type("BenchmarkConfig", (config.BenchmarkConfig,), overrides)
+    report = run_benchmark(create_app(config_class), args.users, args.places, args.reviews, args.amenities,
+                           args.amenities_per_place, args.requests, args.warmup, args.seed, dict(args.weight))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(json.load(baseline), report, args.threshold, args.min_samples)
+        _print_regressions(regressions, args.threshold)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
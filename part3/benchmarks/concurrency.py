@@ -0,0 +1,83 @@
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from . import dataset
+from .report import _latencies
+from .workload import OPERATIONS, STATEMENTS
+
+READS = ("places.list", "places.get", "places.search_nearby", "reviews.by_place", "users.get")
+WRITES = ("places.update", "reviews.create", "reviews.update")
+
+def _worker(app, data, operations, seed, deadline, samples):
+    rng = random.Random(seed)
+    client = app.test_client()
+    while time.perf_counter() < deadline:
+        name = rng.choice(operations)
+        started_at = time.perf_counter()
+        response = OPERATIONS[name][0](client, data, rng)
+        elapsed = time.perf_counter() - started_at
+        match = STATEMENTS.search(response.headers.get("Server-Timing", ""))
+        samples.append((name, response.status_code, elapsed, int(match.group(1)) if match else None))
+
+def run_concurrency(profile="development", readers=8, writers=2, seconds=5.0, users=100, places=500,
+                    reviews=2000, seed=0):
+    """
+    Seed a temporary SQLite file with the settings of the profile config,
+    then run reader and writer threads against it for seconds.
+    Returns the JSON-serializable report, reads and writes apart.
+
+    Imports the app, so run each profile in its own process (see
+    compare_profiles): the namespaces keep the facade of the first app.
+    """
+    import config
+    from app import create_app, db
+    import app as application
+
+    with tempfile.TemporaryDirectory() as directory:
+        uri = f"sqlite:///{os.path.join(directory, 'concurrency.db')}"
+        config_class = type("ConcurrencyConfig", (config.config[profile],), {
+            "SECRET_KEY": config.BenchmarkConfig.SECRET_KEY, "SQLALCHEMY_DATABASE_URI": uri,
+            "BCRYPT_LOG_ROUNDS": 4, "JWT_VERIFY_SUB": False, "SLOW_QUERY_THRESHOLD_MS": None,
+        })
+        app = create_app(config_class)
+        with app.app_context():
+            db.create_all()
+            data = dataset.seed(application.facade, users, places, reviews, 10, 2, random.Random(seed))
+            db.session.remove()
+
+        samples = {"reads": [], "writes": []}
+        deadline = time.perf_counter() + seconds
+        threads = [threading.Thread(target=_worker, args=(app, data, READS, seed + i, deadline, samples["reads"]))
+                   for i in range(readers)]
+        threads += [threading.Thread(target=_worker, args=(app, data, WRITES, seed + readers + i, deadline,
+                                                           samples["writes"]))
+                    for i in range(writers)]
+        started_at = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = time.perf_counter() - started_at
+
+        with app.app_context():
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
+
+    report = {kind: _latencies(kind_samples, duration) for kind, kind_samples in samples.items()}
+    report["config"] = {"profile": profile, "readers": readers, "writers": writers, "seconds": seconds,
+                        "users": users, "places": places, "reviews": reviews, "seed": seed}
+    return report
+
+def compare_profiles(profiles=("development", "production"), **options):
+    """run_concurrency for each profile, in a fresh process each"""
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for profile in profiles:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            results[profile] = executor.submit(run_concurrency, profile, **options).result()
+    return results
@@ -0,0 +1,85 @@
+import random
+from flask_jwt_extended import create_access_token
+from app import db
+from app.models.place import place_amenities
+
+PASSWORD = "benchmark-password"
+WORDS = ("sea", "view", "quiet", "flat", "house", "garden", "loft", "central", "old", "port",
+         "cosy", "studio", "villa", "pool", "mountain", "lake", "bright", "modern", "family", "terrace")
+
+class Dataset:
+    """Ids and access tokens of a seeded database, used to build requests"""
+
+    def __init__(self, users, places, reviews, amenities, tokens, admin_token, owners):
+        self.users = users
+        self.places = places
+        self.reviews = reviews
+        self.amenities = amenities
+        self.tokens = tokens
+        self.admin_token = admin_token
+        self.owners = owners  # place id -> owner id
+
+    def counts(self):
+        return {
+            "users": len(self.users),
+            "places": len(self.places),
+            "reviews": len(self.reviews),
+            "amenities": len(self.amenities),
+        }
+
+def sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+def _created(results):
+    failed = [error for obj, error in results if error]
+    if failed:
+        raise RuntimeError(f"Seeding failed: {failed[0]}")
+    return [obj.id for obj, error in results]
+
+def seed(facade, users=100, places=200, reviews=1000, amenities=20, amenities_per_place=3,
+         rng=None, batch_size=1000):
+    """
+    Fill an empty database through the facade bulk methods.
+    Must run inside an application context.
+    """
+    rng = rng or random.Random(0)
+
+    admin = facade.create_user({"first_name": "Bench", "last_name": "Admin", "email": "admin@bench.example",
+                                "password": PASSWORD, "is_admin": True})
+    user_ids = _created(facade.create_many_users([
+        {"first_name": f"User{i}", "last_name": "Bench", "email": f"user{i}@bench.example", "password": PASSWORD}
+        for i in range(users)
+    ], batch_size))
+    amenity_ids = _created(facade.create_many_amenities([
+        {"name": f"Amenity {i}"} for i in range(amenities)
+    ], batch_size))
+
+    place_rows = [{
+        "title": sentence(rng, 3).capitalize(),
+        "description": sentence(rng, 12),
+        "price": round(rng.uniform(20, 500), 2),
+        # Spread over southern France so that geo searches hit a realistic share
+        "latitude": rng.uniform(42.5, 45.5),
+        "longitude": rng.uniform(1.0, 7.5),
+        "owner": rng.choice(user_ids),
+    } for _ in range(places)]
+    place_ids = _created(facade.create_many_places(place_rows, batch_size))
+    owners = {place_id: row["owner"] for place_id, row in zip(place_ids, place_rows)}
+
+    if amenity_ids and amenities_per_place:
+        links = [{"place_id": place_id, "amenity_id": amenity_id}
+                 for place_id in place_ids
+                 for amenity_id in rng.sample(amenity_ids, min(amenities_per_place, len(amenity_ids)))]
+        db.session.execute(place_amenities.insert(), links)
+        db.session.commit()
+
+    review_ids = _created(facade.create_many_reviews([{
+        "text": sentence(rng, 8),
+        "rating": rng.randint(1, 5),
+        "place_id": place_id,
+        "user_id": rng.choice(user_ids),
+    } for place_id in (rng.choice(place_ids) for _ in range(reviews if place_ids else 0))], batch_size))
+
+    tokens = {user_id: create_access_token(identity={"id": user_id, "is_admin": False}) for user_id in user_ids}
+    admin_token = create_access_token(identity={"id": admin.id, "is_admin": True})
+    return Dataset(user_ids, place_ids, review_ids, amenity_ids, tokens, admin_token, owners)
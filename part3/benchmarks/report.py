@@ -0,0 +1,81 @@
+import math
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return None
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+def _latencies(samples, duration):
+    durations = sorted(1000 * elapsed for name, status, elapsed, statements in samples)
+    statements = [statements for name, status, elapsed, statements in samples if statements is not None]
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for name, status, elapsed, count in samples if status >= 500),
+        "throughput_rps": round(len(samples) / duration, 1) if duration else None,
+        "mean_ms": round(sum(durations) / len(durations), 3) if durations else None,
+        "p50_ms": round(percentile(durations, 0.50), 3) if durations else None,
+        "p95_ms": round(percentile(durations, 0.95), 3) if durations else None,
+        "p99_ms": round(percentile(durations, 0.99), 3) if durations else None,
+        "statements_per_request": round(sum(statements) / len(statements), 2) if statements else None,
+        "max_statements": max(statements) if statements else None,
+    }
+
+def summarize(samples, duration):
+    """
+    Aggregate the samples of workload.run, overall and per operation.
+    Per-operation throughput is measured against the whole run.
+    """
+    by_operation = {}
+    for sample in samples:
+        by_operation.setdefault(sample[0], []).append(sample)
+
+    operations = {}
+    for name, operation_samples in sorted(by_operation.items()):
+        operations[name] = _latencies(operation_samples, duration)
+        operations[name]["status"] = {}
+        for sample in operation_samples:
+            status = str(sample[1])
+            operations[name]["status"][status] = operations[name]["status"].get(status, 0) + 1
+
+    return {"summary": _latencies(samples, duration), "operations": operations}
+
+# metric -> (True when a higher value is better, timing-based)
+COMPARED_METRICS = {
+    "p50_ms": (False, True),
+    "p95_ms": (False, True),
+    "p99_ms": (False, True),
+    "throughput_rps": (True, True),
+    "statements_per_request": (False, False),
+}
+
+def compare(baseline, current, threshold=0.2, min_samples=50):
+    """
+    List the metrics of current that are worse than baseline by more than
+    threshold (a fraction), overall and for every operation of both runs.
+    Timings of sections with fewer than min_samples requests are too noisy
+    and skipped; errors are a regression as soon as there are more of them.
+    """
+    regressions = []
+    sections = [("summary", baseline.get("summary", {}), current.get("summary", {}))]
+    for name, base in baseline.get("operations", {}).items():
+        sections.append((name, base, current.get("operations", {}).get(name, {})))
+
+    for section, base, new in sections:
+        if not new:
+            continue
+        enough_samples = min(base.get("requests", 0), new.get("requests", 0)) >= min_samples
+        for metric, (higher_is_better, timing) in COMPARED_METRICS.items():
+            old_value, new_value = base.get(metric), new.get(metric)
+            if old_value is None or new_value is None or (timing and not enough_samples):
+                continue
+            if higher_is_better:
+                regressed = new_value < old_value * (1 - threshold)
+            else:
+                regressed = new_value > old_value * (1 + threshold)
+            if regressed:
+                regressions.append({"section": section, "metric": metric, "baseline": old_value, "current": new_value})
+        if new.get("errors", 0) > base.get("errors", 0):
+            regressions.append({"section": section, "metric": "errors",
+                                "baseline": base.get("errors", 0), "current": new["errors"]})
+    return regressions
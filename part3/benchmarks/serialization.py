@@ -0,0 +1,57 @@
+import json
+import random
+import timeit
+from .dataset import sentence
+
+def _places(count, rng):
+    from app.models.place import Place
+
+    places = []
+    for i in range(count):
+        place = Place(title=sentence(rng, 3).capitalize(), description=sentence(rng, 12),
+                      price=round(rng.uniform(20, 500), 2), latitude=rng.uniform(42.5, 45.5),
+                      longitude=rng.uniform(1.0, 7.5), _owner_id=f"owner-{i}")
+        place.id = f"place-{i}"
+        place._review_count, place._rating_sum = 4, 14
+        places.append(place)
+    return places
+
+def run_serialization(items=1000, repeat=20, seed=0):
+    """
+    Time the JSON body of one list response of items places, as built before
+    the serializers (dicts through the public properties, stdlib encoder)
+    and with the compiled place serializer on each JSON backend.
+    Must run inside an application context.
+    """
+    from app.api.v1 import serializers
+    from app.api.v1.places import PLACE_LIST_FIELDS
+
+    places = _places(items, random.Random(seed))
+    serialize = serializers.place_serializer.compile(PLACE_LIST_FIELDS)
+
+    def handwritten():
+        return json.dumps({"items": [{
+            "id": i.id,
+            "title": i.title,
+            "latitude": i.latitude,
+            "longitude": i.longitude,
+            "review_count": i.review_count,
+            "average_rating": i.average_rating,
+        } for i in places], "next_cursor": None}) + "\n"
+
+    def compiled_stdlib():
+        return json.dumps({"items": [serialize(i) for i in places], "next_cursor": None},
+                          separators=(",", ":")).encode("utf-8")
+
+    cases = {"handwritten_stdlib": handwritten, "compiled_stdlib": compiled_stdlib}
+    if serializers.orjson is not None:
+        cases["compiled_orjson"] = lambda: serializers.dumps({"items": [serialize(i) for i in places], "next_cursor": None})
+
+    results = {}
+    for name, case in cases.items():
+        best = min(timeit.repeat(case, number=1, repeat=repeat))
+        results[name] = {"ms_per_response": round(1000 * best, 3)}
+    baseline = results["handwritten_stdlib"]["ms_per_response"]
+    for result in results.values():
+        result["speedup"] = round(baseline / result["ms_per_response"], 2)
+    return {"items": items, "repeat": repeat, "results": results}
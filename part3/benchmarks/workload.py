@@ -0,0 +1,154 @@
+import re
+import time
+from .dataset import PASSWORD, sentence
+
+API = "/api/v1"
+STATEMENTS = re.compile(r'desc="(\d+) statements"')
+
+def _auth(token):
+    return {"Authorization": f"Bearer {token}"}
+
+def _owned_place(data, rng):
+    place_id = rng.choice(data.places)
+    return place_id, data.owners[place_id]
+
+# Each operation builds one request from the dataset and sends it with the test client.
+# Writes record what they create so that later requests can target it.
+
+def list_users(client, data, rng):
+    return client.get(f"{API}/users/", query_string={"limit": 20})
+
+def get_user(client, data, rng):
+    return client.get(f"{API}/users/{rng.choice(data.users)}")
+
+def create_user(client, data, rng):
+    email = f"new{rng.getrandbits(48):x}@bench.example"
+    return client.post(f"{API}/users/", json={"first_name": "New", "last_name": "User",
+                                              "email": email, "password": PASSWORD})
+
+def update_user(client, data, rng):
+    user_id = rng.choice(data.users)
+    return client.put(f"{API}/users/{user_id}", json={"first_name": f"Renamed{rng.randint(0, 999)}"},
+                      headers=_auth(data.tokens[user_id]))
+
+def login(client, data, rng):
+    return client.post(f"{API}/auth/login", json={"email": f"user{rng.randrange(len(data.users))}@bench.example",
+                                                  "password": PASSWORD})
+
+def list_amenities(client, data, rng):
+    return client.get(f"{API}/amenities/", query_string={"limit": 20})
+
+def get_amenity(client, data, rng):
+    return client.get(f"{API}/amenities/{rng.choice(data.amenities)}")
+
+def create_amenity(client, data, rng):
+    response = client.post(f"{API}/admin/amenities/", json={"name": f"Amenity {rng.getrandbits(32):x}"},
+                           headers=_auth(data.admin_token))
+    if response.status_code == 201:
+        data.amenities.append(response.json["id"])
+    return response
+
+def list_places(client, data, rng):
+    return client.get(f"{API}/places/", query_string={"limit": 20})
+
+def list_places_by_rating(client, data, rng):
+    return client.get(f"{API}/places/", query_string={"limit": 20, "sort": "-rating"})
+
+def get_place(client, data, rng):
+    return client.get(f"{API}/places/{rng.choice(data.places)}")
+
+def search_places_nearby(client, data, rng):
+    return client.get(f"{API}/places/search", query_string={
+        "lat": rng.uniform(42.5, 45.5), "lng": rng.uniform(1.0, 7.5), "radius_km": 25, "limit": 20})
+
+def search_places_text(client, data, rng):
+    return client.get(f"{API}/places/search", query_string={"q": sentence(rng, 2), "limit": 20})
+
+def create_place(client, data, rng):
+    owner = rng.choice(data.users)
+    response = client.post(f"{API}/places/", json={
+        "title": sentence(rng, 3).capitalize(), "description": sentence(rng, 12),
+        "price": round(rng.uniform(20, 500), 2),
+        "latitude": rng.uniform(42.5, 45.5), "longitude": rng.uniform(1.0, 7.5), "owner": owner,
+    }, headers=_auth(data.tokens[owner]))
+    if response.status_code == 201:
+        data.places.append(response.json["id"])
+        data.owners[response.json["id"]] = owner
+    return response
+
+def update_place(client, data, rng):
+    place_id, owner = _owned_place(data, rng)
+    return client.put(f"{API}/places/{place_id}", json={"price": round(rng.uniform(20, 500), 2)},
+                      headers=_auth(data.tokens[owner]))
+
+def list_reviews(client, data, rng):
+    return client.get(f"{API}/reviews/", query_string={"limit": 20})
+
+def get_review(client, data, rng):
+    return client.get(f"{API}/reviews/{rng.choice(data.reviews)}")
+
+def get_place_reviews(client, data, rng):
+    return client.get(f"{API}/reviews/places/{rng.choice(data.places)}")
+
+def create_review(client, data, rng):
+    user_id = rng.choice(data.users)
+    response = client.post(f"{API}/reviews/", json={
+        "text": sentence(rng, 8), "rating": rng.randint(1, 5),
+        "place_id": rng.choice(data.places), "user_id": user_id,
+    }, headers=_auth(data.tokens[user_id]))
+    if response.status_code == 201:
+        data.reviews.append(response.json["id"])
+    return response
+
+def update_review(client, data, rng):
+    return client.put(f"{API}/reviews/{rng.choice(data.reviews)}", json={"rating": rng.randint(1, 5)},
+                      headers=_auth(data.admin_token))
+
+# name -> (operation, default weight)
+OPERATIONS = {
+    "users.list": (list_users, 4),
+    "users.get": (get_user, 6),
+    "users.create": (create_user, 1),
+    "users.update": (update_user, 1),
+    "auth.login": (login, 1),
+    "amenities.list": (list_amenities, 3),
+    "amenities.get": (get_amenity, 4),
+    "amenities.create": (create_amenity, 1),
+    "places.list": (list_places, 8),
+    "places.list_by_rating": (list_places_by_rating, 4),
+    "places.get": (get_place, 15),
+    "places.search_nearby": (search_places_nearby, 6),
+    "places.search_text": (search_places_text, 6),
+    "places.create": (create_place, 2),
+    "places.update": (update_place, 2),
+    "reviews.list": (list_reviews, 3),
+    "reviews.get": (get_review, 5),
+    "reviews.by_place": (get_place_reviews, 6),
+    "reviews.create": (create_review, 3),
+    "reviews.update": (update_review, 1),
+}
+
+def run(client, data, rng, requests, weights=None, warmup=0):
+    """
+    Send warmup + requests weighted random requests and return one
+    (operation name, status code, seconds, statements) tuple per
+    measured request. weights overrides the default weight by name.
+    """
+    unknown = set(weights or ()) - set(OPERATIONS)
+    if unknown:
+        raise ValueError(f"Unknown operation(s) {', '.join(sorted(unknown))}")
+    weights = {**{name: weight for name, (operation, weight) in OPERATIONS.items()}, **(weights or {})}
+    names = [name for name, weight in weights.items() if weight > 0]
+
+    samples = []
+    for i in range(warmup + requests):
+        name = rng.choices(names, weights=[weights[name] for name in names])[0]
+        operation = OPERATIONS[name][0]
+        started_at = time.perf_counter()
+        response = operation(client, data, rng)
+        elapsed = time.perf_counter() - started_at
+        if i < warmup:
+            continue
+        match = STATEMENTS.search(response.headers.get("Server-Timing", ""))
+        samples.append((name, response.status_code, elapsed, int(match.group(1)) if match else None))
+    return samples
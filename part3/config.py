@@ -3,6 +3,30 @@ import os
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'default_secret_key')
     DEBUG = False
+    API_PAGE_SIZE = 100
+    API_MAX_PAGE_SIZE = 1000
+    PLACE_SEARCH_MAX_RADIUS_KM = 1000
+    PASSWORD_HASH_WORKERS = None  # defaults to the number of CPUs
+    PASSWORD_HASH_QUEUE_LIMIT = 32
+    ENTITY_CACHE_SIZE = 10000  # 0 disables the facade cache
+    ENTITY_CACHE_TTL = 30  # seconds
+    RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024  # rendered anonymous GETs, 0 disables the cache
+    RESPONSE_CACHE_TTL = 30  # seconds
+    COMPRESSION_ENCODINGS = ('br', 'gzip')  # by preference, br needs the brotli package, empty disables
+    COMPRESSION_MIN_SIZE = 1024  # bytes, smaller bodies are sent as they are
+    COMPRESSION_LEVEL = 6  # gzip, 1 (fastest) to 9 (smallest)
+    COMPRESSION_BROTLI_QUALITY = 5  # 0 (fastest) to 11 (smallest)
+    BULK_MAX_ITEMS = 10000
+    BULK_BATCH_SIZE = 1000
+    BATCH_MAX_IDS = 1000
+    PLACE_DETAIL_COALESCING = True  # concurrent identical place detail reads share one computation
+    SQL_INSTRUMENTATION = True  # Server-Timing header and slow-query log
+    SLOW_QUERY_THRESHOLD_MS = 100  # None disables the slow-query log
+    SQL_CAPTURE_PATH = None  # file to append every statement to, for flask index-advisor
+    SQLITE_PRAGMAS = {}  # run on every new SQLite connection
+    DATABASE_READ_POOL = None  # engine options of the read binds, alone a read-only pool on the default database
+    DATABASE_REPLICAS = []  # URIs of read-only copies of the default database, see RoutingSession
+    DATABASE_REPLICA_RETRY_SECONDS = 30  # how long a failed read bind is skipped
 
 class DevelopmentConfig(Config):
     #TESTING = True
@@ -10,7 +34,43 @@ class DevelopmentConfig(Config):
     SQLALCHEMY_DATABASE_URI = 'sqlite:///development.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+class ProductionConfig(Config):
+    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///production.db')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',  # readers no longer block the writer, nor the writer readers
+        'synchronous': 'NORMAL',  # durable across application crashes, fsync only at checkpoints
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,  # in KiB when negative, per connection
+        'busy_timeout': 5000,  # ms to wait for the write lock before "database is locked"
+    }
+    # SQLite has a single writer, a small pool keeps writers queueing in
+    # the pool rather than on the database lock
+    SQLALCHEMY_ENGINE_OPTIONS = {'pool_size': 4, 'max_overflow': 0, 'pool_timeout': 30}
+    DATABASE_READ_POOL = {'pool_size': 16, 'max_overflow': 16, 'pool_timeout': 30}
+    DATABASE_REPLICAS = [url for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url]
+
+class TestingConfig(Config):
+    TESTING = True
+    SECRET_KEY = 'testing_secret_key_of_at_least_32_bytes'
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    BCRYPT_LOG_ROUNDS = 4
+    JWT_VERIFY_SUB = False
+
+class BenchmarkConfig(Config):
+    SECRET_KEY = 'benchmark_secret_key_of_at_least_32_bytes'
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Cheap hashes so that seeding thousands of users stays fast
+    BCRYPT_LOG_ROUNDS = 4
+    JWT_VERIFY_SUB = False
+    SLOW_QUERY_THRESHOLD_MS = None
+
 config = {
     'development': DevelopmentConfig,
+    'production': ProductionConfig,
+    'testing': TestingConfig,
+    'benchmark': BenchmarkConfig,
     'default': DevelopmentConfig
 }
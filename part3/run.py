@@ -1,6 +1,8 @@
+import os
 from app import create_app
+from config import config
 
-app = create_app()
+app = create_app(config[os.getenv('FLASK_CONFIG', 'default')])
 
 if __name__ == '__main__':
     app.run(debug=True)
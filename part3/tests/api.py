@@ -0,0 +1,1246 @@
+import sys
+sys.path.append("..")
+
+import base64
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from flask import request
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+from app import create_app, db, hasher, instrumentation
+from app.services.cache import LRUCache
+from config import TestingConfig
+
+# In-process API tests, run from part3/ with: python -m pytest tests/api.py
+
+class ApiTestCase(unittest.TestCase):
+    app = None
+
+    @classmethod
+    def setUpClass(cls):
+        # The namespaces bind the facade of the first app, so build it once
+        if ApiTestCase.app is None:
+            ApiTestCase.app = create_app(TestingConfig)
+        from app import facade
+        cls.facade = facade
+
+    def setUp(self):
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        self.client = self.app.test_client()
+        if self.facade.cache is not None:
+            self.facade.cache.clear()
+        if self.facade.response_cache is not None:
+            self.facade.response_cache.clear()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def create_user(self, email="john@example.com"):
+        return self.facade.create_user({"first_name": "John", "last_name": "Doe", "email": email, "password": "secret"})
+
+    def auth_headers(self, user):
+        token = create_access_token(identity={'id': user.id, 'is_admin': user.is_admin})
+        return {'Authorization': f'Bearer {token}'}
+
+    def create_place(self, owner, **data):
+        place_data = {"title": "Cosy flat", "description": "Near the sea", "price": 80.0,
+                      "latitude": 43.3, "longitude": 5.4, "owner": owner.id}
+        place_data.update(data)
+        return self.facade.create_place(place_data)
+
+    def count_statements(self, func, *args, **kwargs):
+        statements = []
+        listener = lambda *a, **kw: statements.append(a[2])
+        event.listen(db.engine, "before_cursor_execute", listener)
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", listener)
+        return result, len(statements)
+
+class TestPagination(ApiTestCase):
+    def test_pages_follow_next_cursor(self):
+        created = []
+        for i in range(5):
+            response = self.client.post('/api/v1/amenities/', json={"name": f"Amenity {i}"})
+            created.append(response.json["id"])
+
+        seen, cursor = [], None
+        while True:
+            query = {"limit": 2}
+            if cursor:
+                query["cursor"] = cursor
+            response = self.client.get('/api/v1/amenities/', query_string=query)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.json["items"]), 2)
+            seen += [i["id"] for i in response.json["items"]]
+            cursor = response.json["next_cursor"]
+            if not cursor:
+                break
+
+        self.assertEqual(sorted(seen), sorted(created))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/v1/places/', query_string={"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+
+        for value in (5, [], "yesterday"):
+            cursor = base64.urlsafe_b64encode(json.dumps([value, "id"]).encode()).decode()
+            response = self.client.get('/api/v1/places/', query_string={"cursor": cursor})
+            self.assertEqual(response.status_code, 400)
+        for value in ({}, [1], True):
+            cursor = base64.urlsafe_b64encode(json.dumps([value, "id"]).encode()).decode()
+            for sort in ("price", "-price"):
+                response = self.client.get('/api/v1/places/', query_string={"cursor": cursor, "sort": sort})
+                self.assertEqual(response.status_code, 400)
+
+    def test_invalid_limit(self):
+        response = self.client.get('/api/v1/users/', query_string={"limit": 0})
+        self.assertEqual(response.status_code, 400)
+
+class TestPlaceDetail(ApiTestCase):
+    def test_statement_count_does_not_grow_with_reviews(self):
+        owner = self.create_user()
+        place = self.create_place(owner)
+        for i in range(10):
+            reviewer = self.create_user(f"reviewer{i}@example.com")
+            self.facade.create_review({"text": "Nice", "rating": 4, "place_id": place.id, "user_id": reviewer.id})
+        for name in ("Wi-Fi", "Pool", "Parking"):
+            place.amenities.append(self.facade.create_amenity({"name": name}))
+        db.session.commit()
+        place_id, owner_id = place.id, owner.id
+        db.session.remove()
+
+        response, count = self.count_statements(self.client.get, f'/api/v1/places/{place_id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["owner"]["id"], owner_id)
+        self.assertEqual(len(response.json["reviews"]), 10)
+        self.assertEqual(len(response.json["amenities"]), 3)
+        # The version lookup of conditional GET, then the three detail statements
+        self.assertEqual(count, 4)
+        self.assertIn('db;dur=', response.headers['Server-Timing'])
+        self.assertIn('desc="4 statements"', response.headers['Server-Timing'])
+
+    def test_slow_queries_are_logged_with_route(self):
+        place_id = self.create_place(self.create_user()).id
+        threshold = instrumentation.slow_query_threshold
+        instrumentation.slow_query_threshold = 0
+        try:
+            with self.assertLogs('app.instrumentation', level='WARNING') as logs:
+                self.client.get(f'/api/v1/places/{place_id}')
+        finally:
+            instrumentation.slow_query_threshold = threshold
+        self.assertIn('GET /api/v1/places/<place_id>', logs.output[0])
+        self.assertIn(place_id, logs.output[0])
+
+    def test_unknown_place(self):
+        response = self.client.get('/api/v1/places/unknown')
+        self.assertEqual(response.status_code, 404)
+
+class TestConditionalGet(ApiTestCase):
+    def test_place_detail(self):
+        owner = self.create_user()
+        place_id = self.create_place(owner).id
+        url = f'/api/v1/places/{place_id}'
+        response = self.client.get(url)
+        etag, last_modified = response.headers['ETag'], response.headers['Last-Modified']
+
+        # Without the response cache, the version query alone answers
+        self.facade.response_cache.clear()
+        response, count = self.count_statements(self.client.get, url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(count, 1)
+        self.assertEqual(self.client.get(url, headers={'If-Modified-Since': last_modified}).status_code, 304)
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': '"other"'}).status_code, 200)
+
+        # Anything embedded in the detail changes the ETag
+        reviewer = self.create_user("reviewer@example.com")
+        review = self.facade.create_review({"text": "Nice", "rating": 4, "place_id": place_id, "user_id": reviewer.id})
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+
+        self.facade.update_review(review.id, {"text": "Very nice"})
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+
+        place = self.facade.get_place(place_id)
+        self.facade.add_place_amenity(place, self.facade.create_amenity({"name": "Wi-Fi"}))
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+
+        self.facade.update_user(owner.id, {"first_name": "Jane"})
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_entities_and_collections(self):
+        user = self.create_user()
+        amenity = self.facade.create_amenity({"name": "Pool"})
+        for url, update in ((f'/api/v1/users/{user.id}', lambda: self.facade.update_user(user.id, {"last_name": "Roe"})),
+                            (f'/api/v1/amenities/{amenity.id}', lambda: self.facade.update_amenity(amenity.id, {"name": "Spa"})),
+                            ('/api/v1/amenities/', lambda: self.facade.create_amenity({"name": "Gym"}))):
+            etag = self.client.get(url).headers['ETag']
+            self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+            update()
+            self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 200)
+
+        # Each page is its own representation
+        first = self.client.get('/api/v1/amenities/', query_string={"limit": 1}).headers['ETag']
+        self.assertNotEqual(first, self.client.get('/api/v1/amenities/').headers['ETag'])
+        self.assertEqual(self.client.get('/api/v1/users/unknown').status_code, 404)
+
+class TestNdjsonStreaming(ApiTestCase):
+    def test_streams_every_item_in_page_order(self):
+        self.facade.create_many_amenities([{"name": f"Amenity {i}"} for i in range(1200)])
+        paged = self.client.get('/api/v1/amenities/', query_string={"limit": 1000})
+        headers = {'Accept': 'application/x-ndjson'}
+
+        response = self.client.get('/api/v1/amenities/', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertNotEqual(response.headers['ETag'], paged.headers['ETag'])
+        items = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual(len(items), 1200)
+        self.assertEqual(items[:1000], paged.json["items"])
+
+        # Resume an export from a page cursor
+        response = self.client.get('/api/v1/amenities/', headers=headers,
+                                   query_string={"cursor": paged.json["next_cursor"]})
+        self.assertEqual([json.loads(line) for line in response.get_data(as_text=True).splitlines()], items[1000:])
+        response = self.client.get('/api/v1/amenities/', headers=headers, query_string={"cursor": "bad"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_places_follow_sort(self):
+        owner = self.create_user()
+        places = [self.create_place(owner).id for _ in range(3)]
+        for rating, place_id in enumerate(places, 1):
+            self.facade.create_review({"text": "Ok", "rating": rating, "place_id": place_id, "user_id": owner.id})
+        response = self.client.get('/api/v1/places/', query_string={"sort": "-rating"},
+                                   headers={'Accept': 'application/x-ndjson'})
+        self.assertEqual([json.loads(line)["id"] for line in response.get_data(as_text=True).splitlines()], places[::-1])
+
+class TestSerializers(ApiTestCase):
+    def test_field_subsets_and_expired_attributes(self):
+        from app.api.v1.serializers import dumps, place_serializer
+
+        owner = self.create_user()
+        place = self.create_place(owner)
+        self.facade.create_review({"text": "Ok", "rating": 4, "place_id": place.id, "user_id": owner.id})
+        self.assertEqual(place_serializer(place, ("id", "title")), {"id": place.id, "title": "Cosy flat"})
+        self.assertIs(place_serializer.compile(("id", "title")), place_serializer.compile(["id", "title"]))
+        with self.assertRaises(ValueError):
+            place_serializer.compile(("id", "password"))
+
+        # The rating update expired the instance, values are reloaded
+        data = place_serializer(place)
+        self.assertEqual((data["owner"], data["review_count"], data["average_rating"]), (owner.id, 1, 4.0))
+        self.assertEqual(json.loads(dumps(data)), data)
+
+        response = self.client.get(f'/api/v1/places/{place.id}')
+        self.assertEqual(response.json["owner"]["email"], "john@example.com")
+        self.assertEqual(response.json["rating_histogram"]["4"], 1)
+
+class TestSparseFieldsets(ApiTestCase):
+    def capture_statements(self, func, *args, **kwargs):
+        statements = []
+        listener = lambda *a, **kw: statements.append(a[2])
+        event.listen(db.engine, "before_cursor_execute", listener)
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", listener)
+        return result, statements
+
+    def test_list_selects_only_requested_columns(self):
+        owner = self.create_user()
+        place_id = self.create_place(owner).id
+        db.session.remove()
+
+        response, statements = self.capture_statements(
+            self.client.get, '/api/v1/places/', query_string={"fields": "id,title,latitude,longitude"})
+        self.assertEqual(response.json["items"], [{"id": place_id, "title": "Cosy flat", "latitude": 43.3, "longitude": 5.4}])
+        page = statements[-1]
+        self.assertIn("places.title", page)
+        self.assertNotIn("places.description", page)
+        self.assertNotIn("places.price", page)
+
+        # Computed fields load the columns they are computed from
+        response = self.client.get('/api/v1/places/', query_string={"fields": "average_rating", "sort": "-rating"})
+        self.assertEqual(response.json["items"], [{"average_rating": None}])
+
+        response = self.client.get('/api/v1/users/', query_string={"fields": "email"},
+                                   headers={'Accept': 'application/x-ndjson'})
+        self.assertEqual(json.loads(response.get_data(as_text=True)), {"email": "john@example.com"})
+
+    def test_invalid_fields(self):
+        place_id = self.create_place(self.create_user()).id
+        for url in ('/api/v1/places/', f'/api/v1/places/{place_id}', '/api/v1/users/', '/api/v1/places/search'):
+            response = self.client.get(url, query_string={"fields": "id,password"})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json["error"], "Unknown field(s): password")
+
+    def test_place_detail_skips_unrequested_relations(self):
+        owner = self.create_user()
+        owner_id, place_id = owner.id, self.create_place(owner).id
+        self.facade.create_review({"text": "Nice", "rating": 4, "place_id": place_id, "user_id": owner_id})
+        db.session.remove()
+
+        response, statements = self.capture_statements(
+            self.client.get, f'/api/v1/places/{place_id}', query_string={"fields": "id,title,reviews"})
+        self.assertEqual(list(response.json), ["id", "title", "reviews"])
+        self.assertEqual(len(response.json["reviews"]), 1)
+        # The version lookup, the place and its reviews
+        self.assertEqual(len(statements), 3)
+        self.assertNotIn("users", statements[1])
+
+        response = self.client.get(f'/api/v1/places/{place_id}', query_string={"fields": "owner"})
+        self.assertEqual(response.json, {"owner": {"id": owner_id, "first_name": "John", "last_name": "Doe",
+                                                   "email": "john@example.com"}})
+
+class TestPlaceFilters(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob = self.create_user("alice@example.com"), self.create_user("bob@example.com")
+        self.wifi = self.facade.create_amenity({"name": "Wi-Fi"})
+        self.pool = self.facade.create_amenity({"name": "Pool"})
+        cheap = self.create_place(self.alice, title="Cheap", price=40.0)
+        middle = self.create_place(self.alice, title="Middle", price=90.0)
+        dear = self.create_place(self.bob, title="Dear", price=300.0)
+        cheap.amenities.append(self.wifi)
+        middle.amenities.extend([self.wifi, self.pool])
+        dear.amenities.append(self.pool)
+        db.session.commit()
+        self.facade.create_review({"text": "Great", "rating": 5, "place_id": dear.id, "user_id": self.alice.id})
+        self.facade.create_review({"text": "Poor", "rating": 2, "place_id": middle.id, "user_id": self.bob.id})
+        self.cheap, self.middle, self.dear = cheap.id, middle.id, dear.id
+
+    def titles(self, **query):
+        response = self.client.get('/api/v1/places/', query_string=query)
+        self.assertEqual(response.status_code, 200)
+        return [i["title"] for i in response.json["items"]]
+
+    def test_filters(self):
+        self.assertEqual(self.titles(min_price=50, sort="price"), ["Middle", "Dear"])
+        self.assertEqual(self.titles(max_price=90, sort="-price"), ["Middle", "Cheap"])
+        self.assertEqual(self.titles(owner_id=self.bob.id), ["Dear"])
+        self.assertEqual(self.titles(min_rating=3), ["Dear"])
+        self.assertEqual(self.titles(amenity=self.wifi.id, sort="price"), ["Cheap", "Middle"])
+        both = ["Middle"]
+        self.assertEqual(self.titles(amenity=[self.wifi.id, self.pool.id]), both)
+        self.assertEqual(self.titles(amenity=f"{self.wifi.id},{self.pool.id}"), both)
+        self.assertEqual(self.titles(amenity=self.pool.id, owner_id=self.alice.id, max_price=100), both)
+        self.assertEqual(self.titles(min_price=1000), [])
+
+    def test_filtered_pages_follow_next_cursor(self):
+        query = {"amenity": self.pool.id, "sort": "-price", "limit": 1}
+        first = self.client.get('/api/v1/places/', query_string=query).json
+        second = self.client.get('/api/v1/places/', query_string=dict(query, cursor=first["next_cursor"])).json
+        self.assertEqual([first["items"][0]["title"], second["items"][0]["title"]], ["Dear", "Middle"])
+        self.assertIsNone(second["next_cursor"])
+
+        response = self.client.get('/api/v1/places/', query_string={"max_price": 50},
+                                   headers={'Accept': 'application/x-ndjson'})
+        self.assertEqual([json.loads(line)["title"] for line in response.get_data(as_text=True).splitlines()], ["Cheap"])
+
+    def test_etag_changes_with_amenity_links(self):
+        etag = self.client.get('/api/v1/places/', query_string={"amenity": self.pool.id}).headers["ETag"]
+        self.facade.add_place_amenity(self.facade.get_place(self.cheap), self.pool)
+        response = self.client.get('/api/v1/places/', query_string={"amenity": self.pool.id},
+                                   headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json["items"]), 3)
+
+    def test_invalid_filters(self):
+        for query in ({"min_price": "cheap"}, {"min_rating": -1}, {"sort": "title"}):
+            response = self.client.get('/api/v1/places/', query_string=query)
+            self.assertEqual(response.status_code, 400)
+
+class TestBatchRead(ApiTestCase):
+    def test_one_query_in_the_order_asked(self):
+        users = [self.create_user(f"user{i}@example.com").id for i in range(5)]
+        asked = [users[3], "unknown", users[0], users[3], users[4]]
+        db.session.remove()
+
+        response, count = self.count_statements(self.client.post, '/api/v1/users/batch', json=asked)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([i["id"] for i in response.json["items"]], [users[3], users[0], users[4]])
+        self.assertEqual(response.json["missing"], ["unknown"])
+        self.assertEqual(count, 1)
+
+        response = self.client.post('/api/v1/users/batch', json=users[:2], query_string={"fields": "email"})
+        self.assertEqual(response.json["items"], [{"email": "user0@example.com"}, {"email": "user1@example.com"}])
+
+    def test_places_and_amenities(self):
+        place_id = self.create_place(self.create_user()).id
+        amenity_id = self.facade.create_amenity({"name": "Pool"}).id
+        response = self.client.post('/api/v1/places/batch', json=[place_id], query_string={"fields": "id,title"})
+        self.assertEqual(response.json["items"], [{"id": place_id, "title": "Cosy flat"}])
+        response = self.client.post('/api/v1/amenities/batch', json=[amenity_id])
+        self.assertEqual(response.json["items"], [{"id": amenity_id, "name": "Pool"}])
+
+    def test_invalid_batches(self):
+        for body in ([], {"ids": ["a"]}, [1, 2], ["a"] * (self.app.config['BATCH_MAX_IDS'] + 1)):
+            response = self.client.post('/api/v1/users/batch', json=body)
+            self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/v1/users/batch', json=["a"], query_string={"fields": "password"})
+        self.assertEqual(response.status_code, 400)
+
+class TestResponseCache(ApiTestCase):
+    def test_hits_skip_the_database_until_a_write(self):
+        owner = self.create_user()
+        owner_id, place_id = owner.id, self.create_place(owner).id
+        amenity_id = self.facade.create_amenity({"name": "Wi-Fi"}).id
+        for url in (f'/api/v1/places/{place_id}', '/api/v1/places/', '/api/v1/amenities/'):
+            first = self.client.get(url)
+            response, count = self.count_statements(self.client.get, url)
+            self.assertEqual((response.status_code, count), (200, 0))
+            self.assertEqual(response.data, first.data)
+            self.assertEqual(response.headers["ETag"], first.headers["ETag"])
+            response, count = self.count_statements(self.client.get, url, headers={"If-None-Match": first.headers["ETag"]})
+            self.assertEqual((response.status_code, count), (304, 0))
+        # The query string is part of the key
+        misses = self.facade.response_cache.stats()["misses"]
+        self.client.get('/api/v1/places/', query_string={"limit": 1})
+        self.assertEqual(self.facade.response_cache.stats()["misses"], misses + 1)
+
+        url = f'/api/v1/places/{place_id}'
+        writes = [
+            lambda: self.facade.update_place(place_id, {"title": "Renamed"}),
+            lambda: self.facade.update_user(owner_id, {"first_name": "Jane"}),
+            lambda: self.facade.add_place_amenity(self.facade.get_place(place_id), self.facade.get_amenity(amenity_id)),
+            lambda: self.facade.update_amenity(amenity_id, {"name": "Fiber"}),
+            lambda: self.facade.create_review({"text": "Nice", "rating": 4, "place_id": place_id, "user_id": owner_id}),
+        ]
+        for write in writes:
+            before = self.client.get(url).data
+            write()
+            db.session.remove()
+            self.assertNotEqual(self.client.get(url).data, before)
+        detail = self.client.get(url).json
+        self.assertEqual((detail["title"], detail["owner"]["first_name"]), ("Renamed", "Jane"))
+        self.assertEqual(detail["amenities"][0]["name"], "Fiber")
+
+        self.client.get('/api/v1/places/')
+        self.create_place(self.facade.get_user(owner_id), title="Loft")
+        self.assertEqual(len(self.client.get('/api/v1/places/').json["items"]), 2)
+
+    def test_one_commit_listener_for_all_facades(self):
+        from app.services import HBnBFacade
+        from app.services.cache import ResponseCache
+
+        listeners = len(db.session().dispatch.after_commit)
+        HBnBFacade(response_cache=ResponseCache())
+        self.assertEqual(len(db.session().dispatch.after_commit), listeners)
+
+    def test_credentials_and_streams_are_not_cached(self):
+        self.facade.create_amenity({"name": "Wi-Fi"})
+        token = create_access_token(identity={"id": "someone", "is_admin": False})
+        self.client.get('/api/v1/amenities/', headers={"Authorization": f"Bearer {token}"})
+        self.client.get('/api/v1/amenities/', headers={"Accept": "application/x-ndjson"})
+        self.assertEqual(self.facade.response_cache.stats()["size"], 0)
+
+    def test_byte_bound_ttl_and_tags(self):
+        from app.services.cache import ResponseCache
+
+        now = [0]
+        cache = ResponseCache(maxbytes=10, ttl=30, clock=lambda: now[0])
+        cache.set("a", "A", 4, ("places", "places:1"))
+        cache.set("b", "B", 4, ("places",))
+        cache.get("a")
+        cache.set("c", "C", 4, ("amenities",))
+        self.assertEqual([cache.get(key) for key in "abc"], ["A", None, "C"])
+        cache.set("huge", "H", 11)
+        self.assertIsNone(cache.get("huge"))
+
+        cache.invalidate("places:1")
+        self.assertEqual([cache.get(key) for key in "ac"], [None, "C"])
+        # A value built before an invalidation is not stored
+        epoch = cache.epoch
+        cache.invalidate("places")
+        cache.set("a", "A", 4, ("places",), epoch)
+        self.assertIsNone(cache.get("a"))
+
+        now[0] = 31
+        self.assertIsNone(cache.get("c"))
+        stats = cache.stats()
+        self.assertEqual((stats["evictions"], stats["invalidations"], stats["expirations"], stats["bytes"]), (1, 1, 1, 0))
+
+class TestCompression(ApiTestCase):
+    def test_negotiated_from_accept_encoding_above_the_threshold(self):
+        from app import compression
+
+        self.facade.create_many_amenities([{"name": f"Amenity {i}"} for i in range(100)])
+        identity = self.client.get('/api/v1/amenities/')
+        self.assertNotIn("Content-Encoding", identity.headers)
+        self.assertIn("Accept-Encoding", identity.headers["Vary"])
+
+        with mock.patch.object(compression, "encode", wraps=compression.encode) as encode:
+            for _ in range(3):
+                response = self.client.get('/api/v1/amenities/', headers={"Accept-Encoding": "gzip, deflate"})
+                self.assertEqual(response.headers["Content-Encoding"], "gzip")
+                self.assertEqual(gzip.decompress(response.data), identity.data)
+        # Compressed once, then served from the response cache
+        self.assertEqual(encode.call_count, 1)
+
+        etag = response.headers["ETag"]
+        self.assertEqual(etag, "W/" + identity.headers["ETag"])
+        response = self.client.get('/api/v1/amenities/', headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+        # Uncached responses are compressed too
+        response = self.client.get('/api/v1/amenities/', headers={"Accept-Encoding": "gzip", "Authorization": "x"})
+        self.assertEqual(gzip.decompress(response.data), identity.data)
+
+    def test_small_bodies_and_unknown_encodings_are_sent_as_they_are(self):
+        from app import compression
+
+        amenity_id = self.facade.create_amenity({"name": "Wi-Fi"}).id
+        response = self.client.get(f'/api/v1/amenities/{amenity_id}', headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(response.json["name"], "Wi-Fi")
+
+        self.facade.create_many_amenities([{"name": f"Amenity {i}"} for i in range(100)])
+        expected = "br" if "br" in compression.encodings else None
+        response = self.client.get('/api/v1/amenities/', headers={"Accept-Encoding": "br, gzip;q=0"})
+        self.assertEqual(response.headers.get("Content-Encoding"), expected)
+
+class TestCoalescing(ApiTestCase):
+    def test_concurrent_calls_share_one_computation(self):
+        from app.services.singleflight import SingleFlight
+
+        flight, release, results = SingleFlight(), threading.Event(), []
+        def compute():
+            release.wait(5)
+            return object()
+        def call():
+            results.append(flight.do("place", compute))
+
+        threads = [threading.Thread(target=call) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        while flight.stats()["coalesced"] < 7:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len({id(result) for result, shared in results}), 1)
+        self.assertEqual(sorted(shared for result, shared in results), [False] + [True] * 7)
+        self.assertEqual(flight.stats(), {"calls": 1, "coalesced": 7, "in_flight": 0})
+
+        # Errors are shared too, and the next call runs again
+        def fail():
+            raise ValueError("boom")
+        with self.assertRaises(ValueError):
+            flight.do("place", fail)
+        self.assertEqual(flight.do("place", lambda: 1), (1, False))
+
+    def test_place_detail_goes_through_the_flight(self):
+        from app.api.v1.places import place_detail_flight
+
+        owner = self.create_user()
+        place_id = self.create_place(owner).id
+        admin = self.facade.create_user({"first_name": "Ada", "last_name": "Admin", "email": "admin@example.com",
+                                         "password": "secret", "is_admin": True})
+        calls = place_detail_flight.stats()["calls"]
+        response = self.client.get(f'/api/v1/places/{place_id}')
+        self.assertEqual(response.json["owner"]["id"], owner.id)
+        self.assertIn("ETag", response.headers)
+        stats = self.client.get('/api/v1/admin/stats', headers=self.auth_headers(admin)).json
+        self.assertEqual(stats["place_detail_coalescing"]["calls"], calls + 1)
+
+class TestPlaceSearch(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        owner = self.create_user()
+        self.marseille = self.create_place(owner, title="Marseille", latitude=43.2965, longitude=5.3698).id
+        self.aix = self.create_place(owner, title="Aix", latitude=43.5297, longitude=5.4474).id
+        self.paris = self.create_place(owner, title="Paris", latitude=48.8566, longitude=2.3522).id
+        self.fiji = self.create_place(owner, title="Fiji", latitude=-17.7134, longitude=179.9).id
+
+    def search(self, **query):
+        response = self.client.get('/api/v1/places/search', query_string=query)
+        self.assertEqual(response.status_code, 200)
+        return [i["id"] for i in response.json["items"]]
+
+    def test_radius_sorted_by_distance(self):
+        self.assertEqual(self.search(lat=43.30, lng=5.37, radius_km=50), [self.marseille, self.aix])
+        self.assertEqual(self.search(lat=43.30, lng=5.37, radius_km=50, limit=1), [self.marseille])
+        self.assertEqual(self.search(lat=43.30, lng=5.37, radius_km=1000), [self.marseille, self.aix, self.paris])
+
+    def test_database_ranks_and_limits(self):
+        owner = self.facade.get_user_by_email("john@example.com")
+        flats = [self.create_place(owner, title=f"Flat {i}", latitude=43.30 + i / 100, longitude=5.50).id
+                 for i in range(10)]
+        statements = []
+        listener = lambda conn, cursor, statement, parameters, *args: statements.append((statement, parameters))
+        event.listen(db.engine, "before_cursor_execute", listener)
+        try:
+            self.assertEqual(self.search(lat=43.30, lng=5.50, radius_km=50, limit=3), flats[:3])
+            self.assertEqual(self.search(bbox="5.45,43.3,5.55,43.4", limit=1), flats[5:6])
+        finally:
+            event.remove(db.engine, "before_cursor_execute", listener)
+        searches = [parameters for statement, parameters in statements if "places_rtree" in statement]
+        self.assertEqual(len(searches), 2)
+        self.assertEqual([parameters[-2:] for parameters in searches], [(3, 0), (1, 0)])
+
+    def test_radius_across_antimeridian(self):
+        self.assertEqual(self.search(lat=-17.7, lng=-179.9, radius_km=50), [self.fiji])
+
+    def test_bbox(self):
+        self.assertEqual(self.search(bbox="5.0,43.0,6.0,44.0"), [self.aix, self.marseille])
+        self.assertEqual(self.search(bbox="179.0,-18.0,-179.0,-17.0"), [self.fiji])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.facade.update_place(self.paris, {"latitude": 43.30, "longitude": 5.38})
+        self.assertEqual(self.search(lat=43.30, lng=5.38, radius_km=5), [self.paris, self.marseille])
+        self.facade.delete_place(self.paris)
+        self.assertEqual(self.search(lat=43.30, lng=5.38, radius_km=5), [self.marseille])
+
+    def test_index_does_not_depend_on_rowid(self):
+        # As VACUUM may do to a table without an integer primary key
+        db.session.execute(db.text("UPDATE places SET rowid = rowid + 100"))
+        db.session.commit()
+        self.facade.update_place(self.aix, {"latitude": 43.30, "longitude": 5.38})
+        self.assertEqual(self.search(lat=43.30, lng=5.38, radius_km=5), [self.aix, self.marseille])
+        self.facade.delete_place(self.marseille)
+        self.assertEqual(self.search(lat=43.30, lng=5.38, radius_km=5), [self.aix])
+        self.assertEqual(self.search(lat=48.85, lng=2.35, radius_km=5), [self.paris])
+        self.create_place(self.facade.get_user_by_email("john@example.com"), latitude=48.85, longitude=2.35)
+        self.assertEqual(len(self.search(lat=48.85, lng=2.35, radius_km=5)), 2)
+
+    def test_text_search(self):
+        self.assertEqual(self.search(q="marseille"), [self.marseille])
+        self.assertEqual(self.search(q="Mars"), [self.marseille])
+        self.assertEqual(len(self.search(q="near sea")), 4)
+        self.assertEqual(self.search(q="'\""), [])
+
+        response = self.client.get('/api/v1/places/search', query_string={"q": "marseille"})
+        self.assertIn("[Marseille]", response.json["items"][0]["snippet"])
+
+        self.facade.update_place(self.paris, {"title": "Lutece"})
+        self.assertEqual(self.search(q="lutece"), [self.paris])
+        self.assertEqual(self.search(q="paris"), [])
+        self.facade.delete_place(self.paris)
+        self.assertEqual(self.search(q="lutece"), [])
+
+    def test_text_index_does_not_depend_on_rowid(self):
+        owner = self.facade.get_user_by_email("john@example.com")
+        review = self.facade.create_review({"text": "Amazing bouillabaisse", "rating": 5, "place_id": self.aix,
+                                            "user_id": owner.id})
+        db.session.execute(db.text("UPDATE places SET rowid = rowid + 100"))
+        db.session.execute(db.text("UPDATE reviews SET rowid = rowid + 100"))
+        db.session.commit()
+        self.assertEqual(self.search(q="marseille"), [self.marseille])
+        self.assertEqual(self.search(q="bouillabaisse", reviews="true"), [self.aix])
+        self.facade.update_place(self.paris, {"title": "Lutece"})
+        self.assertEqual(self.search(q="lutece"), [self.paris])
+        self.assertEqual(self.search(q="paris"), [])
+        self.facade.update_review(review.id, {"text": "Amazing aioli"})
+        self.assertEqual(self.search(q="aioli", reviews="true"), [self.aix])
+        self.assertEqual(self.search(q="bouillabaisse", reviews="true"), [])
+
+    def test_text_search_in_reviews(self):
+        owner = self.facade.get_user_by_email("john@example.com")
+        self.facade.create_review({"text": "Amazing bouillabaisse", "rating": 5, "place_id": self.aix, "user_id": owner.id})
+        self.assertEqual(self.search(q="bouillabaisse"), [])
+        self.assertEqual(self.search(q="bouillabaisse", reviews="true"), [self.aix])
+
+    def test_invalid_parameters(self):
+        for query in ({}, {"lat": 43.3, "lng": 5.4}, {"lat": 95, "lng": 5.4, "radius_km": 5},
+                      {"lat": 43.3, "lng": 5.4, "radius_km": 100000}, {"bbox": "1,2,3"}):
+            response = self.client.get('/api/v1/places/search', query_string=query)
+            self.assertEqual(response.status_code, 400)
+
+class TestPasswordHashing(ApiTestCase):
+    def test_login_uses_worker_pool(self):
+        self.create_user()
+        response = self.client.post('/api/v1/auth/login', json={"email": "john@example.com", "password": "secret"})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post('/api/v1/auth/login', json={"email": "john@example.com", "password": "wrong"})
+        self.assertEqual(response.status_code, 401)
+
+        admin = self.facade.create_user({"first_name": "Ada", "last_name": "Admin", "email": "admin@example.com",
+                                         "password": "secret", "is_admin": True})
+        response = self.client.get('/api/v1/admin/stats', headers=self.auth_headers(admin))
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(response.json["password_hashing"]["verify"]["count"], 2)
+
+    def test_full_queue_returns_503(self):
+        held = 0
+        while hasher._slots.acquire(blocking=False):
+            held += 1
+        try:
+            response = self.client.post('/api/v1/users/', json={"first_name": "John", "last_name": "Doe",
+                                                                 "email": "john@example.com", "password": "secret"})
+        finally:
+            for _ in range(held):
+                hasher._slots.release()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["Retry-After"], "1")
+        self.assertIsNone(self.facade.get_user_by_email("john@example.com"))
+
+    def test_full_queue_on_password_change_returns_503(self):
+        admin = self.facade.create_user({"first_name": "Ada", "last_name": "Admin", "email": "admin@example.com",
+                                         "password": "secret", "is_admin": True})
+        user_id, headers = self.create_user().id, self.auth_headers(admin)
+        held = 0
+        while hasher._slots.acquire(blocking=False):
+            held += 1
+        try:
+            response = self.client.put(f'/api/v1/admin/users/{user_id}', json={"password": "changed"}, headers=headers)
+        finally:
+            for _ in range(held):
+                hasher._slots.release()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["Retry-After"], "1")
+
+class TestEntityCache(ApiTestCase):
+    def test_read_through_and_invalidation(self):
+        user_id = self.create_user().id
+        db.session.remove()
+
+        user, count = self.count_statements(self.facade.get_user, user_id)
+        self.assertEqual((user.first_name, count), ("John", 1))
+        db.session.remove()
+
+        user, count = self.count_statements(self.facade.get_user, user_id)
+        self.assertEqual((user.first_name, count), ("John", 0))
+        self.assertEqual(user.places.count(), 0)
+        db.session.remove()
+
+        self.facade.update_user(user_id, {"first_name": "Johnny"})
+        db.session.remove()
+        self.assertEqual(self.facade.get_user(user_id).first_name, "Johnny")
+
+    def test_uncommitted_and_racing_reads_are_not_kept(self):
+        user_id = self.create_user().id
+        key = f"users:{user_id}"
+        db.session.remove()
+        with self.facade.transaction():
+            self.facade.get_user(user_id)
+        self.assertIsNone(self.facade.cache.get(key))
+        db.session.remove()
+
+        # A writer invalidates while the row is loading
+        get = self.facade.user_repo.get
+        def racing_get(obj_id):
+            obj = get(obj_id)
+            self.facade._invalidate(self.facade.user_repo, obj_id)
+            return obj
+        with mock.patch.object(self.facade.user_repo, "get", racing_get):
+            self.facade.get_user(user_id)
+        self.assertIsNone(self.facade.cache.get(key))
+        db.session.remove()
+
+        # A copy cached by another request before the commit is dropped by it
+        with self.facade.transaction():
+            self.facade.update_user(user_id, {"first_name": "Jim"})
+            self.facade.cache.set(key, "stale")
+        self.assertIsNone(self.facade.cache.get(key))
+        db.session.remove()
+        self.assertEqual(self.facade.get_user(user_id).first_name, "Jim")
+        self.assertIsNotNone(self.facade.cache.get(key))
+
+    def test_lru_and_ttl(self):
+        now = [0]
+        cache = LRUCache(maxsize=2, ttl=10, clock=lambda: now[0])
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        now[0] = 11
+        self.assertIsNone(cache.get("a"))
+
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["evictions"], stats["expirations"]), (1, 2, 1, 1))
+
+class TestBulkCreate(ApiTestCase):
+    def test_places_bulk_reports_each_item(self):
+        owner = self.create_user()
+        other = self.create_user("jane@example.com")
+        place = {"title": "Flat", "description": "Nice", "price": 50.0, "latitude": 1.0, "longitude": 2.0}
+        items = [
+            dict(place, owner=owner.id),
+            dict(place, owner=owner.id, price=-1.0),
+            dict(place, owner=other.id),
+            {"title": "Incomplete", "owner": owner.id},
+            "not an object",
+            dict(place, owner=owner.id, title="Second"),
+        ]
+
+        response, count = self.count_statements(
+            self.client.post, '/api/v1/places/bulk', json=items, headers=self.auth_headers(owner))
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual((response.json["created"], response.json["failed"]), (2, 4))
+        results = response.json["results"]
+        self.assertEqual([i["index"] for i in results], list(range(6)))
+        self.assertIn("id", results[0])
+        self.assertEqual(results[1]["error"], "Price must be positive")
+        self.assertEqual(results[2]["error"], "Unauthorized action.")
+        self.assertEqual(results[3]["error"], "Missing field 'description'")
+        self.assertEqual(self.facade.get_place(results[5]["id"]).title, "Second")
+        # One lookup for the owners and a single batched INSERT
+        self.assertLessEqual(count, 4)
+
+    def test_reviews_bulk(self):
+        owner = self.create_user()
+        place = self.create_place(owner)
+        items = [{"text": f"Review {i}", "rating": 1 + i % 5, "user_id": owner.id, "place_id": place.id} for i in range(25)]
+        self.app.config['BULK_BATCH_SIZE'] = 10
+        try:
+            response = self.client.post('/api/v1/reviews/bulk', json=items, headers=self.auth_headers(owner))
+        finally:
+            self.app.config['BULK_BATCH_SIZE'] = TestingConfig.BULK_BATCH_SIZE
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(place.reviews.count(), 25)
+
+    def test_invalid_items_fail_alone(self):
+        owner = self.create_user()
+        place = self.create_place(owner)
+        review = {"text": "Nice", "rating": 4, "user_id": owner.id, "place_id": place.id}
+        items = [
+            {key: value for key, value in review.items() if key != "text"},
+            {key: value for key, value in review.items() if key != "rating"},
+            dict(review, rating=4.5),
+            dict(review, text=None),
+            review,
+        ]
+        response = self.client.post('/api/v1/reviews/bulk', json=items, headers=self.auth_headers(owner))
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result.get("error") for result in response.json["results"]], [
+            "Missing field 'text'", "Missing field 'rating'", "Rating must be an integer between 1 and 5",
+            "Missing field 'text'", None])
+        self.assertEqual((place.reviews.count(), self.facade.get_place(place.id).review_count), (1, 1))
+
+        item = {"title": "Flat", "description": None, "price": 50.0, "latitude": 1.0, "longitude": 2.0, "owner": owner.id}
+        response = self.client.post('/api/v1/places/bulk', json=[item, dict(item, description="Nice")],
+                                    headers=self.auth_headers(owner))
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.json["results"][0]["error"], "Missing field 'description'")
+        self.assertIn("id", response.json["results"][1])
+
+    def test_empty_bulk(self):
+        owner = self.create_user()
+        response = self.client.post('/api/v1/places/bulk', json=[], headers=self.auth_headers(owner))
+        self.assertEqual(response.status_code, 400)
+
+class TestRatingAggregates(ApiTestCase):
+    def aggregates(self, place_id):
+        db.session.remove()
+        place = self.facade.get_place(place_id)
+        return place.review_count, place.average_rating, place.rating_histogram
+
+    def test_incremental_updates(self):
+        owner = self.create_user()
+        first = self.create_place(owner).id
+        second = self.create_place(owner).id
+        review = self.facade.create_review({"text": "Good", "rating": 4, "place_id": first, "user_id": owner.id})
+        review_id = review.id
+        self.facade.create_many_reviews([{"text": "Bad", "rating": 1, "place_id": first, "user_id": owner.id},
+                                         {"text": "Top", "rating": 5, "place_id": second, "user_id": owner.id}])
+        self.assertEqual(self.aggregates(first), (2, 2.5, {"1": 1, "2": 0, "3": 0, "4": 1, "5": 0}))
+
+        self.facade.update_review(review_id, {"rating": 2})
+        self.assertEqual(self.aggregates(first), (2, 1.5, {"1": 1, "2": 1, "3": 0, "4": 0, "5": 0}))
+
+        self.facade.update_review(review_id, {"place_id": second})
+        self.assertEqual(self.aggregates(first)[:2], (1, 1.0))
+        self.assertEqual(self.aggregates(second)[:2], (2, 3.5))
+
+        with self.assertRaises(ValueError):
+            self.facade.update_review(review_id, {"rating": 9})
+        db.session.rollback()
+        self.assertEqual(self.aggregates(second)[:2], (2, 3.5))
+
+        self.facade.delete_review(review_id)
+        self.assertEqual(self.aggregates(second), (1, 5.0, {"1": 0, "2": 0, "3": 0, "4": 0, "5": 1}))
+
+        response = self.client.get('/api/v1/places/', query_string={"sort": "-rating"})
+        self.assertEqual([i["id"] for i in response.json["items"]], [second, first])
+        self.assertEqual(response.json["items"][0]["average_rating"], 5.0)
+        response = self.client.get(f'/api/v1/places/{second}')
+        self.assertEqual(response.json["review_count"], 1)
+
+    def test_invalid_ratings_leave_the_aggregates(self):
+        owner = self.create_user()
+        place_id = self.create_place(owner).id
+        for rating in (4.5, True, "4"):
+            with self.assertRaises(ValueError):
+                self.facade.create_review({"text": "Odd", "rating": rating, "place_id": place_id, "user_id": owner.id})
+            db.session.rollback()
+        with self.assertRaises(ValueError):
+            self.facade.place_repo.apply_rating_deltas(place_id, {4.5: 1})
+        self.assertEqual(self.aggregates(place_id)[:2], (0, None))
+
+    def test_sort_pages(self):
+        owner = self.create_user()
+        places = [self.create_place(owner).id for _ in range(5)]
+        for rating, place_id in enumerate(places, 1):
+            self.facade.create_review({"text": "Ok", "rating": rating, "place_id": place_id, "user_id": owner.id})
+
+        seen, cursor = [], None
+        while True:
+            query = {"limit": 2, "sort": "-rating"}
+            if cursor:
+                query["cursor"] = cursor
+            response = self.client.get('/api/v1/places/', query_string=query)
+            seen += [i["id"] for i in response.json["items"]]
+            cursor = response.json["next_cursor"]
+            if not cursor:
+                break
+        self.assertEqual(seen, places[::-1])
+
+        response = self.client.get('/api/v1/places/', query_string={"sort": "title"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_check_ratings_command(self):
+        owner = self.create_user()
+        place_id = self.create_place(owner).id
+        self.facade.create_review({"text": "Ok", "rating": 3, "place_id": place_id, "user_id": owner.id})
+        runner = self.app.test_cli_runner()
+        self.assertEqual(runner.invoke(args=["check-ratings"]).exit_code, 0)
+
+        self.facade.place_repo.set_rating_aggregates(place_id, 7, 7, {"1": 7, "2": 0, "3": 0, "4": 0, "5": 0})
+        db.session.commit()
+        result = runner.invoke(args=["check-ratings"])
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn(place_id, result.output)
+
+        self.assertEqual(runner.invoke(args=["check-ratings", "--fix"]).exit_code, 0)
+        self.assertEqual(runner.invoke(args=["check-ratings"]).exit_code, 0)
+        self.assertEqual(self.aggregates(place_id)[:2], (1, 3.0))
+
+class TestSchema(ApiTestCase):
+    def test_upgrade_creates_missing_indexes(self):
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql("DROP INDEX ix_reviews_user_id")
+            connection.exec_driver_sql("DROP INDEX ix_place_amenities_amenity_id")
+
+        runner = self.app.test_cli_runner()
+        result = runner.invoke(args=["upgrade-db", "--dry-run"])
+        self.assertIn("missing index ix_reviews_user_id", result.output)
+        result = runner.invoke(args=["upgrade-db"])
+        self.assertIn("created index ix_place_amenities_amenity_id", result.output)
+        self.assertIn("2 schema item(s) created", result.output)
+        self.assertIn("0 schema item(s)", runner.invoke(args=["upgrade-db"]).output)
+
+        plan = db.session.execute(db.text("EXPLAIN QUERY PLAN SELECT * FROM reviews WHERE user_id = 'x'")).fetchall()
+        self.assertIn("ix_reviews_user_id", plan[0][3])
+
+    BASELINE_DDL = [
+        "CREATE TABLE users (first_name VARCHAR(50) NOT NULL, last_name VARCHAR(50) NOT NULL, "
+        "email VARCHAR(120) NOT NULL UNIQUE, password VARCHAR(128) NOT NULL, is_admin BOOLEAN, "
+        "id VARCHAR(36) NOT NULL PRIMARY KEY, created_at DATETIME, updated_at DATETIME)",
+        "CREATE TABLE amenities (name VARCHAR(50) NOT NULL, id VARCHAR(36) NOT NULL PRIMARY KEY, "
+        "created_at DATETIME, updated_at DATETIME)",
+        "CREATE TABLE places (title VARCHAR(100) NOT NULL, description TEXT NOT NULL, price FLOAT NOT NULL, "
+        "latitude FLOAT NOT NULL, longitude FLOAT NOT NULL, owner VARCHAR(36) NOT NULL REFERENCES users (id), "
+        "id VARCHAR(36) NOT NULL PRIMARY KEY, created_at DATETIME, updated_at DATETIME)",
+        "CREATE TABLE place_amenities (place_id VARCHAR(36) NOT NULL REFERENCES places (id), "
+        "amenity_id VARCHAR(36) NOT NULL REFERENCES amenities (id), PRIMARY KEY (place_id, amenity_id))",
+        "CREATE TABLE reviews (text TEXT NOT NULL, rating INTEGER NOT NULL, "
+        "place_id VARCHAR(36) NOT NULL REFERENCES places (id), user_id VARCHAR(36) NOT NULL REFERENCES users (id), "
+        "id VARCHAR(36) NOT NULL PRIMARY KEY, created_at DATETIME, updated_at DATETIME)",
+        "INSERT INTO users VALUES ('John', 'Doe', 'john@example.com', 'x', 0, 'u1', '2024-01-01', '2024-01-01')",
+        "INSERT INTO places VALUES ('Old port flat', 'Near the sea', 80, 43.29, 5.37, 'u1', 'p1', "
+        "'2024-01-01', '2024-01-01')",
+        "INSERT INTO reviews VALUES ('Great', 5, 'p1', 'u1', 'r1', '2024-01-02', '2024-01-02')",
+        "INSERT INTO reviews VALUES ('Noisy', 2, 'p1', 'u1', 'r2', '2024-01-03', '2024-01-03')",
+    ]
+
+    def test_upgrade_from_the_baseline_schema(self):
+        db.drop_all()
+        with db.engine.begin() as connection:
+            for statement in self.BASELINE_DDL:
+                connection.exec_driver_sql(statement)
+            # An index keyed on rowid, rebuilt on search_rowid
+            connection.exec_driver_sql("CREATE VIRTUAL TABLE places_rtree USING rtree(id, min_lat, max_lat, "
+                                       "min_lng, max_lng, +place_id)")
+            connection.exec_driver_sql("CREATE TRIGGER places_rtree_delete AFTER DELETE ON places BEGIN "
+                                       "DELETE FROM places_rtree WHERE id = old.rowid; END")
+
+        runner = self.app.test_cli_runner()
+        result = runner.invoke(args=["upgrade-db"])
+        self.assertEqual(result.exit_code, 0, result.output)
+        trigger = db.session.execute(db.text("SELECT sql FROM sqlite_master WHERE name = 'places_rtree_delete'"))
+        self.assertIn("old.search_rowid", trigger.scalar())
+        for created in ("column places.average_rating", "column places.search_rowid", "column reviews.search_rowid",
+                        "index ix_places_average_rating_id",
+                        "virtual table places_rtree", "virtual table places_fts", "virtual table reviews_fts"):
+            self.assertIn(f"created {created}", result.output)
+        self.assertIn("1 place(s) with rating aggregates recomputed", result.output)
+        self.assertIn("0 schema item(s)", runner.invoke(args=["upgrade-db"]).output)
+
+        place = self.client.get('/api/v1/places/p1').json
+        self.assertEqual((place["review_count"], place["average_rating"]), (2, 3.5))
+        for query in ({"q": "port"}, {"q": "noisy", "reviews": "true"}, {"lat": 43.3, "lng": 5.37, "radius_km": 5}):
+            response = self.client.get('/api/v1/places/search', query_string=query)
+            self.assertEqual([i["id"] for i in response.json["items"]], ["p1"], query)
+        # Kept in sync from now on
+        self.create_place(self.facade.get_user("u1"), title="Seaside loft")
+        self.assertEqual(len(self.client.get('/api/v1/places/search', query_string={"q": "loft"}).json["items"]), 1)
+
+    def test_upgrade_skips_columns_it_cannot_add(self):
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql("DROP INDEX ix_places_price_id")
+            connection.exec_driver_sql("ALTER TABLE places DROP COLUMN price")
+        result = self.app.test_cli_runner().invoke(args=["upgrade-db"])
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn("skipped unsupported column places.price", result.output)
+        self.assertIn("skipped unsupported index ix_places_price_id", result.output)
+
+    def test_index_advisor_lists_full_scans(self):
+        captured = io.StringIO()
+        instrumentation.capture = captured
+        try:
+            owner = self.create_user()
+            self.client.get(f'/api/v1/users/{owner.id}')
+            self.client.get('/api/v1/places/')
+            db.session.execute(db.select(db.text("id")).select_from(db.text("reviews")).where(db.text("text = :text")),
+                               {"text": "Nice"})
+        finally:
+            instrumentation.capture = None
+
+        with tempfile.TemporaryDirectory() as directory:
+            workload = os.path.join(directory, "workload.jsonl")
+            with open(workload, "w") as file:
+                file.write(captured.getvalue())
+            result = self.app.test_cli_runner().invoke(args=["index-advisor", workload])
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn("1 statement(s) with full scans", result.output)
+        self.assertIn("1x <no request>: SCAN reviews", result.output)
+        self.assertIn("WHERE text = ?", result.output)
+
+class TestUnitOfWork(ApiTestCase):
+    def count_commits(self, func, *args, **kwargs):
+        commits = []
+        listener = lambda connection: commits.append(connection)
+        event.listen(db.engine, "commit", listener)
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            event.remove(db.engine, "commit", listener)
+        return result, len(commits)
+
+    def test_delete_place_commits_once(self):
+        owner = self.create_user()
+        place = self.create_place(owner)
+        for i in range(3):
+            reviewer = self.create_user(f"reviewer{i}@example.com")
+            self.facade.create_review({"text": "Nice", "rating": 4, "place_id": place.id, "user_id": reviewer.id})
+        admin = self.facade.create_user({"first_name": "Ada", "last_name": "Admin", "email": "admin@example.com",
+                                         "password": "secret", "is_admin": True})
+        place_id, headers = place.id, self.auth_headers(admin)
+
+        response, commits = self.count_commits(self.client.delete, f'/api/v1/places/{place_id}', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(commits, 1)
+        self.assertIsNone(self.facade.get_place(place_id))
+        self.assertEqual(self.facade.get_all_reviews(), [])
+
+    def test_rolls_back_as_a_whole(self):
+        owner = self.create_user()
+        place_id = self.create_place(owner).id
+        with self.assertRaises(RuntimeError):
+            with self.facade.transaction():
+                user = self.facade.create_user({"first_name": "Jane", "last_name": "Doe",
+                                                "email": "jane@example.com", "password": "secret"})
+                # Flushed so that it has an id, but not committed
+                self.assertIsNotNone(user.id)
+                with self.facade.transaction():
+                    self.facade.create_review({"text": "Nice", "rating": 5, "place_id": place_id, "user_id": user.id})
+                raise RuntimeError
+        self.assertIsNone(self.facade.get_user_by_email("jane@example.com"))
+        self.assertEqual(self.facade.get_all_reviews(), [])
+        self.assertEqual(self.facade.get_place(place_id).review_count, 0)
+
+    def test_invalid_update_leaves_nothing_behind(self):
+        owner = self.create_user()
+        place = self.create_place(owner)
+        review = self.facade.create_review({"text": "Nice", "rating": 4, "place_id": place.id, "user_id": owner.id})
+        with self.assertRaises(ValueError):
+            self.facade.update_review(review.id, {"text": "Changed", "rating": 9})
+        self.assertEqual(self.facade.get_review(review.id).text, "Nice")
+
+class TestCascadeDelete(ApiTestCase):
+    def test_deletes_reviews_and_links_but_keeps_amenities(self):
+        owner = self.create_user()
+        place = self.create_place(owner)
+        other = self.create_place(owner, title="Other")
+        wifi = self.facade.create_amenity({"name": "Wi-Fi"})
+        place.amenities.append(wifi)
+        other.amenities.append(wifi)
+        db.session.commit()
+        reviewers = self.facade.create_many_users([
+            {"first_name": "R", "last_name": "V", "email": f"r{i}@example.com", "password": "secret"} for i in range(50)])
+        self.facade.create_many_reviews([{"text": "Nice", "rating": 4, "place_id": place.id, "user_id": user.id}
+                                         for user, error in reviewers])
+        kept = self.facade.create_review({"text": "Fine", "rating": 3, "place_id": other.id, "user_id": owner.id})
+        place_id, wifi_id, kept_id = place.id, wifi.id, kept.id
+
+        response, count = self.count_statements(self.client.delete, f'/api/v1/places/{place_id}',
+                                                headers=self.auth_headers(owner))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["deleted"], {"reviews": 50, "amenity_links": 1})
+        # Lookup, then one DELETE per table, whatever the number of reviews
+        self.assertLessEqual(count, 4)
+
+        self.assertIsNone(self.facade.get_place(place_id))
+        self.assertEqual([r.id for r in self.facade.get_all_reviews()], [kept_id])
+        self.assertIsNotNone(self.facade.get_amenity(wifi_id))
+        self.assertEqual(self.client.get(f'/api/v1/places/{place_id}').status_code, 404)
+        self.assertEqual(self.facade.delete_place_cascade(place_id), None)
+
+    def test_with_foreign_keys_enforced(self):
+        owner = self.create_user()
+        place = self.create_place(owner)
+        self.facade.add_place_amenity(place, self.facade.create_amenity({"name": "Wi-Fi"}))
+        self.facade.create_review({"text": "Nice", "rating": 4, "place_id": place.id, "user_id": owner.id})
+        place_id = place.id
+        db.session.commit()
+        # The in-memory database has a single connection, the pragma sticks to it
+        self.set_foreign_keys("ON")
+        try:
+            self.assertEqual(self.facade.delete_place_cascade(place_id), {"reviews": 1, "amenity_links": 1})
+        finally:
+            self.set_foreign_keys("OFF")
+        self.assertIsNone(self.facade.get_place(place_id))
+
+    @staticmethod
+    def set_foreign_keys(value):
+        db.session.commit()
+        with db.engine.connect() as connection:
+            connection.exec_driver_sql(f"PRAGMA foreign_keys = {value}")
+            assert connection.exec_driver_sql("PRAGMA foreign_keys").scalar() == (value == "ON")
+
+    def test_only_owner_or_admin(self):
+        place_id = self.create_place(self.create_user()).id
+        response = self.client.delete(f'/api/v1/places/{place_id}',
+                                      headers=self.auth_headers(self.create_user("eve@example.com")))
+        self.assertEqual(response.status_code, 403)
+        self.assertIsNotNone(self.facade.get_place(place_id))
+
+class TestReadRouting(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def make_app(self, **settings):
+        from flask import Flask
+        from flask_sqlalchemy import SQLAlchemy
+        from app.database import RoutingSession, apply_sqlite_pragmas, configure_read_binds
+        from config import ProductionConfig
+
+        app = Flask(__name__)
+        app.config.from_object(ProductionConfig)
+        app.config.update({"SQLALCHEMY_DATABASE_URI": self.url("primary.db"), "DATABASE_REPLICAS": [], **settings})
+        database = SQLAlchemy(session_options={"class_": RoutingSession})
+        configure_read_binds(app)
+        database.init_app(app)
+        apply_sqlite_pragmas(app, database)
+
+        class Item(database.Model):
+            id = database.Column(database.Integer, primary_key=True)
+            name = database.Column(database.String(20))
+
+        @app.route("/", methods=["GET", "POST"])
+        def items():
+            if request.method == "POST":
+                database.session.add(Item(name="new"))
+                database.session.commit()
+            return {"names": [i.name for i in database.session.scalars(database.select(Item).order_by(Item.id))],
+                    "query_only": database.session.execute(database.text("PRAGMA query_only")).scalar()}
+
+        with app.app_context():
+            database.create_all()
+            database.session.add(Item(name="primary"))
+            database.session.commit()
+
+        def dispose():
+            with app.app_context():
+                for engine in database.engines.values():
+                    engine.dispose()
+        self.addCleanup(dispose)
+        return app, database
+
+    def url(self, name):
+        return f"sqlite:///{os.path.join(self.directory.name, name)}"
+
+    def make_replica(self, name, *items):
+        import sqlite3
+        with sqlite3.connect(os.path.join(self.directory.name, name)) as connection:
+            connection.execute("CREATE TABLE item (id INTEGER PRIMARY KEY, name VARCHAR(20))")
+            connection.executemany("INSERT INTO item (name) VALUES (?)", [(item,) for item in items])
+        return self.url(name)
+
+    def test_production_pragmas_and_read_pool(self):
+        app, database = self.make_app()
+        with app.app_context():
+            pragmas = {name: database.session.execute(database.text(f"PRAGMA {name}")).scalar()
+                       for name in ("journal_mode", "synchronous", "busy_timeout")}
+        # synchronous NORMAL is 1
+        self.assertEqual(pragmas, {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 5000})
+        self.assertEqual(app.test_client().get("/").json, {"names": ["primary"], "query_only": 1})
+
+    def test_reads_go_to_replicas_until_the_session_writes(self):
+        app, database = self.make_app(DATABASE_REPLICAS=[self.make_replica("replica.db", "replica")])
+        client = app.test_client()
+        self.assertEqual(client.get("/").json, {"names": ["replica"], "query_only": 1})
+        self.assertEqual(client.post("/").json, {"names": ["primary", "new"], "query_only": 0})
+        self.assertEqual(client.get("/").json["names"], ["replica"])
+
+    def test_failed_replica_falls_back_to_primary(self):
+        app, database = self.make_app(DATABASE_REPLICAS=[self.url("missing.db")])
+        client = app.test_client()
+        with self.assertLogs(app.logger, level="WARNING") as logs:
+            self.assertEqual(client.get("/").json["names"], ["primary"])
+        self.assertIn("falling back to the primary", logs.output[0])
+        # Skipped while failed, no second warning
+        with self.assertNoLogs(app.logger, level="WARNING"):
+            self.assertEqual(client.get("/").json["names"], ["primary"])
+
+class TestBenchmarks(ApiTestCase):
+    def test_run_and_compare(self):
+        from benchmarks import compare, run_benchmark
+
+        # The statement counts measure the database path, not the response cache
+        with mock.patch.object(self.facade, "response_cache", None):
+            report = run_benchmark(self.app, users=5, places=10, reviews=20, amenities=4, requests=200, warmup=0)
+        self.assertEqual(report["summary"]["requests"], 200)
+        self.assertEqual(report["summary"]["errors"], 0)
+        self.assertEqual({name.split(".")[0] for name in report["operations"]},
+                         {"users", "auth", "amenities", "places", "reviews"})
+        self.assertEqual(report["operations"]["places.get"]["statements_per_request"], 4)
+        self.assertEqual(compare(report, report), [])
+
+        from benchmarks.__main__ import main
+        for weight, error in (("places.gets=3", "Unknown operation 'places.gets', expected one of users.list, users.get"),
+                              ("places.get=-1", "must not be negative"), ("places.get", "Expected name=weight")):
+            with self.assertRaises(SystemExit), mock.patch("sys.stderr", io.StringIO()) as stderr:
+                main(["run", "--weight", weight])
+            self.assertIn(error, stderr.getvalue())
+
+        slower = {**report, "summary": {**report["summary"], "p95_ms": 2 * report["summary"]["p95_ms"]}}
+        self.assertEqual([(r["section"], r["metric"]) for r in compare(report, slower)], [("summary", "p95_ms")])
+
+if __name__ == '__main__':
+    unittest.main()